@@ -0,0 +1,256 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+"""
+The benchmark case of each component: its args, its supporting data and the data models it runs on.
+
+The OpenAI calls are stubbed: while a case runs, the OpenAI functions imported by the component
+module (completions, chat completions, embeddings, sync and async) return canned responses without
+network, and the embeddings are the deterministic `fake_embedding` of the text. The components are
+timed on their own work only.
+"""
+
+import contextlib
+import os
+from dataclasses import dataclass, field
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, Iterator, List, Optional
+from unittest import mock
+
+from benchmarks.synthetic import fake_embedding, synthetic_bank, write_bank
+
+# Judges parse the score and explanation lines
+_COMPLETION_TEXT = "SCORE: 4\nEXPLANATION: synthetic verdict"
+_USAGE = {"prompt_tokens": 100, "completion_tokens": 20, "total_tokens": 120}
+
+_INSTRUCTIONS = (
+    "Rate the completion from 1 to 5.\nPrompt: {prompt}\nExpected output: {expected_output}\n"
+    "Completion: {completion}\nSCORE:\nEXPLANATION:\n"
+)
+
+# The chat judge splits its instructions into "## Message:<role>>><content>" messages
+_CHAT_INSTRUCTIONS = (
+    "## Message:system>>Rate the completion from 1 to 5, answer with SCORE: and EXPLANATION: lines."
+    "## Message:user>>Prompt: {prompt}\nExpected output: {expected_output}\nCompletion: {completion}"
+)
+
+_DATABASE_SCRIPT = "\n".join(
+    [
+        *(
+            f"CREATE TABLE {table} (id INTEGER PRIMARY KEY, name TEXT, price REAL, category TEXT);"
+            for table in ("customers", "orders", "products", "suppliers")
+        ),
+        *(
+            f"INSERT INTO {table} (name, price, category) "
+            f"VALUES ('item {i}', {i * 7 % 500}, 'category {i % 9}');"
+            for table in ("customers", "orders", "products", "suppliers")
+            for i in range(200)
+        ),
+    ]
+)
+
+_PYTHON_TEMPLATE = (
+    "# Generate python code for the request\n{context}\n\n{completion_pairs}\n\n{session}\n\n{user_nl}\n"
+)
+
+
+@dataclass
+class BenchmarkCase:
+    """
+    Args:
+        - component: The component module, e.g. components.evaluators.rouge
+        - kind: "component", "reader" or "writer"
+        - stage: The stage of the chain the data models are prepared for, see `benchmarks.synthetic.STAGES`
+        - flavor: The language of the expected outputs and completions, see `benchmarks.synthetic.FLAVORS`
+        - args: The component args
+        - supporting_data: Builds the supporting data configs from the work directory and the bank size
+        - bank: The kind of embedding bank the case runs against ("few_shot" or "context"), timed per bank size
+        - file_format: The format of the data file of a reader
+    """
+
+    component: str
+    kind: str = "component"
+    stage: str = "raw"
+    flavor: str = "text"
+    args: Dict[str, Any] = field(default_factory=dict)
+    supporting_data: Optional[Callable[[str, Optional[int], int], Dict[str, Dict[str, Any]]]] = None
+    bank: Optional[str] = None
+    file_format: Optional[str] = None
+
+    @property
+    def name(self) -> str:
+        return self.component.rsplit(".", 2)[-2] + "." + self.component.rsplit(".", 1)[-1]
+
+
+def _text_file(
+    name: str, contents: str, file_name: Optional[str] = None
+) -> Callable[[str, Optional[int], int], Dict[str, Dict[str, Any]]]:
+    """Supporting data from a text file written to the work directory"""
+
+    def build(workdir: str, bank_size: Optional[int], dims: int) -> Dict[str, Dict[str, Any]]:
+        path = os.path.join(workdir, file_name or f"{name}.txt")
+        if not os.path.exists(path):
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(contents)
+        return {name: {"file_path": path}}
+
+    return build
+
+
+def _bank_file(name: str, kind: str) -> Callable[[str, Optional[int], int], Dict[str, Dict[str, Any]]]:
+    """Supporting data from a synthetic bank, generated once per size and dimension"""
+
+    def build(workdir: str, bank_size: Optional[int], dims: int) -> Dict[str, Dict[str, Any]]:
+        path = os.path.join(workdir, f"{kind}-{bank_size}x{dims}.pkl")
+        if not os.path.exists(path):
+            write_bank(path, synthetic_bank(bank_size, kind, dims))
+        return {name: {"file_path": path}}
+
+    return build
+
+
+CASES: List[BenchmarkCase] = [
+    # Pre-processors
+    BenchmarkCase(
+        "components.pre_processors.few_shot_embedding",
+        args={"count": 3},
+        supporting_data=_bank_file("few_shot_file", "few_shot"),
+        bank="few_shot",
+    ),
+    BenchmarkCase(
+        "components.pre_processors.dynamic_context_embedding",
+        args={"count": 3},
+        supporting_data=_bank_file("context_file", "context"),
+        bank="context",
+    ),
+    BenchmarkCase("components.pre_processors.session_selector", args={"count": 3}),
+    BenchmarkCase("components.pre_processors.static_context", args={"static_context": "Tables: customers, orders"}),
+    BenchmarkCase(
+        "components.pre_processors.static_context_from_file",
+        supporting_data=_text_file("static_context_file", "Tables: customers(id, name), orders(id, price)\n"),
+    ),
+    BenchmarkCase("components.pre_processors.static_import", args={"import_statement": "import pandas as pd"}),
+    # Stitchers
+    BenchmarkCase("components.stitchers.generic", stage="pre_processed"),
+    BenchmarkCase("components.stitchers.openai_chat_completions", stage="pre_processed"),
+    BenchmarkCase("components.stitchers.python", stage="pre_processed", flavor="python"),
+    BenchmarkCase(
+        "components.stitchers.python_template",
+        stage="pre_processed",
+        flavor="python",
+        args={"template": _PYTHON_TEMPLATE, "condense_blank_lines": True},
+    ),
+    BenchmarkCase("components.stitchers.sql", stage="pre_processed", flavor="sql"),
+    # Model callers, with the OpenAI calls stubbed
+    BenchmarkCase("components.model_callers.openai", stage="stitched", args={"engine": "benchmark"}),
+    BenchmarkCase(
+        "components.model_callers.openai_chat_completions", stage="stitched_chat", args={"engine": "benchmark"}
+    ),
+    # Post-processors
+    BenchmarkCase("components.post_processors.first_completion", stage="completed"),
+    # Evaluators
+    BenchmarkCase("components.evaluators.bleu", stage="completed"),
+    BenchmarkCase("components.evaluators.exact_match", stage="completed"),
+    BenchmarkCase("components.evaluators.fuzzy", stage="completed"),
+    BenchmarkCase("components.evaluators.rouge", stage="completed", args={"modes": ["rouge1", "rougeL"]}),
+    BenchmarkCase("components.evaluators.semantic_similarity", stage="completed"),
+    BenchmarkCase(
+        "components.evaluators.llm_eval",
+        stage="completed",
+        args={"engine": "benchmark"},
+        supporting_data=_text_file("static_instr_file", _INSTRUCTIONS),
+    ),
+    BenchmarkCase(
+        "components.evaluators.llm_chat_eval",
+        stage="completed",
+        args={"engine": "benchmark"},
+        supporting_data=_text_file("static_instr_file", _CHAT_INSTRUCTIONS, "static_chat_instr_file.txt"),
+    ),
+    BenchmarkCase("components.evaluators.kql_syntax", stage="completed", flavor="kql"),
+    BenchmarkCase("components.evaluators.sql_syntax", stage="completed", flavor="sql"),
+    BenchmarkCase(
+        "components.evaluators.sql_execution",
+        stage="completed",
+        flavor="sql",
+        supporting_data=_text_file("database_script", _DATABASE_SCRIPT),
+    ),
+    BenchmarkCase("components.evaluators.python_execution", stage="completed", flavor="python", args={"workers": 2}),
+    # Readers, timed on a data file of the records
+    BenchmarkCase("components.readers.jsonl", kind="reader", file_format="jsonl"),
+    BenchmarkCase("components.readers.csv", kind="reader", file_format="csv"),
+    BenchmarkCase("components.readers.xml", kind="reader", file_format="xml"),
+    # Writers, timed on completed and evaluated data models
+    BenchmarkCase("components.writers.jsonl", kind="writer", stage="completed"),
+    BenchmarkCase("components.writers.parquet", kind="writer", stage="completed"),
+    BenchmarkCase("components.writers.sqlite", kind="writer", stage="completed"),
+]
+
+
+def _completion(choices: int = 1) -> Any:
+    return SimpleNamespace(
+        choices=[
+            SimpleNamespace(text=_COMPLETION_TEXT, message=SimpleNamespace(content=_COMPLETION_TEXT))
+            for _ in range(choices)
+        ],
+        usage=dict(_USAGE),
+    )
+
+
+def _openai_stubs(dims: int) -> Dict[str, Callable]:
+    """Stubs of the OpenAI functions the components import, by name"""
+
+    def completion(*args, n: int = 1, **kwargs):
+        return _completion(n)
+
+    async def completion_async(*args, n: int = 1, **kwargs):
+        return _completion(n)
+
+    def embedding(prompt: str = "", *args, **kwargs):
+        return fake_embedding(prompt or kwargs.get("input", ""), dims)
+
+    async def embedding_async(prompt: str = "", *args, **kwargs):
+        return embedding(prompt, *args, **kwargs)
+
+    def embeddings(texts: List[str], *args, **kwargs):
+        return [fake_embedding(text, dims) for text in texts]
+
+    async def embeddings_async(texts: List[str], *args, **kwargs):
+        return embeddings(texts)
+
+    return {
+        "initialize_openai": lambda *args, **kwargs: None,
+        "generate_completion": completion,
+        "generate_chat_completion": completion,
+        "generate_completion_async": completion_async,
+        "generate_chat_completion_async": completion_async,
+        "get_embedding": embedding,
+        "get_embedding_async": embedding_async,
+        "get_embeddings": embeddings,
+        "get_embeddings_async": embeddings_async,
+    }
+
+
+# Class attributes holding the OpenAI functions, read at call time
+_CLASS_STUBS = {"call_embedding_function": "get_embedding", "call_embedding_async_function": "get_embedding_async"}
+
+
+@contextlib.contextmanager
+def stub_openai(module: Any, dims: int) -> Iterator[None]:
+    """Replaces the OpenAI functions of the component module for the duration of the block"""
+    stubs = _openai_stubs(dims)
+    with contextlib.ExitStack() as stack:
+        for name, stub in stubs.items():
+            if hasattr(module, name):
+                stack.enter_context(mock.patch.object(module, name, stub))
+        component_class = getattr(module, "Component", None)
+        for attribute, name in _CLASS_STUBS.items():
+            if component_class is not None and attribute in vars(component_class):
+                stack.enter_context(mock.patch.object(component_class, attribute, stubs[name]))
+        yield
+
+
+def select_cases(names: Optional[List[str]] = None) -> List[BenchmarkCase]:
+    """The cases whose component module contains one of the names, every case when None"""
+    if not names:
+        return list(CASES)
+    return [case for case in CASES if any(name in case.component for name in names)]
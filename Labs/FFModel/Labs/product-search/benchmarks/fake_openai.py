@@ -0,0 +1,222 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+"""
+A local fake of the (Azure) OpenAI service, for load tests.
+
+Answers the completions, chat completions and embeddings requests of the `openai` package, both the
+Azure routes (`/openai/deployments/<deployment>/completions?api-version=...`) and the OpenAI ones
+(`/v1/completions`), after a configurable latency, and fails a configurable share of them with an
+error status (429 with a `Retry-After` header by default, like a throttled deployment). The
+completions are a fixed text, the embeddings the deterministic `fake_embedding` of the inputs.
+
+Point the `OPENAI_ENDPOINT` environment config at it (any key is accepted):
+    OPENAI_ENDPOINT=http://127.0.0.1:8765/
+    OPENAI_API_KEY=fake
+
+Usage, from the project root:
+    python -m benchmarks.fake_openai --port 8765 --latency 0.4 --latency-jitter 0.2 --error-rate 0.02
+"""
+
+import argparse
+import json
+import logging
+import random
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+from benchmarks.synthetic import DEFAULT_DIMS, EMBEDDING_MODEL, fake_embedding
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class FakeOpenAIConfig:
+    host: str = "127.0.0.1"
+    port: int = 8765
+    # Seconds before answering, plus a uniform jitter of up to latency_jitter seconds
+    latency: float = 0.3
+    latency_jitter: float = 0.0
+    # Share of the requests failed with the error status
+    error_rate: float = 0.0
+    error_status: int = 429
+    completion: str = "print('hello world')"
+    dims: int = DEFAULT_DIMS
+    seed: Optional[int] = None
+
+
+class FakeOpenAIServer(ThreadingHTTPServer):
+    """Serves each request on its own thread, so the latency of a request does not delay the others"""
+
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, config: FakeOpenAIConfig):
+        super().__init__((config.host, config.port), _Handler)
+        self.config = config
+        self.rng = random.Random(config.seed)
+        self.lock = threading.Lock()
+        self.counts = {"requests": 0, "errors": 0}
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def draw(self) -> Dict[str, Any]:
+        """The latency and the outcome of a request"""
+        config = self.config
+        with self.lock:
+            latency = config.latency + self.rng.uniform(0, config.latency_jitter)
+            failed = self.rng.random() < config.error_rate
+            self.counts["requests"] += 1
+            self.counts["errors"] += failed
+        return {"latency": latency, "failed": failed}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: FakeOpenAIServer
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        path = self.path.split("?", 1)[0].rstrip("/")
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            return self._send(400, _error("invalid_request_error", "The body is not valid json"))
+
+        outcome = self.server.draw()
+        time.sleep(outcome["latency"])
+        if outcome["failed"]:
+            status = self.server.config.error_status
+            return self._send(status, _error("server_error", f"Injected error {status}"), {"Retry-After": "1"})
+
+        config = self.server.config
+        if path.endswith("/chat/completions"):
+            return self._send(200, _chat_completion(body, config.completion))
+        if path.endswith("/completions"):
+            return self._send(200, _completion(body, config.completion))
+        if path.endswith("/embeddings"):
+            return self._send(200, _embeddings(body, config.dims))
+        self._send(404, _error("invalid_request_error", f"Unknown route {path}"))
+
+    def _send(self, status: int, payload: Dict[str, Any], headers: Optional[Dict[str, str]] = None):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format: str, *args):
+        logger.debug(format % args)
+
+
+def _error(error_type: str, message: str) -> Dict[str, Any]:
+    return {"error": {"message": message, "type": error_type, "param": None, "code": None}}
+
+
+def _usage(prompt_tokens: int, completion_tokens: int) -> Dict[str, int]:
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+    }
+
+
+def _tokens(text: Any) -> int:
+    """A rough token count, 4 characters per token"""
+    return max(1, len(json.dumps(text)) // 4)
+
+
+def _completion(body: Dict[str, Any], text: str) -> Dict[str, Any]:
+    choices = int(body.get("n") or 1)
+    return {
+        "id": "cmpl-fake",
+        "object": "text_completion",
+        "created": int(time.time()),
+        "model": body.get("model", "fake"),
+        "choices": [
+            {"text": text, "index": index, "finish_reason": "stop", "logprobs": None} for index in range(choices)
+        ],
+        "usage": _usage(_tokens(body.get("prompt", "")), _tokens(text) * choices),
+    }
+
+
+def _chat_completion(body: Dict[str, Any], text: str) -> Dict[str, Any]:
+    choices = int(body.get("n") or 1)
+    return {
+        "id": "chatcmpl-fake",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "fake"),
+        "choices": [
+            {"index": index, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}
+            for index in range(choices)
+        ],
+        "usage": _usage(_tokens(body.get("messages", [])), _tokens(text) * choices),
+    }
+
+
+def _embeddings(body: Dict[str, Any], dims: int) -> Dict[str, Any]:
+    texts: List[Any] = body.get("input") or []
+    if not isinstance(texts, list):
+        texts = [texts]
+    return {
+        "object": "list",
+        "model": body.get("model", EMBEDDING_MODEL),
+        "data": [
+            {"object": "embedding", "index": index, "embedding": fake_embedding(str(text), dims)}
+            for index, text in enumerate(texts)
+        ],
+        "usage": _usage(sum(_tokens(text) for text in texts), 0),
+    }
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Local fake of the (Azure) OpenAI service, for load tests")
+    parser.add_argument("--host", default="127.0.0.1", help="Address to listen on")
+    parser.add_argument("--port", type=int, default=8765, help="Port to listen on")
+    parser.add_argument("--latency", type=float, default=0.3, help="Seconds before answering a request")
+    parser.add_argument("--latency-jitter", type=float, default=0.0, help="Uniform jitter added to the latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of the requests failed")
+    parser.add_argument("--error-status", type=int, default=429, help="Status of the failed requests")
+    parser.add_argument("--completion", default="print('hello world')", help="Text of the completions")
+    parser.add_argument("--dims", type=int, default=DEFAULT_DIMS, help="Dimensions of the embeddings")
+    parser.add_argument("--seed", type=int, help="Seed of the latencies and errors")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    server = FakeOpenAIServer(
+        FakeOpenAIConfig(
+            host=args.host,
+            port=args.port,
+            latency=args.latency,
+            latency_jitter=args.latency_jitter,
+            error_rate=args.error_rate,
+            error_status=args.error_status,
+            completion=args.completion,
+            dims=args.dims,
+            seed=args.seed,
+        )
+    )
+    logger.info(f"Fake OpenAI listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        logger.info(f"Served {server.counts['requests']} requests, {server.counts['errors']} injected errors")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
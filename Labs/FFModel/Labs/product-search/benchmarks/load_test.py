@@ -0,0 +1,573 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+"""
+End-to-end load test of the inference app of `examples/docker/app.py`.
+
+Starts the fake OpenAI service of `benchmarks/fake_openai.py` with the given latency and error rate,
+starts the app with a solution config against it, and replays recorded requests at increasing
+arrival rates. The arrivals are open-loop: each request is sent at its scheduled time whether or not
+the previous ones are answered, like real users, and its latency counts from that scheduled time, so
+a queue building up in the app shows in the latencies instead of slowing the load down.
+
+Each rate step reports the achieved throughput, the p50/p95/p99 latency of the answered requests
+and the error rate (error statuses, connection errors and timeouts). A step is saturated when the
+throughput falls short of the offered rate by more than the tolerance, the error rate goes over the
+maximum, or the p95 goes over the SLO when one is given. The ramp stops at the first saturated step,
+`--refine` bisects between the last good rate and it, and the capacity is the highest good rate.
+
+The recorded requests are a jsonl file, one request body of the `/inference` endpoint per line
+(`user_nl`, `session_id`, `sequence`), or `{"timestamp": ..., "body": {...}}` lines to replay the
+recorded arrival pattern (`--arrivals recorded`, the gaps are scaled to each rate). The dataset
+records of the examples (`nl_prompt`) are accepted too.
+
+Usage, from the project root:
+    python -m benchmarks.load_test --solution-config examples/nl2python/nl2python_solution.yaml \\
+        --requests examples/nl2python/sample_datasets/nl2python_dataset.jsonl \\
+        --rates 1 2 4 8 16 32 --step-duration 30 --openai-latency 0.4 --openai-error-rate 0.01 \\
+        --output load_test.json
+
+    # Against an app already running, e.g. with docker compose, its OPENAI_ENDPOINT pointing at
+    # http://host.docker.internal:8765/ (the fake listening on all interfaces)
+    python -m benchmarks.load_test --app-url http://localhost:8080/inference --fake-openai-host 0.0.0.0 \\
+        --requests requests.jsonl --start-rate 1 --max-rate 64 --growth 1.5 --refine 2
+"""
+
+import argparse
+import contextlib
+import datetime
+import json
+import logging
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, Iterator, List, Optional
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_PATH = os.path.join(PROJECT_ROOT, "examples", "docker", "app.py")
+
+ARRIVALS = ("poisson", "uniform", "recorded")
+
+# Requests dispatched later than this after their scheduled time mean the harness itself is the bottleneck
+_LATE_DISPATCH = 0.1
+
+
+@dataclass
+class LoadTestConfig:
+    rates: List[float]
+    # Seconds of each rate step, and of the warmup at the first rate, whose requests are not reported
+    step_duration: float = 30.0
+    warmup: float = 5.0
+    arrivals: str = "poisson"
+    # Seconds before a request counts as an error
+    timeout: float = 30.0
+    # Requests in flight at once, more wait in the harness (and are reported as late)
+    max_in_flight: int = 512
+    # Saturation criteria
+    throughput_tolerance: float = 0.1
+    max_error_rate: float = 0.05
+    p95_slo: Optional[float] = None
+    # Bisection steps between the last good and the first saturated rate
+    refine: int = 0
+    seed: int = 0
+
+
+@dataclass
+class ReplayedRequest:
+    body: Dict[str, Any]
+    # Seconds since the first recorded request, when recorded
+    offset: Optional[float] = None
+
+
+@dataclass
+class RequestResult:
+    latency: float
+    dispatch_delay: float
+    status: Optional[int] = None
+    error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.status == 200
+
+
+@dataclass
+class StepResult:
+    rate: float
+    # Requests sent per second, the rate drawn by the arrival process
+    offered: float
+    duration: float
+    sent: int
+    ok: int
+    errors: int
+    throughput: float
+    error_rate: float
+    p50_ms: Optional[float]
+    p95_ms: Optional[float]
+    p99_ms: Optional[float]
+    max_ms: Optional[float]
+    late: int
+    error_types: Dict[str, int] = field(default_factory=dict)
+    saturated: bool = False
+    reasons: List[str] = field(default_factory=list)
+
+
+@dataclass
+class LoadTestReport:
+    steps: List[StepResult]
+    # Highest rate that was not saturated, and lowest rate that was
+    capacity: Optional[float]
+    saturation: Optional[float]
+
+
+def _parse_timestamp(value: Any) -> float:
+    if isinstance(value, (int, float)):
+        return float(value)
+    return datetime.datetime.fromisoformat(str(value).replace("Z", "+00:00")).timestamp()
+
+
+def load_requests(path: str) -> List[ReplayedRequest]:
+    """Reads the recorded requests, see the module docstring for the formats"""
+    requests = []
+    first = None
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            offset = None
+            if "timestamp" in record:
+                timestamp = _parse_timestamp(record["timestamp"])
+                first = timestamp if first is None else first
+                offset = timestamp - first
+            if "body" in record:
+                body = record["body"]
+            elif "nl_prompt" in record:
+                # A dataset record, only its request fields are sent
+                body = {"user_nl": record["nl_prompt"]}
+                body.update({key: record[key] for key in ("session_id", "sequence") if key in record})
+            else:
+                body = {key: value for key, value in record.items() if key != "timestamp"}
+            requests.append(ReplayedRequest(body=body, offset=offset))
+    if not requests:
+        raise ValueError(f"No requests in {path}")
+    return requests
+
+
+def arrival_times(
+    requests: List[ReplayedRequest], rate: float, duration: float, arrivals: str, rng: random.Random
+) -> List[float]:
+    """Seconds from the start of the step at which to send each request, at the given mean rate"""
+    if arrivals not in ARRIVALS:
+        raise ValueError(f"Invalid arrivals: {arrivals}, must be one of {ARRIVALS}")
+    if arrivals == "recorded":
+        offsets = [request.offset for request in requests]
+        if any(offset is None for offset in offsets) or len(offsets) < 2 or offsets[-1] <= 0:
+            raise ValueError("Recorded arrivals need a timestamp on every request, spanning some time")
+        gaps = [max(0.0, after - before) for before, after in zip(offsets, offsets[1:])]
+        scale = (1 / rate) / (sum(gaps) / len(gaps))
+
+    times = []
+    now = 0.0
+    while True:
+        if arrivals == "poisson":
+            now += rng.expovariate(rate)
+        elif arrivals == "uniform":
+            now += 1 / rate
+        else:
+            now += gaps[len(times) % len(gaps)] * scale
+        if now >= duration:
+            return times
+        times.append(now)
+
+
+def _percentile_ms(sorted_values: List[float], percentile: float) -> Optional[float]:
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, round(percentile / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index] * 1000
+
+
+class LoadGenerator:
+    """
+    Sends the recorded requests to the app at open-loop arrival rates.
+
+    Args:
+        - url: URL of the inference endpoint
+        - requests: The recorded requests, replayed in order and cycled through
+        - config: The load test config
+    """
+
+    def __init__(self, url: str, requests: List[ReplayedRequest], config: LoadTestConfig):
+        self.url = url
+        self.requests = requests
+        self.config = config
+        self.rng = random.Random(config.seed)
+        self.next_request = 0
+
+    def run_step(self, rate: float, duration: float) -> StepResult:
+        config = self.config
+        times = arrival_times(self.requests, rate, duration, config.arrivals, self.rng)
+        results: List[RequestResult] = []
+        lock = threading.Lock()
+
+        def send(body: Dict[str, Any], scheduled: float):
+            result = self._send(body, scheduled)
+            with lock:
+                results.append(result)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=config.max_in_flight, thread_name_prefix="load") as executor:
+            for at in times:
+                delay = start + at - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                body = self.requests[self.next_request % len(self.requests)].body
+                self.next_request += 1
+                executor.submit(send, body, start + at)
+        # The requests still in flight at the end of the step count, their answers stretch the step
+        elapsed = max(duration, time.perf_counter() - start)
+        return self._summarize(rate, len(times) / duration, elapsed, results)
+
+    def _send(self, body: Dict[str, Any], scheduled: float) -> RequestResult:
+        dispatched = time.perf_counter()
+        request = urllib.request.Request(
+            self.url, data=json.dumps(body).encode("utf-8"), headers={"Content-Type": "application/json"}
+        )
+        result = RequestResult(latency=0.0, dispatch_delay=dispatched - scheduled)
+        try:
+            with urllib.request.urlopen(request, timeout=self.config.timeout) as response:
+                response.read()
+                result.status = response.status
+        except urllib.error.HTTPError as e:
+            result.status = e.code
+            result.error = f"HTTP {e.code}"
+        except Exception as e:
+            result.error = type(e).__name__
+        result.latency = time.perf_counter() - scheduled
+        return result
+
+    def _summarize(self, rate: float, offered: float, elapsed: float, results: List[RequestResult]) -> StepResult:
+        config = self.config
+        latencies = sorted(result.latency for result in results if result.ok)
+        errors = [result for result in results if not result.ok]
+        error_types: Dict[str, int] = {}
+        for result in errors:
+            error_types[result.error] = error_types.get(result.error, 0) + 1
+
+        step = StepResult(
+            rate=rate,
+            offered=offered,
+            duration=elapsed,
+            sent=len(results),
+            ok=len(latencies),
+            errors=len(errors),
+            throughput=len(latencies) / elapsed,
+            error_rate=len(errors) / len(results) if results else 0.0,
+            p50_ms=_percentile_ms(latencies, 50),
+            p95_ms=_percentile_ms(latencies, 95),
+            p99_ms=_percentile_ms(latencies, 99),
+            max_ms=latencies[-1] * 1000 if latencies else None,
+            late=sum(result.dispatch_delay > _LATE_DISPATCH for result in results),
+            error_types=error_types,
+        )
+        if step.throughput < offered * (1 - config.throughput_tolerance):
+            step.reasons.append(f"throughput {step.throughput:.2f}/s below the offered {offered:.2f}/s")
+        if step.error_rate > config.max_error_rate:
+            step.reasons.append(f"error rate {step.error_rate:.1%} above {config.max_error_rate:.1%}")
+        if config.p95_slo is not None and (step.p95_ms is None or step.p95_ms > config.p95_slo * 1000):
+            step.reasons.append(f"p95 above the {config.p95_slo:g}s SLO")
+        step.saturated = bool(step.reasons)
+        if step.late:
+            logger.warning(
+                f"{step.late} requests were sent more than {_LATE_DISPATCH}s late at {rate:g}/s, "
+                "raise --max-in-flight or run the harness on another machine"
+            )
+        return step
+
+
+def find_saturation(generator: LoadGenerator, config: LoadTestConfig) -> LoadTestReport:
+    """Ramps the rate up to the first saturated step, then bisects between it and the last good rate"""
+    if config.warmup > 0:
+        logger.info(f"Warming up at {config.rates[0]:g}/s for {config.warmup:g}s")
+        generator.run_step(config.rates[0], config.warmup)
+
+    steps = []
+    capacity = saturation = None
+
+    def run(rate: float) -> StepResult:
+        step = generator.run_step(rate, config.step_duration)
+        steps.append(step)
+        logger.info(
+            f"{rate:g}/s: {step.throughput:.2f}/s, p95 {step.p95_ms or 0:.0f}ms, errors {step.error_rate:.1%}"
+            + (f", saturated ({'; '.join(step.reasons)})" if step.saturated else "")
+        )
+        return step
+
+    for rate in config.rates:
+        if run(rate).saturated:
+            saturation = rate
+            break
+        capacity = rate
+
+    for _ in range(config.refine):
+        if saturation is None:
+            break
+        rate = ((capacity or 0) + saturation) / 2
+        if run(rate).saturated:
+            saturation = rate
+        else:
+            capacity = rate
+
+    return LoadTestReport(steps=sorted(steps, key=lambda step: step.rate), capacity=capacity, saturation=saturation)
+
+
+def geometric_rates(start: float, maximum: float, growth: float) -> List[float]:
+    if start <= 0 or growth <= 1:
+        raise ValueError("The start rate must be positive and the growth above 1")
+    rates = []
+    rate = start
+    while rate <= maximum * (1 + 1e-9):
+        rates.append(round(rate, 3))
+        rate *= growth
+    return rates
+
+
+def _wait_for_port(url: str, timeout: float, process: Optional[subprocess.Popen] = None, log_path: str = None):
+    parsed = urlparse(url)
+    host = "127.0.0.1" if parsed.hostname in (None, "0.0.0.0") else parsed.hostname
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"{url} exited with {process.returncode} while starting, see {log_path}")
+        with contextlib.suppress(OSError), socket.create_connection((host, parsed.port), timeout=1):
+            return
+        time.sleep(0.2)
+    raise TimeoutError(f"{url} did not start listening within {timeout}s, see {log_path}")
+
+
+@contextlib.contextmanager
+def running_process(
+    command: List[str], url: str, cwd: str, log_path: str, env: Dict[str, str] = None, startup_timeout: float = 120
+) -> Iterator[subprocess.Popen]:
+    """Runs the command until the end of the block, once it listens on the port of the url"""
+    with open(log_path, "w", encoding="utf-8") as log:
+        process = subprocess.Popen(
+            command, cwd=cwd, env={**os.environ, **(env or {})}, stdout=log, stderr=subprocess.STDOUT
+        )
+        try:
+            _wait_for_port(url, startup_timeout, process, log_path)
+            yield process
+        finally:
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+
+
+def write_environment_config(path: str, openai_endpoint: str, base_config: Optional[str] = None) -> str:
+    """An environment config pointing the app at the fake OpenAI, on top of the configs of the base file"""
+    overrides = {"OPENAI_ENDPOINT": openai_endpoint, "OPENAI_API_KEY": "fake"}
+    defaults = {"FFMODEL_LOGGING_ENABLED": "false", "FFMODEL_METRICS_ENABLED": "false"}
+    lines = []
+    if base_config:
+        with open(os.path.expanduser(base_config), encoding="utf-8") as f:
+            for line in f:
+                name = line.split("=", 1)[0].strip()
+                if name not in overrides:
+                    lines.append(line.rstrip("\n"))
+                defaults.pop(name, None)
+    lines.extend(f"{name}={value}" for name, value in {**defaults, **overrides}.items())
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+    return path
+
+
+def _format_ms(value: Optional[float]) -> str:
+    return "-" if value is None else f"{value:.0f}"
+
+
+def format_report(report: LoadTestReport) -> str:
+    lines = [
+        f"{'rate/s':>8} {'offered/s':>9} {'ok/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+        f"{'errors':>7} {'late':>5}  saturated"
+    ]
+    for step in report.steps:
+        lines.append(
+            f"{step.rate:>8g} {step.offered:>9.2f} {step.throughput:>8.2f} {_format_ms(step.p50_ms):>8} "
+            f"{_format_ms(step.p95_ms):>8} {_format_ms(step.p99_ms):>8} {step.error_rate:>7.1%} {step.late:>5}"
+            f"  {'; '.join(step.reasons) if step.saturated else 'no'}"
+        )
+    if report.saturation is None:
+        lines.append(f"Not saturated up to {report.capacity:g}/s, raise the rates to find the saturation point")
+    elif report.capacity is None:
+        lines.append(f"Saturated from the first rate, {report.saturation:g}/s")
+    else:
+        lines.append(f"Capacity: {report.capacity:g}/s, saturated at {report.saturation:g}/s")
+    return "\n".join(lines)
+
+
+def save_report(path: str, report: LoadTestReport, config: LoadTestConfig, setup: Dict[str, Any]):
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    document = {
+        "metadata": {
+            "created": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "machine": platform.node(),
+            "cpu_count": os.cpu_count(),
+            "config": asdict(config),
+            **setup,
+        },
+        **asdict(report),
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(document, f, indent=2)
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Open-loop load test of the inference app against a fake OpenAI")
+    target = parser.add_argument_group("target")
+    target.add_argument("--solution-config", help="Solution config the app is started with")
+    target.add_argument("--environment-config", help="Environment config to start from, e.g. .ffmodel")
+    target.add_argument("--app-url", help="URL of an app already running, instead of starting one")
+    target.add_argument("--app-port", type=int, default=8080, help="Port of the started app")
+    target.add_argument("--startup-timeout", type=float, default=120, help="Seconds for the app to start")
+
+    fake = parser.add_argument_group("fake OpenAI")
+    fake.add_argument("--no-fake-openai", action="store_true", help="Use the OpenAI of the environment config")
+    fake.add_argument("--fake-openai-host", default="127.0.0.1", help="Address the fake OpenAI listens on")
+    fake.add_argument("--fake-openai-port", type=int, default=8765, help="Port of the fake OpenAI")
+    fake.add_argument("--openai-latency", type=float, default=0.3, help="Seconds the fake OpenAI takes to answer")
+    fake.add_argument("--openai-latency-jitter", type=float, default=0.1, help="Uniform jitter of the latency")
+    fake.add_argument("--openai-error-rate", type=float, default=0.0, help="Share of the OpenAI calls failed")
+    fake.add_argument("--openai-error-status", type=int, default=429, help="Status of the failed OpenAI calls")
+
+    load = parser.add_argument_group("load")
+    load.add_argument("--requests", required=True, help="jsonl of the recorded requests to replay")
+    load.add_argument("--rates", type=float, nargs="+", help="Arrival rates of the steps, in requests per second")
+    load.add_argument("--start-rate", type=float, default=1.0, help="First rate, when --rates is not given")
+    load.add_argument("--max-rate", type=float, default=64.0, help="Last rate, when --rates is not given")
+    load.add_argument("--growth", type=float, default=2.0, help="Rate multiplier between steps")
+    load.add_argument("--step-duration", type=float, default=30.0, help="Seconds of each step")
+    load.add_argument("--warmup", type=float, default=5.0, help="Seconds of unreported load at the first rate")
+    load.add_argument("--arrivals", choices=ARRIVALS, default="poisson", help="Arrival process")
+    load.add_argument("--timeout", type=float, default=30.0, help="Seconds before a request is an error")
+    load.add_argument("--max-in-flight", type=int, default=512, help="Requests in flight at once")
+    load.add_argument("--seed", type=int, default=0, help="Seed of the arrivals and of the fake OpenAI")
+
+    saturation = parser.add_argument_group("saturation")
+    saturation.add_argument("--throughput-tolerance", type=float, default=0.1, help="Share of the rate missing")
+    saturation.add_argument("--max-error-rate", type=float, default=0.05, help="Error rate of a saturated step")
+    saturation.add_argument("--p95-slo", type=float, help="Seconds, a step with a higher p95 is saturated")
+    saturation.add_argument("--refine", type=int, default=0, help="Bisection steps around the saturation point")
+
+    parser.add_argument("--output", help="Path to write the report to, as json")
+    parser.add_argument("--workdir", help="Directory of the logs and generated configs, a temporary one by default")
+    args = parser.parse_args(argv)
+
+    if not args.app_url and not args.solution_config:
+        parser.error("Either --solution-config or --app-url is required")
+
+    logging.basicConfig(level=logging.INFO)
+    config = LoadTestConfig(
+        rates=args.rates or geometric_rates(args.start_rate, args.max_rate, args.growth),
+        step_duration=args.step_duration,
+        warmup=args.warmup,
+        arrivals=args.arrivals,
+        timeout=args.timeout,
+        max_in_flight=args.max_in_flight,
+        throughput_tolerance=args.throughput_tolerance,
+        max_error_rate=args.max_error_rate,
+        p95_slo=args.p95_slo,
+        refine=args.refine,
+        seed=args.seed,
+    )
+    requests = load_requests(args.requests)
+    workdir = args.workdir or tempfile.mkdtemp(prefix="load_test-")
+    os.makedirs(workdir, exist_ok=True)
+    logger.info(f"Logs in {workdir}")
+
+    with contextlib.ExitStack() as stack:
+        setup: Dict[str, Any] = {"requests": args.requests}
+        openai_endpoint = None
+        if not args.no_fake_openai:
+            openai_endpoint = f"http://{args.fake_openai_host}:{args.fake_openai_port}/"
+            fake_command = [
+                sys.executable,
+                "-m",
+                "benchmarks.fake_openai",
+                f"--host={args.fake_openai_host}",
+                f"--port={args.fake_openai_port}",
+                f"--latency={args.openai_latency}",
+                f"--latency-jitter={args.openai_latency_jitter}",
+                f"--error-rate={args.openai_error_rate}",
+                f"--error-status={args.openai_error_status}",
+                f"--seed={args.seed}",
+            ]
+            stack.enter_context(
+                running_process(fake_command, openai_endpoint, PROJECT_ROOT, os.path.join(workdir, "fake_openai.log"))
+            )
+            setup["fake_openai"] = {
+                "latency": args.openai_latency,
+                "latency_jitter": args.openai_latency_jitter,
+                "error_rate": args.openai_error_rate,
+                "error_status": args.openai_error_status,
+            }
+
+        app_url = args.app_url
+        if not app_url:
+            solution_config = os.path.abspath(args.solution_config)
+            if openai_endpoint:
+                environment_config = write_environment_config(
+                    os.path.join(workdir, "load_test.ffmodel"),
+                    openai_endpoint.replace("0.0.0.0", "127.0.0.1"),
+                    args.environment_config,
+                )
+            else:
+                environment_config = os.path.abspath(os.path.expanduser(args.environment_config or "~/.ffmodel"))
+            app_url = f"http://127.0.0.1:{args.app_port}/inference"
+            env = {
+                "SOLUTION_CONFIG_PATH": solution_config,
+                "ENVIRONMENT_CONFIG_PATH": environment_config,
+                "PORT": str(args.app_port),
+                "PYTHONPATH": os.pathsep.join(filter(None, [PROJECT_ROOT, os.environ.get("PYTHONPATH")])),
+            }
+            # Like the Dockerfile, the app runs from the directory of the solution config
+            stack.enter_context(
+                running_process(
+                    [sys.executable, APP_PATH],
+                    app_url,
+                    os.path.dirname(solution_config),
+                    os.path.join(workdir, "app.log"),
+                    env,
+                    args.startup_timeout,
+                )
+            )
+            setup["solution_config"] = args.solution_config
+        setup["app_url"] = app_url
+
+        report = find_saturation(LoadGenerator(app_url, requests, config), config)
+
+    print(format_report(report))
+    if args.output:
+        save_report(args.output, report, config, setup)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
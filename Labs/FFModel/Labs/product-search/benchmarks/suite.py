@@ -0,0 +1,407 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+"""
+Micro-benchmarks of the components.
+
+Times the `execute` and `execute_batch` of every component of `components/` (see `benchmarks/cases.py`)
+on synthetic data models, with the OpenAI calls stubbed, so a change making the embedding selection,
+the stitching, an evaluator, a reader or a writer slower shows up before it reaches an experiment.
+The embedding pre-processors run against synthetic banks of each of the `--bank-sizes` (e.g. 1k to
+1M items of 1536 dimensions, generated once and kept in the work directory).
+
+Each measurement runs the records one by one (`execute`) or in batches (`execute_batch`) until all
+the records are done or the time budget is spent, on a freshly created component and fresh data
+models, and is repeated. The results keep the best mean time per record over the repeats (the least
+disturbed by the rest of the machine), its p50/p95 and the setup time of the component.
+
+The results are written as json. The compare command (or `run --baseline`) compares them with a
+stored baseline of the same machine, flags the cases slower by more than the threshold, and exits
+with 1 when there is any, or when a case of the baseline failed or did not run (`run --baseline` only
+expects the cases and bank sizes it selected).
+
+Usage, from the project root:
+    python -m benchmarks.suite run --output benchmarks/baselines/my-machine.json
+    python -m benchmarks.suite run --components few_shot dynamic_context --bank-sizes 1000 100000 1000000
+    python -m benchmarks.suite run --baseline benchmarks/baselines/my-machine.json --threshold 0.2
+    python -m benchmarks.suite compare benchmarks/baselines/my-machine.json results.json
+"""
+
+import argparse
+import datetime
+import importlib
+import json
+import logging
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from benchmarks.cases import BenchmarkCase, select_cases, stub_openai
+from benchmarks.synthetic import DEFAULT_DIMS, synthetic_data_models, synthetic_records, write_records
+from ffmodel.core.solution_config import DataConfig
+from ffmodel.data_models.base import ExperimentDataModel
+from utilities.executor import create_component
+
+logger = logging.getLogger(__name__)
+
+SOLUTION_ID = "benchmark"
+
+
+@dataclass
+class SuiteConfig:
+    records: int = 1000
+    bank_sizes: List[int] = field(default_factory=lambda: [1000, 10000])
+    dims: int = DEFAULT_DIMS
+    repeats: int = 3
+    # Seconds per measurement, the records left when it is spent are not run
+    budget: float = 5.0
+    batch_size: int = 32
+    seed: int = 0
+    workdir: str = ".benchmarks"
+
+
+@dataclass
+class BenchmarkResult:
+    case: str
+    method: str
+    bank_size: Optional[int]
+    records: int = 0
+    # Best mean over the repeats, and the percentiles of the records of that repeat, in microseconds
+    per_record_us: Optional[float] = None
+    p50_us: Optional[float] = None
+    p95_us: Optional[float] = None
+    setup_ms: Optional[float] = None
+    repeats_us: List[float] = field(default_factory=list)
+    error: Optional[str] = None
+
+    @property
+    def key(self) -> Tuple[str, str, Optional[int]]:
+        return (self.case, self.method, self.bank_size)
+
+    def label(self) -> str:
+        size = f" [{self.bank_size}]" if self.bank_size is not None else ""
+        return f"{self.case}.{self.method}{size}"
+
+
+def _methods(case: BenchmarkCase) -> List[str]:
+    return ["execute_batch"] if case.kind == "reader" else ["execute", "execute_batch"]
+
+
+def _percentile(sorted_values: List[float], percentile: float) -> float:
+    index = max(0, min(len(sorted_values) - 1, round(percentile / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class BenchmarkSuite:
+    """
+    Args:
+        - config: The suite config
+    """
+
+    def __init__(self, config: SuiteConfig):
+        self.config = config
+        os.makedirs(config.workdir, exist_ok=True)
+
+    def run(self, cases: List[BenchmarkCase]) -> List[BenchmarkResult]:
+        results = []
+        for case in cases:
+            for bank_size in self.config.bank_sizes if case.bank else [None]:
+                for method in _methods(case):
+                    result = self.measure(case, method, bank_size)
+                    if result.error:
+                        logger.warning(f"{result.label()} failed: {result.error}")
+                    else:
+                        logger.info(f"{result.label()}: {result.per_record_us:.1f}us per record")
+                    results.append(result)
+        return results
+
+    def measure(self, case: BenchmarkCase, method: str, bank_size: Optional[int]) -> BenchmarkResult:
+        result = BenchmarkResult(case=case.component, method=method, bank_size=bank_size)
+        best_times: List[float] = []
+        try:
+            module = importlib.import_module(case.component)
+            # Banks and files are generated before the timed setup
+            supporting_data = (
+                case.supporting_data(self.config.workdir, bank_size, self.config.dims) if case.supporting_data else {}
+            )
+            for _ in range(self.config.repeats):
+                with stub_openai(module, self.config.dims):
+                    setup, times, records = self._run_once(case, method, supporting_data)
+                mean = sum(times) / records
+                result.repeats_us.append(mean * 1e6)
+                if result.per_record_us is None or mean * 1e6 < result.per_record_us:
+                    result.per_record_us = mean * 1e6
+                    result.records = records
+                    best_times = times
+                result.setup_ms = setup * 1000 if result.setup_ms is None else min(result.setup_ms, setup * 1000)
+        except Exception as e:
+            result.error = f"{type(e).__name__}: {e}"
+            return result
+
+        per_record = sorted(time_ / (result.records / len(best_times)) for time_ in best_times)
+        result.p50_us = _percentile(per_record, 50) * 1e6
+        result.p95_us = _percentile(per_record, 95) * 1e6
+        return result
+
+    def _run_once(
+        self, case: BenchmarkCase, method: str, supporting_data: Dict[str, Dict[str, Any]]
+    ) -> Tuple[float, List[float], int]:
+        """Returns the setup time, the time of each call and the number of records run"""
+        config = self.config
+        outputs = tempfile.mkdtemp(dir=config.workdir)
+        try:
+            component_config = {"name": case.component, "args": dict(case.args), "supporting_data": supporting_data}
+            if case.kind == "reader":
+                path = write_records(
+                    os.path.join(outputs, f"records.{case.file_format}"),
+                    synthetic_records(config.records, case.flavor, config.seed),
+                )
+                start = time.perf_counter()
+                reader = create_component(
+                    component_config,
+                    "Reader",
+                    SOLUTION_ID,
+                    data_config=DataConfig(file_path=path),
+                    data_model_type=ExperimentDataModel,
+                )
+                setup = time.perf_counter() - start
+                start = time.perf_counter()
+                data_models = reader.execute_batch()
+                return setup, [time.perf_counter() - start], len(data_models)
+
+            if case.kind == "writer":
+                component_config["args"].update(
+                    output_path=os.path.join(outputs, "results.out"), database_path=os.path.join(outputs, "results.db")
+                )
+            class_name = "Writer" if case.kind == "writer" else "Component"
+            start = time.perf_counter()
+            component = create_component(component_config, class_name, SOLUTION_ID)
+            setup = time.perf_counter() - start
+
+            data_models = synthetic_data_models(config.records, case.stage, case.flavor, config.seed)
+            if case.kind == "writer":
+                _add_metrics(data_models)
+            times, records = self._time_calls(component, method, data_models)
+            if case.kind == "writer":
+                getattr(component, "close", component.register_experiment_results)()
+            return setup, times, records
+        finally:
+            shutil.rmtree(outputs, ignore_errors=True)
+
+    def _time_calls(self, component: Any, method: str, data_models: List[Any]) -> Tuple[List[float], int]:
+        times = []
+        records = 0
+        step = 1 if method == "execute" else self.config.batch_size
+        started = time.perf_counter()
+        for offset in range(0, len(data_models), step):
+            if times and time.perf_counter() - started > self.config.budget:
+                break
+            start = time.perf_counter()
+            if method == "execute":
+                component.execute(data_models[offset])
+            else:
+                component.execute_batch(data_models[offset : offset + step])
+            times.append(time.perf_counter() - start)
+            records += len(data_models[offset : offset + step])
+        return times, records
+
+
+def _add_metrics(data_models: List[Any]):
+    """Metrics like the ones of the evaluators, for the writers"""
+    for index, data_model in enumerate(data_models):
+        data_model.experiment_metrics[f"{SOLUTION_ID}.components.evaluators.rouge"] = {
+            "rouge1_fmeasure": [index % 7 / 7, index % 5 / 5]
+        }
+        data_model.experiment_metrics[f"{SOLUTION_ID}.components.evaluators.exact_match"] = {"exact_match": [1, 0]}
+
+
+def _metadata(config: SuiteConfig) -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True, timeout=10
+        ).stdout.strip()
+    except Exception:
+        commit = None
+    return {
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "git_commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.node(),
+        "cpu_count": os.cpu_count(),
+        "config": asdict(config),
+    }
+
+
+def save_results(path: str, config: SuiteConfig, results: List[BenchmarkResult]):
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"metadata": _metadata(config), "results": [asdict(result) for result in results]}, f, indent=2)
+
+
+def load_results(path: str) -> Tuple[Dict[str, Any], List[BenchmarkResult]]:
+    with open(path, encoding="utf-8") as f:
+        document = json.load(f)
+    return document["metadata"], [BenchmarkResult(**result) for result in document["results"]]
+
+
+@dataclass
+class Comparison:
+    label: str
+    baseline_us: Optional[float]
+    current_us: Optional[float]
+    # current / baseline
+    ratio: Optional[float]
+    # "slower", "faster", "ok", "new", "missing" or "error"
+    status: str
+
+
+# The statuses making the comparison fail
+FAILING_STATUSES = ("slower", "error", "missing")
+
+
+def compare(baseline: List[BenchmarkResult], current: List[BenchmarkResult], threshold: float) -> List[Comparison]:
+    """Compares the mean time per record of each case, flags the changes beyond the relative threshold"""
+    baseline_by_key = {result.key: result for result in baseline}
+    comparisons = []
+    for result in current:
+        base = baseline_by_key.pop(result.key, None)
+        if result.error:
+            comparisons.append(Comparison(result.label(), base and base.per_record_us, None, None, "error"))
+            continue
+        if base is None or base.per_record_us is None:
+            comparisons.append(Comparison(result.label(), None, result.per_record_us, None, "new"))
+            continue
+        ratio = result.per_record_us / base.per_record_us
+        status = "slower" if ratio > 1 + threshold else "faster" if ratio < 1 / (1 + threshold) else "ok"
+        comparisons.append(Comparison(result.label(), base.per_record_us, result.per_record_us, ratio, status))
+    for base in baseline_by_key.values():
+        comparisons.append(Comparison(base.label(), base.per_record_us, None, None, "missing"))
+    return comparisons
+
+
+def _format_us(value: Optional[float]) -> str:
+    return "-" if value is None else f"{value:.1f}"
+
+
+def format_results(results: List[BenchmarkResult]) -> str:
+    lines = [f"{'case':<72} {'records':>8} {'us/record':>12} {'p50 us':>12} {'p95 us':>12} {'setup ms':>10}"]
+    for result in results:
+        if result.error:
+            lines.append(f"{result.label():<72} {result.error}")
+            continue
+        lines.append(
+            f"{result.label():<72} {result.records:>8} {_format_us(result.per_record_us):>12} "
+            f"{_format_us(result.p50_us):>12} {_format_us(result.p95_us):>12} {_format_us(result.setup_ms):>10}"
+        )
+    return "\n".join(lines)
+
+
+def format_comparisons(comparisons: List[Comparison]) -> str:
+    lines = [f"{'case':<72} {'baseline us':>12} {'current us':>12} {'ratio':>7}  status"]
+    for comparison in comparisons:
+        ratio = "-" if comparison.ratio is None else f"{comparison.ratio:.2f}"
+        marker = f"  <- {comparison.status.upper()}" if comparison.status in FAILING_STATUSES else ""
+        lines.append(
+            f"{comparison.label:<72} {_format_us(comparison.baseline_us):>12} "
+            f"{_format_us(comparison.current_us):>12} {ratio:>7}  {comparison.status}{marker}"
+        )
+    return "\n".join(lines)
+
+
+def _report_comparison(
+    baseline_path: str,
+    current: List[BenchmarkResult],
+    threshold: float,
+    metadata: Dict,
+    selected: Optional[Callable[[BenchmarkResult], bool]] = None,
+) -> int:
+    baseline_metadata, baseline = load_results(baseline_path)
+    if selected is not None:
+        baseline = [result for result in baseline if selected(result)]
+    if baseline_metadata.get("machine") != metadata.get("machine"):
+        logger.warning(
+            f"The baseline was recorded on {baseline_metadata.get('machine')}, not on {metadata.get('machine')}: "
+            "the timings are not comparable across machines"
+        )
+    comparisons = compare(baseline, current, threshold)
+    print(format_comparisons(comparisons))
+    failures = Counter(comparison.status for comparison in comparisons if comparison.status in FAILING_STATUSES)
+    if failures:
+        if failures["slower"]:
+            print(f"{failures['slower']} cases are more than {threshold:.0%} slower than the baseline")
+        if failures["error"]:
+            print(f"{failures['error']} cases failed")
+        if failures["missing"]:
+            print(f"{failures['missing']} cases of the baseline did not run")
+        return 1
+    return 0
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Micro-benchmarks of the components on synthetic data models")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="Runs the benchmarks")
+    run.add_argument("--components", nargs="*", help="Only the components whose module contains one of these")
+    run.add_argument("--records", type=int, default=1000, help="Data models per measurement")
+    run.add_argument("--bank-sizes", type=int, nargs="+", default=[1000, 10000], help="Items of the embedding banks")
+    run.add_argument("--dims", type=int, default=DEFAULT_DIMS, help="Dimensions of the embeddings")
+    run.add_argument("--repeats", type=int, default=3, help="Repeats of each measurement, the best one is kept")
+    run.add_argument("--budget", type=float, default=5.0, help="Seconds per measurement")
+    run.add_argument("--batch-size", type=int, default=32, help="Data models per execute_batch call")
+    run.add_argument("--seed", type=int, default=0, help="Seed of the synthetic data")
+    run.add_argument("--workdir", default=".benchmarks", help="Directory of the generated banks and files")
+    run.add_argument("--output", help="Path to write the results to, as json")
+    run.add_argument("--baseline", help="Path to the results to compare with")
+    run.add_argument("--threshold", type=float, default=0.2, help="Relative slowdown flagged by the comparison")
+
+    compare_parser = commands.add_parser("compare", help="Compares two results files")
+    compare_parser.add_argument("baseline", help="Path to the baseline results")
+    compare_parser.add_argument("results", help="Path to the results to check")
+    compare_parser.add_argument("--threshold", type=float, default=0.2, help="Relative slowdown flagged")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    if args.command == "compare":
+        metadata, results = load_results(args.results)
+        return _report_comparison(args.baseline, results, args.threshold, metadata)
+
+    config = SuiteConfig(
+        records=args.records,
+        bank_sizes=args.bank_sizes,
+        dims=args.dims,
+        repeats=args.repeats,
+        budget=args.budget,
+        batch_size=args.batch_size,
+        seed=args.seed,
+        workdir=args.workdir,
+    )
+    cases = select_cases(args.components)
+    if not cases:
+        print(f"No benchmark case matches {args.components}")
+        return 1
+
+    results = BenchmarkSuite(config).run(cases)
+    print(format_results(results))
+    if args.output:
+        save_results(args.output, config, results)
+    if args.baseline:
+        # The cases and bank sizes left out of this run are not missing
+        def selected(result: BenchmarkResult) -> bool:
+            return any(case.component == result.case for case in cases) and result.bank_size in (None, *args.bank_sizes)
+
+        return _report_comparison(args.baseline, results, args.threshold, _metadata(config), selected)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,201 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+"""
+Synthetic records, data models and embedding banks for the benchmarks.
+
+Everything is generated from a seed, so two runs of the suite time the components on the same
+inputs. The records follow the dataset format of the examples (`nl_prompt`, `completion`,
+`session_id`, `sequence`) and are turned into data models with `create_data_models`, like the
+readers do. The completions are written in the language of the evaluated component: plain text,
+SQL, KQL or Python.
+"""
+
+import json
+import os
+import pickle
+import random
+import zlib
+from typing import Any, Dict, List, Optional
+
+from ffmodel.data_models.base import ExperimentDataModel
+from ffmodel.utils.data_model_util import create_data_models
+from utilities.lazy_import import lazy_import
+
+np = lazy_import("numpy")
+
+EMBEDDING_MODEL = "text-embedding-ada-002"
+DEFAULT_DIMS = 1536
+
+FLAVORS = ("text", "sql", "kql", "python")
+
+# Stages of the chain the data models are prepared for, each adds to the previous one:
+#   - raw: as read by a reader
+#   - pre_processed: context, few shots and session history in the state
+#   - stitched: text prompt in the model input
+#   - stitched_chat: chat messages prompt (json) in the model input
+#   - completed: completions in the model output
+STAGES = ("raw", "pre_processed", "stitched", "stitched_chat", "completed")
+
+_WORDS = (
+    "customer order product price category region revenue total average count list show find "
+    "latest top cheapest shipped pending return store brand rating review stock supplier week month "
+    "year name city country discount basket item quantity"
+).split()
+
+_TABLES = ("customers", "orders", "products", "suppliers")
+
+
+def _sentence(rng: random.Random, low: int = 6, high: int = 18) -> str:
+    return " ".join(rng.choice(_WORDS) for _ in range(rng.randint(low, high)))
+
+
+def _code(rng: random.Random, flavor: str) -> str:
+    if flavor == "sql":
+        table = rng.choice(_TABLES)
+        return (
+            f"SELECT name, price FROM {table} WHERE price > {rng.randint(1, 500)} "
+            f"ORDER BY price LIMIT {rng.randint(1, 50)}"
+        )
+    if flavor == "kql":
+        table = rng.choice(_TABLES).capitalize()
+        return (
+            f"{table} | where price > {rng.randint(1, 500)} "
+            f"| summarize count() by category | top {rng.randint(1, 50)} by count_"
+        )
+    if flavor == "python":
+        name = rng.choice(_WORDS)
+        return f"{name} = [i * {rng.randint(2, 9)} for i in range({rng.randint(10, 1000)})]\nresult = sum({name})"
+    return _sentence(rng)
+
+
+def synthetic_records(
+    count: int, flavor: str = "text", seed: int = 0, session_length: int = 3
+) -> List[Dict[str, Any]]:
+    """Data points in the dataset format of the examples, records of a session share its history"""
+    if flavor not in FLAVORS:
+        raise ValueError(f"Invalid flavor: {flavor}, must be one of {FLAVORS}")
+    rng = random.Random(seed)
+    records = []
+    for index in range(count):
+        records.append(
+            {
+                "nl_prompt": f"{_sentence(rng)} {index}",
+                "completion": _code(rng, flavor),
+                "session_id": f"session-{index // max(1, session_length)}",
+                "sequence": index % max(1, session_length) + 1,
+            }
+        )
+    return records
+
+
+def synthetic_data_models(
+    count: int,
+    stage: str = "raw",
+    flavor: str = "text",
+    seed: int = 0,
+    data_model_type: Any = ExperimentDataModel,
+    completions: int = 2,
+) -> List[Any]:
+    """
+    Data models ready for a component of the given stage of the chain.
+
+    Args:
+        - count: Number of data models
+        - stage: One of `STAGES`
+        - flavor: Language of the expected outputs and completions, one of `FLAVORS`
+        - seed: Seed of the generation
+        - data_model_type: `ExperimentDataModel` or `InferenceDataModel`
+        - completions: Completions per record for the completed stage, the first one is the expected output
+    """
+    if stage not in STAGES:
+        raise ValueError(f"Invalid stage: {stage}, must be one of {STAGES}")
+    rng = random.Random(seed + 1)
+    data_models = create_data_models(synthetic_records(count, flavor, seed), data_model_type)
+    for data_model in data_models:
+        if stage == "raw":
+            continue
+        state = data_model.state
+        state.context.append(_sentence(rng, 40, 80))
+        state.completion_pairs.extend((_sentence(rng), _code(rng, flavor)) for _ in range(3))
+        state.session.extend((_sentence(rng), _code(rng, flavor)) for _ in range(2))
+        if stage == "stitched":
+            data_model.model_input.prompt = "\n".join(
+                [*state.context, *(f"# {nl}\n{code}" for nl, code in state.completion_pairs), f"# {state.user_nl}"]
+            )
+        elif stage == "stitched_chat":
+            messages = [{"role": "system", "content": "\n".join(state.context)}]
+            for nl, code in state.completion_pairs:
+                messages.extend([{"role": "user", "content": nl}, {"role": "assistant", "content": code}])
+            messages.append({"role": "user", "content": state.user_nl})
+            data_model.model_input.prompt = json.dumps(messages)
+        elif stage == "completed":
+            expected = data_model.request.expected_output
+            first = expected[0] if isinstance(expected, list) and expected else _code(rng, flavor)
+            data_model.model_output.completions = [first] + [_code(rng, flavor) for _ in range(completions - 1)]
+    return data_models
+
+
+def fake_embedding(text: str, dims: int = DEFAULT_DIMS) -> List[float]:
+    """A deterministic embedding of the text, the same text always gets the same vector"""
+    rng = np.random.default_rng(zlib.crc32(text.encode("utf-8")))
+    return rng.standard_normal(dims, dtype=np.float32).tolist()
+
+
+def synthetic_bank(
+    size: int, kind: str = "few_shot", dims: int = DEFAULT_DIMS, seed: int = 0, flavor: str = "text"
+) -> Dict[str, Any]:
+    """
+    A few shot or context bank in the pickle format of the embedding pre-processors.
+
+    The embeddings are float32 rows of one random matrix, the components accept any array-like.
+    """
+    if kind not in ("few_shot", "context"):
+        raise ValueError(f"Invalid bank kind: {kind}, must be few_shot or context")
+    rng = random.Random(seed)
+    embeddings = np.random.default_rng(seed).standard_normal((size, dims), dtype=np.float32)
+    data = []
+    for index in range(size):
+        if kind == "few_shot":
+            item = {"user_nl": _sentence(rng), "expected_output": _code(rng, flavor)}
+        else:
+            item = {"context": _sentence(rng, 20, 60)}
+        item["embedding"] = embeddings[index]
+        data.append(item)
+    return {"metadata": {"embedding_model": EMBEDDING_MODEL}, "data": data}
+
+
+def write_bank(path: str, bank: Dict[str, Any]) -> str:
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        pickle.dump(bank, f, protocol=pickle.HIGHEST_PROTOCOL)
+    return path
+
+
+def write_records(path: str, records: List[Dict[str, Any]], file_format: Optional[str] = None) -> str:
+    """Writes the records as jsonl, csv or xml, the format defaults to the extension of the path"""
+    import csv
+    import xml.etree.ElementTree as ET
+
+    file_format = file_format or os.path.splitext(path)[1][1:]
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    if file_format == "jsonl":
+        with open(path, "w", encoding="utf-8") as f:
+            f.writelines(json.dumps(record) + "\n" for record in records)
+    elif file_format == "csv":
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(records[0]) if records else [])
+            writer.writeheader()
+            writer.writerows(records)
+    elif file_format == "xml":
+        root = ET.Element("records")
+        for record in records:
+            element = ET.SubElement(root, "record")
+            for key, value in record.items():
+                ET.SubElement(element, key).text = str(value)
+        ET.ElementTree(root).write(path, encoding="utf-8", xml_declaration=True)
+    else:
+        raise ValueError(f"Invalid records format: {file_format}, must be jsonl, csv or xml")
+    return path
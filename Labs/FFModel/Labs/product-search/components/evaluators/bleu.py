@@ -1,17 +1,18 @@
 # Copyright (c) Microsoft Corporation.
 # Licensed under the MIT License.
 
-import nltk
-from nltk import word_tokenize
-from nltk.translate.bleu_score import modified_precision
-
 from ffmodel.components.base import BaseSolutionComponent
 from ffmodel.data_models.base import ExperimentDataModel
+from utilities.evaluator_cache import cache_results
+from utilities.lazy_import import lazy_import
+from utilities.nltk_resources import PUNKT_RESOURCES, ensure_nltk_resource
+from utilities.text_cache import TextCache, get_text_cache
 
-# download necessary packages to leverage BLEU score function from NLTK
-nltk.download("punkt")
+nltk = lazy_import("nltk")
+bleu_score = lazy_import("nltk.translate.bleu_score")
 
 
+@cache_results
 class Component(BaseSolutionComponent[ExperimentDataModel]):
     """
     BLEU Score evaluator evaluates the quality and precision of text generated completions that have been translated
@@ -27,6 +28,9 @@ class Component(BaseSolutionComponent[ExperimentDataModel]):
         self.n_grams = self.args.get("n_grams", 1)
         self._validate_n_grams()
 
+        # The punkt tokenizer data needed by word_tokenize is resolved locally, it is never downloaded
+        ensure_nltk_resource(PUNKT_RESOURCES)
+
     def _validate_n_grams(self):
         if type(self.n_grams) != int:
             raise ValueError("n_grams must be an integer")
@@ -43,21 +47,34 @@ class Component(BaseSolutionComponent[ExperimentDataModel]):
         n_grams = self.n_grams
         results = {f"bleu_score_ngrams_{n_grams}": []}
 
+        # Tokens are shared with the other evaluators of this data model
+        text_cache = get_text_cache(data_model)
+
         for e_prompt in expected_output:
             for c_prompt in completions:
                 # compute bleu score
-                bleu = self.bleu_score(e_prompt, c_prompt, self.n_grams)
+                bleu = self.bleu_score(e_prompt, c_prompt, self.n_grams, text_cache)
                 results[f"bleu_score_ngrams_{n_grams}"].append(bleu)
 
         data_model.experiment_metrics[self.get_id()] = results
 
         return data_model
 
-    def bleu_score(self, expected_output: str, generated_output: str, n_grams: int) -> float:
+    def bleu_score(
+        self, expected_output: str, generated_output: str, n_grams: int, text_cache: TextCache = None
+    ) -> float:
         """
         Function used to serve as helper for computing modified ngram precision (unigram)
         for a list of prompts using BLEU score module from NLTK.
+
+        When a text cache is given, the tokenized strings are looked up there instead of
+        being tokenized again for every pair.
         """
+        if text_cache is None:
+            text_cache = TextCache()
+
+        expected_tokens = text_cache.get("nltk.word_tokenize", expected_output, nltk.word_tokenize)
+        generated_tokens = text_cache.get("nltk.word_tokenize", generated_output, nltk.word_tokenize)
 
-        score = float(modified_precision([word_tokenize(expected_output)], word_tokenize(generated_output), n_grams))
+        score = float(bleu_score.modified_precision([expected_tokens], generated_tokens, n_grams))
         return score
@@ -3,8 +3,10 @@
 
 from ffmodel.components.base import BaseSolutionComponent
 from ffmodel.data_models.base import ExperimentDataModel
+from utilities.evaluator_cache import cache_results
 
 
+@cache_results
 class Component(BaseSolutionComponent[ExperimentDataModel]):
     """
     Exact Match evaluator returns 1 for an exact string match between a completion and expected output, 0 otherwise.
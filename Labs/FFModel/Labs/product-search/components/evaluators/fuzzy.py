@@ -1,12 +1,31 @@
 # Copyright (c) Microsoft Corporation.
 # Licensed under the MIT License.
 
-from thefuzz import fuzz
+from typing import Dict, List
 
 from ffmodel.components.base import BaseSolutionComponent
 from ffmodel.data_models.base import ExperimentDataModel
+from utilities.evaluator_cache import cache_results
+from utilities.lazy_import import lazy_import
+from utilities.text_cache import get_text_cache
 
+np = lazy_import("numpy")
+fuzz = lazy_import("thefuzz.fuzz")
+utils = lazy_import("thefuzz.utils")
 
+# Ratio methods that run thefuzz's `full_process` on both strings before scoring
+FULL_PROCESS_METHODS = {"token_sort", "token_set"}
+
+ENGINES = ["thefuzz", "rapidfuzz"]
+
+
+def _full_process(text: str) -> str:
+    if text is None:
+        return None
+    return utils.full_process(text, force_ascii=True)
+
+
+@cache_results
 class Component(BaseSolutionComponent[ExperimentDataModel]):
     """
     Fuzzy evaluator calculates the similarity between the prompt and the completions.
@@ -14,10 +33,22 @@ class Component(BaseSolutionComponent[ExperimentDataModel]):
 
     Component config parameters:
         - ratio_methods: The forms of fuzzy difference to calculate. Default is ["simple", "partial"]
+        - engine: The scoring engine, defaults to "thefuzz"
+            - thefuzz: scores each (expected output, completion) pair with a separate thefuzz call
+            - rapidfuzz: scores the full expected output by completion matrix per ratio method
+              with a single rapidfuzz call. When executed in batches, the pairs of all the data models
+              in the batch are scored with a single call per ratio method.
+              The scores and the `experiment_metrics` layout are the same as the thefuzz engine.
+        - workers: Number of threads used by the rapidfuzz engine, -1 uses all cores. Default is 1
     """
 
+    # Assigns its metrics, so a batch that raised runs again in place, see `run_chain_batch` in `utilities/executor.py`
+    batch_retry_safe = True
+
     def _post_init(self):
         self.ratio_methods = self.args.get("ratio_methods", ["simple", "partial"])
+        self.engine = self.args.get("engine", "thefuzz")
+        self.workers = self.args.get("workers", 1)
 
         # Lookup from easy to use short hand to corresponding thefuzz function
         self.ratio_functions = {
@@ -29,6 +60,19 @@ class Component(BaseSolutionComponent[ExperimentDataModel]):
 
         self._validate_ratio_methods()
 
+        if self.engine not in ENGINES:
+            raise ValueError(f"Invalid engine: {self.engine}, must be one of {ENGINES}")
+
+        # Resolve the scoring functions once instead of on every pair
+        if self.engine == "rapidfuzz":
+            from rapidfuzz import fuzz as rapidfuzz_fuzz
+
+            self.scorers = {
+                ratio: getattr(rapidfuzz_fuzz, self.ratio_functions[ratio]) for ratio in self.ratio_methods
+            }
+        else:
+            self.scorers = {ratio: getattr(fuzz, self.ratio_functions[ratio]) for ratio in self.ratio_methods}
+
     def _validate_ratio_methods(self):
         for ratio_method in self.ratio_methods:
             if ratio_method not in self.ratio_functions.keys():
@@ -38,19 +82,123 @@ class Component(BaseSolutionComponent[ExperimentDataModel]):
         """Executes the component for the given data model and returns an
         updated data model."""
 
+        if self.engine == "rapidfuzz":
+            results = self._score_matrix(data_model)
+        else:
+            results = self._score_pairs(data_model)
+
+        data_model.experiment_metrics[self.get_id()] = results
+
+        return data_model
+
+    def execute_batch(self, data_models: List[ExperimentDataModel]) -> List[ExperimentDataModel]:
+        """
+        Executes the component for the given data models.
+
+        With the rapidfuzz engine, the pairs of every data model in the batch are scored
+        with a single call per ratio method.
+        """
+        if self.engine != "rapidfuzz":
+            return super().execute_batch(data_models)
+
+        from rapidfuzz import process
+
+        # Flatten the (expected output, completion) pairs of the batch in the per record layout
+        expected_pairs = {ratio: [] for ratio in self.ratio_methods}
+        completion_pairs = {ratio: [] for ratio in self.ratio_methods}
+        pair_counts = []
+        for data_model in data_models:
+            inputs = self._scorer_inputs(data_model)
+            for ratio in self.ratio_methods:
+                expected_output, completions = inputs[ratio]
+                for e in expected_output:
+                    expected_pairs[ratio].extend([e] * len(completions))
+                    completion_pairs[ratio].extend(completions)
+            pair_counts.append(len(data_model.request.expected_output) * len(data_model.model_output.completions))
+
+        scores = {}
+        for ratio in self.ratio_methods:
+            scores[ratio] = self._normalize_scores(
+                process.cpdist(
+                    expected_pairs[ratio],
+                    completion_pairs[ratio],
+                    scorer=self.scorers[ratio],
+                    dtype=np.float64,
+                    workers=self.workers,
+                )
+            )
+
+        offset = 0
+        for data_model, pair_count in zip(data_models, pair_counts):
+            data_model.experiment_metrics[self.get_id()] = {
+                ratio: scores[ratio][offset : offset + pair_count] for ratio in self.ratio_methods
+            }
+            offset += pair_count
+
+        return data_models
+
+    def _score_pairs(self, data_model: ExperimentDataModel) -> Dict[str, List[float]]:
+        """Scores each (expected output, completion) pair with a thefuzz call"""
         expected_output = data_model.request.expected_output
         completions = data_model.model_output.completions
 
         results = {k: [] for k in self.ratio_methods}
 
+        # Normalized strings are computed once per record and shared with the other evaluators
+        text_cache = get_text_cache(data_model)
+        normalize = any(ratio in FULL_PROCESS_METHODS for ratio in self.ratio_methods)
+
         for e in expected_output:
+            processed_e = text_cache.get("fuzz.full_process", e, _full_process) if normalize else None
             for c in completions:
+                processed_c = text_cache.get("fuzz.full_process", c, _full_process) if normalize else None
                 for ratio in self.ratio_methods:
-                    cmd = getattr(fuzz, self.ratio_functions[ratio])
-                    distance = cmd(e, c) / 100
+                    if ratio in FULL_PROCESS_METHODS:
+                        distance = self.scorers[ratio](processed_e, processed_c, full_process=False) / 100
+                    else:
+                        distance = self.scorers[ratio](e, c) / 100
 
                     results[ratio].append(distance)
 
-        data_model.experiment_metrics[self.get_id()] = results
+        return results
 
-        return data_model
+    def _score_matrix(self, data_model: ExperimentDataModel) -> Dict[str, List[float]]:
+        """Scores the expected output by completion matrix with one rapidfuzz call per ratio method"""
+        from rapidfuzz import process
+
+        results = {}
+        for ratio, (expected_output, completions) in self._scorer_inputs(data_model).items():
+            matrix = process.cdist(
+                expected_output,
+                completions,
+                scorer=self.scorers[ratio],
+                dtype=np.float64,
+                workers=self.workers,
+            )
+            # Row major order matches the expected output x completion loop of the thefuzz engine
+            results[ratio] = self._normalize_scores(matrix.ravel())
+
+        return results
+
+    def _scorer_inputs(self, data_model: ExperimentDataModel) -> Dict[str, tuple]:
+        """Returns the (expected outputs, completions) to score for each ratio method"""
+        expected_output = data_model.request.expected_output
+        completions = data_model.model_output.completions
+
+        processed = None
+        if any(ratio in FULL_PROCESS_METHODS for ratio in self.ratio_methods):
+            text_cache = get_text_cache(data_model)
+            processed = (
+                [text_cache.get("fuzz.full_process", e, _full_process) for e in expected_output],
+                [text_cache.get("fuzz.full_process", c, _full_process) for c in completions],
+            )
+
+        return {
+            ratio: processed if ratio in FULL_PROCESS_METHODS else (expected_output, completions)
+            for ratio in self.ratio_methods
+        }
+
+    @staticmethod
+    def _normalize_scores(scores: "np.ndarray") -> List[float]:
+        """Rounds to integer percentages like thefuzz, then scales to [0, 1]"""
+        return (np.rint(scores) / 100).tolist()
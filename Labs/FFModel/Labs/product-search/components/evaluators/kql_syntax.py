@@ -5,8 +5,10 @@ import re
 
 from ffmodel.components.base import BaseSolutionComponent
 from ffmodel.data_models.base import ExperimentDataModel
+from utilities.evaluator_cache import cache_results
 
 
+@cache_results
 class Component(BaseSolutionComponent[ExperimentDataModel]):
     """Evaluator to check the completions for being valid, non-empty kql"""
 
@@ -2,6 +2,8 @@
 # Copyright (c) Microsoft Corporation.
 # Licensed under the MIT License.
 
+from typing import List
+
 from ffmodel.components.base import BaseSolutionComponent
 from ffmodel.data_models.base import ExperimentDataModel
 from ffmodel.utils.openai import (
@@ -11,8 +13,12 @@ from ffmodel.utils.openai import (
     generate_chat_completion,
     initialize_openai,
 )
+from utilities.evaluator_cache import cache_results
+from utilities.llm_judge import JudgeRunner, JudgeTask, Verdict
+from utilities.openai_async import generate_chat_completion_async
 
 
+@cache_results
 class Component(BaseSolutionComponent[ExperimentDataModel]):
     """
     The LLM evaluator class for evaluating the quality or relevance of the completions using one of the OpenAI LLMs.
@@ -23,6 +29,13 @@ class Component(BaseSolutionComponent[ExperimentDataModel]):
         - api_key_config_name: name of the config value to pull the api key from, defaults to OPENAI_API_KEY
         - api_endpoint_config_name: name of the config value to pull the api endpoint from, defaults to OPENAI_ENDPOINT
         - engine: model to use
+        - max_concurrency: maximum number of scoring calls in flight, within a data model and,
+          when executed in batches, across data models. Defaults to 1
+        - cache_path: path to a SQLite file caching the verdicts, keyed by the instruction file contents,
+          the OpenAI args and the (prompt, expected output, completion) strings. Reruns only pay for new tuples.
+          Defaults to an in-memory cache for the lifetime of the component
+
+    Implements `execute_async`, the scoring calls of a data model then run concurrently on the event loop.
 
     Component Config supporting_data:
         - static_instr_file: Path to the text file containing the static instructions for the prompt.
@@ -36,6 +49,9 @@ class Component(BaseSolutionComponent[ExperimentDataModel]):
         - top_p: 1.0
     """
 
+    # Assigns its metrics, so a batch that raised runs again in place, see `run_chain_batch` in `utilities/executor.py`
+    batch_retry_safe = True
+
     def _post_init(self):
         static_instr_file = self.supporting_data.get("static_instr_file", None)
         if static_instr_file is None:
@@ -49,32 +65,72 @@ class Component(BaseSolutionComponent[ExperimentDataModel]):
         self.openai_config = OpenAIConfig.from_dict(config_names)
         retry_params = self.args.pop("retry_params", {})
         self.retry_params = RetryParameters.from_dict(retry_params)
+        max_concurrency = self.args.pop("max_concurrency", 1)
+        cache_path = self.args.pop("cache_path", None)
 
         self.filtered_kwargs = filter_completion_arguments(self.args)
 
         self.engine = self.args.pop("engine", "engine")
 
+        self.judge = JudgeRunner(
+            self.llm_score_chat,
+            instructions=self.static_instr,
+            model_kwargs=self.filtered_kwargs,
+            max_concurrency=max_concurrency,
+            cache_path=cache_path,
+            namespace=__name__,
+            async_score_function=self.llm_score_chat_async,
+        )
+
         self.call_openai_function = generate_chat_completion
+        self.call_openai_async_function = generate_chat_completion_async
 
     def execute(self, data_model: ExperimentDataModel) -> ExperimentDataModel:
+        """Scores the completions of the data model, see `execute_batch`"""
+        return self.execute_batch([data_model])[0]
+
+    def execute_batch(self, data_models: List[ExperimentDataModel]) -> List[ExperimentDataModel]:
+        """
+        Scores the completions of all the data models, running up to `max_concurrency` calls at once
+        and reusing cached verdicts.
+        """
+        initialize_openai(self.openai_config)
+        verdicts = self.judge.score(self._tasks(data_models))
+        return self._set_results(data_models, verdicts)
+
+    async def execute_async(self, data_model: ExperimentDataModel) -> ExperimentDataModel:
+        """Async version of `execute`, the completions are scored concurrently"""
         initialize_openai(self.openai_config)
+        verdicts = await self.judge.score_async(self._tasks([data_model]))
+        return self._set_results([data_model], verdicts)[0]
 
-        prompt = data_model.request.user_nl
-        expected_output = data_model.request.expected_output
-        completions = data_model.model_output.completions
+    def _tasks(self, data_models: List[ExperimentDataModel]) -> List[JudgeTask]:
+        tasks = []
+        for data_model in data_models:
+            prompt = data_model.request.user_nl
+            expected_output = data_model.request.expected_output
+            completions = data_model.model_output.completions
 
-        results = {"score": [], "explanation": []}
-        if all(x is None for x in completions):
-            raise ValueError("No completions provided.")
+            if all(x is None for x in completions):
+                raise ValueError("No completions provided.")
 
-        for completion in completions:
-            score, explanation = self.llm_score_chat(prompt, expected_output[0], completion)
-            results["score"].append(score)
-            results["explanation"].append(explanation)
+            tasks.extend((prompt, expected_output[0], completion) for completion in completions)
+        return tasks
 
-        data_model.experiment_metrics[self.get_id()] = results
+    def _set_results(
+        self, data_models: List[ExperimentDataModel], verdicts: List[Verdict]
+    ) -> List[ExperimentDataModel]:
+        offset = 0
+        for data_model in data_models:
+            results = {"score": [], "explanation": []}
+            for score, explanation in verdicts[offset : offset + len(data_model.model_output.completions)]:
+                results["score"].append(score)
+                results["explanation"].append(explanation)
+            offset += len(data_model.model_output.completions)
 
-        return data_model
+            data_model.experiment_metrics[self.get_id()] = results
+
+        return data_models
 
     def llm_score_chat(self, user_prompt, expected_output: str, completion: str) -> float:
         """Calculate the llm score between two strings using the chat completion API.
@@ -97,6 +153,20 @@ class Component(BaseSolutionComponent[ExperimentDataModel]):
 
         return score, explanation
 
+    async def llm_score_chat_async(self, user_prompt, expected_output: str, completion: str) -> float:
+        """Async version of `llm_score_chat`"""
+        eval_prompt = self.static_instr.format(
+            prompt=user_prompt, expected_output=expected_output, completion=completion
+        )
+
+        response = await self.call_openai_async_function(
+            self.create_chat_prompt(eval_prompt),
+            retry_parameters=self.retry_params,
+            **self.filtered_kwargs,
+        )
+
+        return self.get_score_exp(response.choices[0].message.content)
+
     def get_score_exp(self, completion):
         """Get the score and explanation from the completion.
 
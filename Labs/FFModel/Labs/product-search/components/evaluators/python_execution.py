@@ -0,0 +1,84 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+import os
+from typing import List
+
+from ffmodel.components.base import BaseSolutionComponent
+from ffmodel.data_models.base import ExperimentDataModel
+from utilities.evaluator_cache import cache_results
+from utilities.sandbox_pool import get_pool
+
+
+@cache_results
+class Component(BaseSolutionComponent[ExperimentDataModel]):
+    """
+    Evaluator to check that the completions are valid Python code that runs without error.
+
+    Completions are executed in a pool of pre-forked, resource limited worker processes
+    (see `utilities/sandbox_pool.py`) that are reused across records, so the interpreter startup
+    is only paid once per worker. Each completion runs after the `import_statements` added to the
+    model state by `components.pre_processors.static_import` and, optionally, the code of the
+    previous turns of the session.
+
+    Metrics, per completion:
+        - syntax-valid: 1 if the completion compiles
+        - runs: 1 if the completion runs without raising within the time limit
+        - wall-time: execution time in seconds, the time limit when it timed out
+
+    Component Args:
+        - workers: number of worker processes, defaults to the number of cores (at most 8)
+        - timeout: time limit per completion in seconds, defaults to 5.0
+        - memory_limit_mb: address space limit of each worker in MB, defaults to 2048
+        - max_tasks_per_worker: completions a worker runs before it is replaced, defaults to 100
+        - preload_modules: modules imported by the workers before running any completion,
+          e.g. ["pandas"], defaults to none
+        - include_session: run the code of the previous turns of the session before the completion,
+          defaults to True
+    """
+
+    # Assigns its metrics, so a batch that raised runs again in place, see `run_chain_batch` in `utilities/executor.py`
+    batch_retry_safe = True
+
+    def _post_init(self):
+        self.include_session = self.args.get("include_session", True)
+        self.pool = get_pool(
+            size=self.args.get("workers", min(os.cpu_count() or 1, 8)),
+            timeout=self.args.get("timeout", 5.0),
+            memory_limit_mb=self.args.get("memory_limit_mb", 2048),
+            max_tasks_per_worker=self.args.get("max_tasks_per_worker", 100),
+            preload_modules=self.args.get("preload_modules", []),
+        )
+
+    def execute(self, data_model: ExperimentDataModel) -> ExperimentDataModel:
+        """Executes the completions of the data model, see `execute_batch`"""
+        return self.execute_batch([data_model])[0]
+
+    def execute_batch(self, data_models: List[ExperimentDataModel]) -> List[ExperimentDataModel]:
+        """Executes the completions of all the data models, running up to `workers` completions at once"""
+        tasks = []
+        for data_model in data_models:
+            setup = self._setup_code(data_model)
+            tasks.extend((completion or "", setup) for completion in data_model.model_output.completions)
+
+        execution_results = self.pool.map(tasks)
+
+        offset = 0
+        for data_model in data_models:
+            results = {k: [] for k in ["syntax-valid", "runs", "wall-time"]}
+            for execution_result in execution_results[offset : offset + len(data_model.model_output.completions)]:
+                results["syntax-valid"].append(int(execution_result.syntax_valid))
+                results["runs"].append(int(execution_result.success))
+                results["wall-time"].append(execution_result.wall_time)
+            offset += len(data_model.model_output.completions)
+
+            data_model.experiment_metrics[self.get_id()] = results
+
+        return data_models
+
+    def _setup_code(self, data_model: ExperimentDataModel) -> str:
+        """Import statements, then the code of the previous turns of the session"""
+        lines = list(data_model.state.component_data.get("import_statements", []))
+        if self.include_session:
+            lines.extend(code for _, code in data_model.state.session)
+        return "\n".join(lines)
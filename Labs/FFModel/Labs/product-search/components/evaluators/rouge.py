@@ -3,12 +3,17 @@
 
 from typing import List
 
-from rouge_score import rouge_scorer
-
 from ffmodel.components.base import BaseSolutionComponent
 from ffmodel.data_models.base import ExperimentDataModel
+from utilities.evaluator_cache import cache_results
+from utilities.lazy_import import lazy_import
+from utilities.text_cache import CachedTokenizer, active_text_cache
+
+rouge_scorer = lazy_import("rouge_score.rouge_scorer")
+tokenizers = lazy_import("rouge_score.tokenizers")
 
 
+@cache_results
 class Component(BaseSolutionComponent[ExperimentDataModel]):
     """
     The base Rouge evaluator class. Estimate the difference between two strings
@@ -26,6 +31,10 @@ class Component(BaseSolutionComponent[ExperimentDataModel]):
 
         self._validate_modes()
 
+        # The scorer is built once, its tokenizer serves tokens from the record's shared text cache
+        self.tokenizer = CachedTokenizer(tokenizers.DefaultTokenizer(use_stemmer=False), "rouge.tokenize")
+        self.scorer = rouge_scorer.RougeScorer(self.modes, tokenizer=self.tokenizer)
+
     def _validate_modes(self):
         valid_modes = ["rouge1", "rougeL"]
 
@@ -39,12 +48,11 @@ class Component(BaseSolutionComponent[ExperimentDataModel]):
         one that is generated, for all defined modes.
         """
 
-        scorer = rouge_scorer.RougeScorer(self.modes, use_stemmer=False)
         results = {f"{k}_{j}": [] for k in self.modes for j in self.mode_score_details}
 
         for e in expected_output:
             for c in completions:
-                score = scorer.score(e, c)
+                score = self.scorer.score(e, c)
 
                 for mode in self.modes:
                     mode_score = score[mode]
@@ -62,7 +70,8 @@ class Component(BaseSolutionComponent[ExperimentDataModel]):
         expected_output = data_model.request.expected_output
         completions = data_model.model_output.completions
 
-        results = self.score(expected_output, completions)
+        with active_text_cache(data_model):
+            results = self.score(expected_output, completions)
         data_model.experiment_metrics[self.get_id()] = results
 
         return data_model
@@ -1,15 +1,19 @@
 # Copyright (c) Microsoft Corporation.
 # Licensed under the MIT License.
 
-from typing import List
-
-import numpy as np
+from typing import Dict, List
 
 from ffmodel.components.base import BaseSolutionComponent
 from ffmodel.data_models.base import ExperimentDataModel
-from ffmodel.utils.openai import OpenAIConfig, get_embedding, initialize_openai
+from ffmodel.utils.openai import OpenAIConfig, RetryParameters, initialize_openai
+from utilities.embeddings import EmbeddingCache, get_embeddings, get_embeddings_async
+from utilities.evaluator_cache import cache_results
+from utilities.lazy_import import lazy_import
+
+np = lazy_import("numpy")
 
 
+@cache_results
 class Component(BaseSolutionComponent[ExperimentDataModel]):
     """
     Semantic Similarity evaluator evaluates the similarity between text generated completions that have been translated
@@ -18,44 +22,107 @@ class Component(BaseSolutionComponent[ExperimentDataModel]):
     The returned value is the cosine similarity between the embedding of the expected output and the generated output.
     The value ranges from 0 to 1, with 1 being an exact match.
 
+    The expected outputs and completions of a data model (or of a whole batch when executed in batches) are
+    embedded with batched calls, and all the pairwise similarities are computed as one normalized matrix product.
+    Implements `execute_async`, the embedding calls then run on the event loop.
+
     Args
     ----
     config (str):  Consists of OpenAI configurations - this should include an API key and/or endpoint
     embedding_model (str): Embedding model to leverage for experimentation. Default setting is `text-embedding-ada-002`
+    retry_params (Dict[str, Any]): Retry parameters for the embedding calls, see the model callers for the keys
+    batch_size (int): Maximum number of texts embedded per call. Default is 16
+    cache_path (str): Path to a SQLite file caching the embeddings by model and text. Since the expected outputs
+        are the same across experiments, sharing this file across the experiments of a sweep means they are only
+        embedded once. Defaults to an in-memory cache for the lifetime of the component
     """
 
+    # Assigns its metrics, so a batch that raised runs again in place, see `run_chain_batch` in `utilities/executor.py`
+    batch_retry_safe = True
+
     def _post_init(self):
         # Initialize the embedding model
         config_names = self.args.pop("config", {})
         self.openai_config = OpenAIConfig.from_dict(config_names)
         initialize_openai(self.openai_config)
 
+        retry_params = self.args.pop("retry_params", {})
+        self.retry_params = RetryParameters.from_dict(retry_params)
+
         # set embedding model
         self.embedding_model = self.args.get("embedding_model", "text-embedding-ada-002")
-        self.call_embedding_function = get_embedding
+        self.call_embeddings_function = get_embeddings
+        self.call_embeddings_async_function = get_embeddings_async
+
+        self.embedding_cache = EmbeddingCache(
+            self.embedding_model,
+            cache_path=self.args.get("cache_path", None),
+            batch_size=self.args.get("batch_size", 16),
+            retry_parameters=self.retry_params,
+            embed_function=self._embed,
+            embed_async_function=self._embed_async,
+        )
+
+    def _embed(self, texts: List[str], model: str, retry_parameters: RetryParameters) -> List[List[float]]:
+        """Embeds the texts that are not cached yet"""
+        initialize_openai(self.openai_config)
+        return self.call_embeddings_function(texts, model, retry_parameters)
+
+    async def _embed_async(self, texts: List[str], model: str, retry_parameters: RetryParameters) -> List[List[float]]:
+        initialize_openai(self.openai_config)
+        return await self.call_embeddings_async_function(texts, model, retry_parameters)
 
     def execute(self, data_model: ExperimentDataModel) -> ExperimentDataModel:
         """
         Executes the component for the given data model and returns an
         updated data model.
         """
+        return self.execute_batch([data_model])[0]
+
+    def execute_batch(self, data_models: List[ExperimentDataModel]) -> List[ExperimentDataModel]:
+        """
+        Executes the component for the given data models, embedding the texts of the whole batch at once.
+        """
+        texts = []
+        for data_model in data_models:
+            texts.extend(data_model.request.expected_output)
+            texts.extend(data_model.model_output.completions)
+
+        embeddings = self.embedding_cache.get_embeddings(texts)
+        return self._set_results(data_models, embeddings)
+
+    async def execute_async(self, data_model: ExperimentDataModel) -> ExperimentDataModel:
+        """Async version of `execute`"""
+        texts = [*data_model.request.expected_output, *data_model.model_output.completions]
+        embeddings = await self.embedding_cache.get_embeddings_async(texts)
+        return self._set_results([data_model], embeddings)[0]
+
+    def _set_results(
+        self, data_models: List[ExperimentDataModel], embeddings: Dict[str, "np.ndarray"]
+    ) -> List[ExperimentDataModel]:
+        for data_model in data_models:
+            results = {"semantic_similarity": self.get_similarity_matrix(data_model, embeddings)}
+            data_model.experiment_metrics[self.get_id()] = results
+
+        return data_models
+
+    def get_similarity_matrix(self, data_model: ExperimentDataModel, embeddings: Dict[str, "np.ndarray"]) -> List[float]:
+        """
+        Computes the cosine similarity of every (expected output, completion) pair of the data model
+        as a single matrix product, flattened in expected output major order.
+        """
+        expected_output = data_model.request.expected_output
+        completions = data_model.model_output.completions
+        if not expected_output or not completions:
+            return []
+
+        expected_matrix = np.vstack([embeddings[e] for e in expected_output])
+        completion_matrix = np.vstack([embeddings[c] for c in completions])
+
+        expected_matrix = expected_matrix / np.linalg.norm(expected_matrix, axis=1, keepdims=True)
+        completion_matrix = completion_matrix / np.linalg.norm(completion_matrix, axis=1, keepdims=True)
 
-        # calculate the embeddings for the expected output and the completions
-        expected_embeddings = [
-            self.call_embedding_function(e, self.embedding_model) for e in data_model.request.expected_output
-        ]
-        completion_embeddings = [
-            self.call_embedding_function(c, self.embedding_model) for c in data_model.model_output.completions
-        ]
-
-        semantic_similarity = []
-        for e in expected_embeddings:
-            for c in completion_embeddings:
-                semantic_similarity.append(self.get_semantic_similarity(e, c))
-
-        results = {"semantic_similarity": semantic_similarity}
-        data_model.experiment_metrics[self.get_id()] = results
-        return data_model
+        return (expected_matrix @ completion_matrix.T).ravel().tolist()
 
     def get_semantic_similarity(self, ground_truth: List[float], prediction: List[float]) -> float:
         """
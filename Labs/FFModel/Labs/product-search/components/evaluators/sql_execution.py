@@ -0,0 +1,139 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+import functools
+from collections import Counter
+from typing import Any, Optional, Tuple
+
+from ffmodel.components.base import BaseSolutionComponent
+from ffmodel.data_models.base import ExperimentDataModel
+from utilities.evaluator_cache import cache_results
+from utilities.lazy_import import lazy_import
+from utilities.sqlite_pool import get_pool
+
+sqlglot = lazy_import("sqlglot")
+
+
+def _normalize_value(value: Any) -> Any:
+    # Aggregates over floats can differ in the last digits depending on the evaluation order
+    if isinstance(value, float):
+        return round(value, 6)
+    return value
+
+
+@cache_results
+class Component(BaseSolutionComponent[ExperimentDataModel]):
+    """
+    Execution accuracy evaluator: runs the expected outputs and the completions against a fixture
+    database and compares their result sets.
+
+    The fixture is an in-memory SQLite database preloaded once per process from the schema/seed
+    script, and shared by pooled read-only connections. The SQL is transpiled from `dialect` to
+    SQLite with sqlglot, the transpilation is memoized by the raw SQL and the execution results
+    by the normalized SQL, so duplicated queries across records are only run once.
+
+    Metrics:
+        - syntax-valid: 1 if the completion parses, per completion
+        - executable: 1 if the completion runs without error within the time limit, per completion
+        - execution-match: 1 if the completion returns the same result set as the expected output,
+          per (expected output, completion) pair
+
+    Component Args:
+        - dialect: sqlglot dialect of the expected outputs and completions, e.g. "tsql". Defaults to SQLite
+        - timeout: time limit per statement in seconds, defaults to 1.0
+        - ignore_order: compare the results as multisets of rows, defaults to True.
+          When False, the row order needs to match as well
+        - memo_size: maximum number of memoized transpilation and execution results, defaults to 10000
+
+    Component Config supporting_data:
+        - database_script: SQL script creating and seeding the fixture database (SQLite syntax)
+    """
+
+    def _post_init(self):
+        database_script = self.supporting_data.get("database_script", None)
+        if database_script is None:
+            raise ValueError("Argument 'database_script' must be provided")
+
+        with open(database_script.file_path) as f:
+            script = f.read()
+
+        self.dialect = self.args.get("dialect", None)
+        self.timeout = self.args.get("timeout", 1.0)
+        self.ignore_order = self.args.get("ignore_order", True)
+        memo_size = self.args.get("memo_size", 10000)
+
+        self.pool = get_pool(script, self.timeout)
+
+        self.transpile = functools.lru_cache(maxsize=memo_size)(self._transpile)
+        self.run_normalized = functools.lru_cache(maxsize=memo_size)(self._run_normalized)
+
+        # Expected outputs that failed to execute, to only warn once about each of them
+        self.failed_expected_outputs = set()
+
+    def execute(self, data_model: ExperimentDataModel) -> ExperimentDataModel:
+        """
+        Executes the component for the given data model and returns an
+        updated data model.
+        """
+        expected_output = data_model.request.expected_output
+        completions = data_model.model_output.completions
+
+        results = {k: [] for k in ["syntax-valid", "executable", "execution-match"]}
+
+        expected_results = []
+        for e in expected_output:
+            expected_result, error = self.run(e)
+            if error is not None and e not in self.failed_expected_outputs:
+                self.failed_expected_outputs.add(e)
+                self.logger.warning(f"Expected output failed to execute on the fixture database: {error}")
+            expected_results.append(expected_result)
+
+        completion_results = []
+        for completion in completions:
+            normalized, _ = self.transpile(completion)
+            completion_result, _ = self.run(completion)
+            results["syntax-valid"].append(int(normalized is not None))
+            results["executable"].append(int(completion_result is not None))
+            completion_results.append(completion_result)
+
+        for expected_result in expected_results:
+            for completion_result in completion_results:
+                match = expected_result is not None and completion_result == expected_result
+                results["execution-match"].append(int(match))
+
+        data_model.experiment_metrics[self.get_id()] = results
+
+        return data_model
+
+    def run(self, sql: Optional[str]) -> Tuple[Any, Optional[str]]:
+        """Returns the comparable result of the SQL and the error message, if any"""
+        normalized, error = self.transpile(sql)
+        if normalized is None:
+            return None, error
+        return self.run_normalized(normalized)
+
+    def _transpile(self, sql: Optional[str]) -> Tuple[Optional[str], Optional[str]]:
+        """Transpiles a single statement to normalized SQLite SQL"""
+        if not sql or not sql.strip():
+            return None, "empty statement"
+        try:
+            statements = sqlglot.transpile(sql, read=self.dialect, write="sqlite")
+        except sqlglot.errors.SqlglotError as e:
+            return None, str(e)
+
+        statements = [statement for statement in statements if statement]
+        if len(statements) != 1:
+            return None, f"expected a single statement, got {len(statements)}"
+        return statements[0], None
+
+    def _run_normalized(self, normalized: str) -> Tuple[Any, Optional[str]]:
+        """Runs normalized SQL and returns its rows, as a multiset when the row order is ignored"""
+        try:
+            _, rows = self.pool.execute(normalized)
+        except Exception as e:
+            return None, str(e)
+
+        rows = [tuple(_normalize_value(value) for value in row) for row in rows]
+        if self.ignore_order:
+            return Counter(rows), None
+        return rows, None
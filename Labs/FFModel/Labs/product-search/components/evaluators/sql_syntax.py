@@ -1,12 +1,27 @@
 # Copyright (c) Microsoft Corporation.
 # Licensed under the MIT License.
 
-import sqlglot
+import functools
 
 from ffmodel.components.base import BaseSolutionComponent
 from ffmodel.data_models.base import ExperimentDataModel
+from utilities.evaluator_cache import cache_results
+from utilities.lazy_import import lazy_import
 
+sqlglot = lazy_import("sqlglot")
 
+
+@functools.lru_cache(maxsize=10000)
+def _is_valid_sql(completion: str) -> int:
+    """Parses the completion once, duplicated completions across records reuse the result"""
+    try:
+        sqlglot.parse_one(completion)
+        return 1
+    except:
+        return 0
+
+
+@cache_results
 class Component(BaseSolutionComponent[ExperimentDataModel]):
     """Evaluator to check the completions for being valid, non-empty SQL"""
 
@@ -22,11 +37,7 @@ class Component(BaseSolutionComponent[ExperimentDataModel]):
 
         for completion in completions:
             results["non-empty"].append(int(len(completion) > 0))
-            try:
-                sqlglot.parse_one(completion)
-                results["syntax-valid"].append(1)
-            except:
-                results["syntax-valid"].append(0)
+            results["syntax-valid"].append(_is_valid_sql(completion))
 
         data_model.experiment_metrics[self.get_id()] = results
 
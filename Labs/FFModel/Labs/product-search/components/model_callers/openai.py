@@ -15,6 +15,7 @@ from ffmodel.utils.openai import (
     generate_completion,
     initialize_openai,
 )
+from utilities.openai_async import generate_completion_async
 
 
 class Component(BaseSolutionComponent[InferenceDataModel[InferenceRequest, ModelState]]):
@@ -22,6 +23,7 @@ class Component(BaseSolutionComponent[InferenceDataModel[InferenceRequest, Model
     OpenAI model caller.
 
     Calls the OpenAI completion endpoint to generate the completion.
+    Implements `execute_async`, so async runners can have many calls in flight without a thread each.
 
     Component Args:
         - config: Dict[str, str], dictionary of config that control the OpenAI API
@@ -53,6 +55,7 @@ class Component(BaseSolutionComponent[InferenceDataModel[InferenceRequest, Model
 
         self.filtered_kwargs = filter_completion_arguments(self.args)
         self.call_openai_function = generate_completion
+        self.call_openai_async_function = generate_completion_async
 
     def execute(
         self, data_model: InferenceDataModel[InferenceRequest, ModelState]
@@ -73,6 +76,29 @@ class Component(BaseSolutionComponent[InferenceDataModel[InferenceRequest, Model
             **self.filtered_kwargs,
         )
 
+        return self._add_completion(data_model, completion)
+
+    async def execute_async(
+        self, data_model: InferenceDataModel[InferenceRequest, ModelState]
+    ) -> InferenceDataModel[InferenceRequest, ModelState]:
+        """Async version of `execute`"""
+        initialize_openai(self.openai_config)
+
+        if not data_model.model_input.prompt:
+            raise ValueError("model_input.prompt must be set")
+
+        completion = await self.call_openai_async_function(
+            prompt=data_model.model_input.prompt,
+            retry_parameters=self.retry_params,
+            **self.filtered_kwargs,
+        )
+
+        return self._add_completion(data_model, completion)
+
+    def _add_completion(
+        self, data_model: InferenceDataModel[InferenceRequest, ModelState], completion
+    ) -> InferenceDataModel[InferenceRequest, ModelState]:
+        """Stores the completions and, for experiments, the token usage of the response"""
         model_outputs = []
         for choice in completion.choices:
             model_outputs.append(choice.text)
@@ -17,13 +17,15 @@ from ffmodel.utils.openai import (
     generate_chat_completion,
     initialize_openai,
 )
+from utilities.openai_async import generate_chat_completion_async
 
 
 class Component(BaseSolutionComponent[InferenceDataModel[InferenceRequest, ModelState]]):
     """
     OpenAI model caller using the chat completion.
 
-    This component assumes that the model_input is a stringified json object with a list of messages
+    This component assumes that the model_input is a stringified json object with a list of messages.
+    Implements `execute_async`, so async runners can have many calls in flight without a thread each.
 
     Component Args:
         - config: Dict[str, str], dictionary of config that control the OpenAI API
@@ -55,6 +57,7 @@ class Component(BaseSolutionComponent[InferenceDataModel[InferenceRequest, Model
 
         self.filtered_kwargs = filter_chat_completion_arguments(self.args)
         self.model_call = generate_chat_completion
+        self.model_call_async = generate_chat_completion_async
 
     def execute(
         self, data_model: InferenceDataModel[InferenceRequest, ModelState]
@@ -67,20 +70,41 @@ class Component(BaseSolutionComponent[InferenceDataModel[InferenceRequest, Model
 
         initialize_openai(self.openai_config)
 
+        completion = self.model_call(
+            self._messages(data_model),
+            retry_parameters=self.retry_params,
+            **self.filtered_kwargs,
+        )
+
+        return self._add_completion(data_model, completion)
+
+    async def execute_async(
+        self, data_model: InferenceDataModel[InferenceRequest, ModelState]
+    ) -> InferenceDataModel[InferenceRequest, ModelState]:
+        """Async version of `execute`"""
+        initialize_openai(self.openai_config)
+
+        completion = await self.model_call_async(
+            self._messages(data_model),
+            retry_parameters=self.retry_params,
+            **self.filtered_kwargs,
+        )
+
+        return self._add_completion(data_model, completion)
+
+    def _messages(self, data_model: InferenceDataModel[InferenceRequest, ModelState]) -> list:
         if not data_model.model_input.prompt:
             raise ValueError("model_input.prompt must be set")
 
         try:
-            messages = json.loads(data_model.model_input.prompt)
+            return json.loads(data_model.model_input.prompt)
         except Exception:
             raise ValueError("model_input.prompt must be a valid json string")
 
-        completion = self.model_call(
-            messages,
-            retry_parameters=self.retry_params,
-            **self.filtered_kwargs,
-        )
-
+    def _add_completion(
+        self, data_model: InferenceDataModel[InferenceRequest, ModelState], completion
+    ) -> InferenceDataModel[InferenceRequest, ModelState]:
+        """Stores the completions and, for experiments, the token usage of the response"""
         model_outputs = []
         for choice in completion.choices:
             model_outputs.append(choice.message.content)
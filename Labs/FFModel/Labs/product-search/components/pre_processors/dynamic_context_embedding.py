@@ -5,8 +5,6 @@ import json
 import os
 import pickle
 
-import numpy as np
-
 from ffmodel.components.base import BaseSolutionComponent
 from ffmodel.data_models.base import InferenceDataModel, InferenceRequest, ModelState
 from ffmodel.utils.openai import (
@@ -15,6 +13,11 @@ from ffmodel.utils.openai import (
     get_embedding,
     initialize_openai,
 )
+from utilities.embeddings import get_embedding_async
+from utilities.lazy_import import lazy_import
+from utilities.neighbours import bank_hash, load_neighbour_table
+
+np = lazy_import("numpy")
 
 REQUIRED_FIELDS = ["context", "embedding"]
 
@@ -54,9 +57,13 @@ class Component(BaseSolutionComponent[InferenceDataModel[InferenceRequest, Model
         - context_file: Path to the pickle file containing the context files.
         - cached_embeddings: Path to a pickle file containing prior embeddings, this follows the format as context_file.
           The idea is to cache the embeddings for your evaluation data set and reuse them when rerunning the experiment.
+        - neighbour_tables: Path to the directory of the neighbour tables precomputed with `utilities/neighbours.py`.
+          When it holds the table of the context bank, the prompts of the table with count <= k are a lookup,
+          without embedding call. Optional
     """
 
     call_embedding_function = get_embedding
+    call_embedding_async_function = get_embedding_async
 
     def get_embedding_with_cache(self, user_nl: str) -> list:
         """
@@ -76,6 +83,16 @@ class Component(BaseSolutionComponent[InferenceDataModel[InferenceRequest, Model
 
         return embedding
 
+    async def get_embedding_with_cache_async(self, user_nl: str) -> list:
+        """Async version of `get_embedding_with_cache`"""
+        embedding = self.cached_embeddings.get(user_nl, None) if self.cached_embeddings else None
+
+        if embedding is None:
+            initialize_openai(self.openai_config)
+            embedding = await Component.call_embedding_async_function(user_nl, self.embedding_model, self.retry_params)
+
+        return embedding
+
     def _load_cached_embeddings(self, cache_file: str):
         data_file = None
         with open(cache_file, "rb") as f:
@@ -95,6 +112,14 @@ class Component(BaseSolutionComponent[InferenceDataModel[InferenceRequest, Model
         self.context_file = context_arg.file_path
         self._load_context()
 
+        # Loads the precomputed neighbours of the context bank
+        self.neighbours = None
+        neighbour_tables_config = self.supporting_data.get("neighbour_tables", None)
+        if neighbour_tables_config:
+            self.neighbours = load_neighbour_table(
+                neighbour_tables_config.file_path, bank_hash(self.embedding_model, self.context_bank)
+            )
+
         # Loads the cached embeddings
         self.cached_embeddings = None
         cached_embeddings_config = self.supporting_data.get("cached_embeddings", None)
@@ -155,15 +180,34 @@ class Component(BaseSolutionComponent[InferenceDataModel[InferenceRequest, Model
         Executes the component for the given data model and returns an
         updated data model.
         """
-        prompt_text = data_model.request.user_nl
-        prompt_embedding = self.get_embedding_with_cache(prompt_text)
+        top_n_index = self.neighbours.lookup(data_model.request.user_nl, self.count) if self.neighbours else None
+        if top_n_index is None:
+            prompt_embedding = self.get_embedding_with_cache(data_model.request.user_nl)
+            top_n_index = self._get_top_n_index(prompt_embedding)
+        return self._add_context(data_model, top_n_index)
 
+    async def execute_async(
+        self, data_model: InferenceDataModel[InferenceRequest, ModelState]
+    ) -> InferenceDataModel[InferenceRequest, ModelState]:
+        """Async version of `execute`, the embedding call runs on the event loop"""
+        top_n_index = self.neighbours.lookup(data_model.request.user_nl, self.count) if self.neighbours else None
+        if top_n_index is None:
+            prompt_embedding = await self.get_embedding_with_cache_async(data_model.request.user_nl)
+            top_n_index = self._get_top_n_index(prompt_embedding)
+        return self._add_context(data_model, top_n_index)
+
+    def _get_top_n_index(self, prompt_embedding: list) -> list:
+        "indices of the top n context strings, closest first"
         # calculate cosine similarity between prompt embedding and context bank embeddings
         cos_sim_ls = self._get_cosine_sim(prompt_embedding)
 
         # find top n context string using cosine similarity
         # Reverse is passed so that the closest match is first
-        top_n_index = sorted(range(len(cos_sim_ls)), key=lambda i: cos_sim_ls[i], reverse=True)[: self.count]
+        return sorted(range(len(cos_sim_ls)), key=lambda i: cos_sim_ls[i], reverse=True)[: self.count]
+
+    def _add_context(
+        self, data_model: InferenceDataModel[InferenceRequest, ModelState], top_n_index: list
+    ) -> InferenceDataModel[InferenceRequest, ModelState]:
         context = [self.context_bank[i] for i in top_n_index]
 
         if self.reverse:
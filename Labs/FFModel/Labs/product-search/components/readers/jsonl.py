@@ -7,12 +7,17 @@ from typing import List
 from ffmodel.components.base import DMT
 from ffmodel.components.base import BaseReaderComponent as BaseReader
 from ffmodel.utils.data_model_util import create_data_models
+from utilities.checkpoint import get_checkpoint
 
 
 class Reader(BaseReader):
     """
     Reader for reading in data that follows a JSONL format.
     Required fields on the data points: nl_prompt, completion.
+
+    Component config:
+        - checkpoint_path: Resume an interrupted run, the records already written by the writer
+          with the same checkpoint_path are skipped, see `utilities/checkpoint.py`. Defaults to None
     """
 
     def execute(self, data: str) -> DMT:
@@ -39,4 +44,11 @@ class Reader(BaseReader):
                 data_points.append(json.loads(line))
 
         data_models = create_data_models(data_points, self.data_model_type)
+
+        checkpoint_path = self.args.get("checkpoint_path") if self.args else None
+        if checkpoint_path:
+            pending = get_checkpoint(checkpoint_path).skip_completed(data_models)
+            self.logger.info(f"Resuming from {checkpoint_path}: {len(data_models) - len(pending)} records already done")
+            data_models = pending
+
         return data_models
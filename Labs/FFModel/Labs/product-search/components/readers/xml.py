@@ -6,11 +6,15 @@ from typing import Any, List
 
 from ffmodel.components.base import DMT
 from ffmodel.components.base import BaseReaderComponent as BaseReader
+from utilities.checkpoint import get_checkpoint
 
 
 class Reader(BaseReader):
     """
     Reader for reading in data that follows an XML format.
+
+    Component config:
+        - checkpoint_path: Resume an interrupted run, see the JSONL reader. Defaults to None
     """
 
     def execute(self, data: Any) -> DMT:
@@ -35,4 +39,11 @@ class Reader(BaseReader):
             data_points.append(record)
 
         data_models = BaseReader.create_data_models(data_points, self.data_model_type)
+
+        checkpoint_path = self.args.get("checkpoint_path") if self.args else None
+        if checkpoint_path:
+            pending = get_checkpoint(checkpoint_path).skip_completed(data_models)
+            self.logger.info(f"Resuming from {checkpoint_path}: {len(data_models) - len(pending)} records already done")
+            data_models = pending
+
         return data_models
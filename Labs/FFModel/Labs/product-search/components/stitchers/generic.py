@@ -3,12 +3,13 @@
 
 import logging
 
-from prompt_engine.interaction import Interaction
-from prompt_engine.model_config import ModelConfig
-from prompt_engine.prompt_engine import PromptEngine, PromptEngineConfig
-
 from ffmodel.components.base import BaseSolutionComponent
 from ffmodel.data_models.base import InferenceDataModel, InferenceRequest, ModelState
+from utilities.lazy_import import lazy_import
+
+interaction = lazy_import("prompt_engine.interaction")
+model_config = lazy_import("prompt_engine.model_config")
+prompt_engine = lazy_import("prompt_engine.prompt_engine")
 
 
 class Component(BaseSolutionComponent[InferenceDataModel[InferenceRequest, ModelState]]):
@@ -47,8 +48,8 @@ class Component(BaseSolutionComponent[InferenceDataModel[InferenceRequest, Model
         self, data_model: InferenceDataModel[InferenceRequest, ModelState]
     ) -> InferenceDataModel[InferenceRequest, ModelState]:
 
-        promptEngineConfig = PromptEngineConfig(
-            ModelConfig(max_tokens=self.max_tokens),
+        promptEngineConfig = prompt_engine.PromptEngineConfig(
+            model_config.ModelConfig(max_tokens=self.max_tokens),
             description_prefix=self.description_prefix,
             description_postfix=self.description_postfix,
             input_prefix=self.prompt_prefix,
@@ -61,14 +62,14 @@ class Component(BaseSolutionComponent[InferenceDataModel[InferenceRequest, Model
         examples = []
         if len(data_model.state.completion_pairs) > 0:
             for (nl, code) in data_model.state.completion_pairs:
-                examples.append(Interaction(nl, code))
+                examples.append(interaction.Interaction(nl, code))
 
         dialog = []
         if len(data_model.state.session) > 0:
             for (nl, code) in data_model.state.session:
-                dialog.append(Interaction(nl, code))
+                dialog.append(interaction.Interaction(nl, code))
 
-        engine = PromptEngine(promptEngineConfig, context, examples, self.flow_reset_text, dialog)
+        engine = prompt_engine.PromptEngine(promptEngineConfig, context, examples, self.flow_reset_text, dialog)
 
         try:
             prompt = engine.build_prompt(data_model.state.user_nl)
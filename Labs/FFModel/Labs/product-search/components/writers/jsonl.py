@@ -1,14 +1,87 @@
 # Copyright (c) Microsoft Corporation.
 # Licensed under the MIT License.
 
+import atexit
+import gzip
+import hashlib
+import io
 import json
 import os
+import threading
+from collections import Counter
 from time import gmtime, strftime
-from typing import List
+from typing import Any, Dict, List
 
 from ffmodel.components.base import BaseWriterComponent
 from ffmodel.core.solution_config import DataConfig
 from ffmodel.data_models.base import ExperimentDataModel
+from utilities.checkpoint import get_checkpoint, request_key
+
+COMPRESSION_EXTENSIONS = {None: "", "gzip": ".gz", "zstd": ".zst"}
+
+# Key of the objects replacing interned strings in the records, see `StringInterner`
+INTERNED_KEY = "__interned__"
+
+# Extension of the side table holding the interned strings, next to the output file
+STRING_TABLE_EXTENSION = ".strings"
+
+
+def open_output(path: str, compression: str, mode: str = "w"):
+    """Opens a text stream to the output file, compressed with gzip or zstd"""
+    if compression is None:
+        return open(path, mode, encoding="utf-8")
+    if compression == "gzip":
+        return gzip.open(path, f"{mode}t", encoding="utf-8", compresslevel=6)
+
+    import zstandard
+
+    # Closing the text wrapper closes the compressor, which closes the file and ends the frame
+    compressor = zstandard.ZstdCompressor(level=10).stream_writer(open(path, f"{mode}b"))
+    return io.TextIOWrapper(compressor, encoding="utf-8")
+
+
+class StringInterner:
+    """
+    Replaces the repeated large strings of the records by references to a side table.
+
+    Strings of at least `min_length` characters are split in lines and each line of at least
+    `min_line_length` characters is stored once in the side table, the string is replaced by
+    `{"__interned__": [...]}` where each item is either the id of an interned line or a literal line.
+    This way the static context, few shot examples or reset texts stitched into every prompt are
+    only written once, while the prompt specific lines stay inline.
+    """
+
+    def __init__(self, table, min_length: int = 256, min_line_length: int = 64):
+        self.table = table
+        self.min_length = min_length
+        self.min_line_length = min_line_length
+        self.ids: Dict[bytes, int] = {}
+
+    def _intern_line(self, line: str) -> int:
+        digest = hashlib.blake2b(line.encode("utf-8"), digest_size=16).digest()
+        string_id = self.ids.get(digest)
+        if string_id is None:
+            string_id = self.ids[digest] = len(self.ids)
+            self.table.write(json.dumps([string_id, line]) + "\n")
+        return string_id
+
+    def _intern_string(self, value: str) -> Any:
+        parts = [
+            self._intern_line(line) if len(line) >= self.min_line_length else line for line in value.split("\n")
+        ]
+        if all(isinstance(part, str) for part in parts):
+            return value
+        return {INTERNED_KEY: parts}
+
+    def intern(self, value: Any) -> Any:
+        """Returns a copy of the value with the large strings replaced"""
+        if isinstance(value, str):
+            return self._intern_string(value) if len(value) >= self.min_length else value
+        if isinstance(value, dict):
+            return {key: self.intern(item) for key, item in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [self.intern(item) for item in value]
+        return value
 
 
 class Writer(BaseWriterComponent[ExperimentDataModel]):
@@ -17,6 +90,20 @@ class Writer(BaseWriterComponent[ExperimentDataModel]):
 
     Component config:
         - output_path: The path to the output file with the appropriate extension (e.g. outputs/output.jsonl).
+        - compression: Compress the output while it is written, "gzip" or "zstd" (needs the zstandard package).
+          The file gets a .gz or .zst extension. Defaults to no compression
+        - intern_strings: Store the repeated large strings (static context, few shots, ...) once in a side
+          table (<output file>.strings.jsonl, compressed like the output) and reference them by id in the
+          records, see `StringInterner`. Defaults to False
+        - intern_min_length: Minimum length of the strings to intern, defaults to 256
+        - checkpoint_path: Resume mode, see `utilities/checkpoint.py`. The output file is not timestamped
+          and is appended to, every record is flushed to disk and marked as completed in the checkpoint
+          as it is written. Restarting the run with the same checkpoint_path on the reader and the writer
+          only processes the remaining records. Each writer needs its own checkpoint_path. Can not be
+          combined with compression or intern_strings, a compressed stream cut by a crash can not be
+          appended to. Defaults to None
+
+    Compressed and interned outputs can be loaded with `result_analysis_utils.load_experiments_outputs`.
     """
 
     def _post_init(self):
@@ -25,20 +112,59 @@ class Writer(BaseWriterComponent[ExperimentDataModel]):
         To ensure uniqueness, we tack the current timestamp onto the end of the file name
         """
         self.output_path = self.args.get("output_path", None)
+        self.compression = self.args.get("compression", None)
+        self.intern_strings = self.args.get("intern_strings", False)
+        self.checkpoint_path = self.args.get("checkpoint_path", None)
 
         if not self.output_path:
             raise ValueError("Missing output_path argument in writer component args.")
 
+        if self.compression not in COMPRESSION_EXTENSIONS:
+            raise ValueError(f"Invalid compression: {self.compression}, must be one of gzip, zstd or None")
+
+        if self.checkpoint_path and (self.compression or self.intern_strings):
+            raise ValueError("checkpoint_path can not be combined with compression or intern_strings")
+
         base = os.path.splitext(self.output_path)[0]
         time_string = strftime("%Y%m%d-%H%M%S", gmtime())
-        self.output_path = f"{base}-{time_string}.jsonl"
+        extension = COMPRESSION_EXTENSIONS[self.compression]
+        # A resumed run appends to the output of the interrupted one
+        self.output_path = f"{base}.jsonl" if self.checkpoint_path else f"{base}-{time_string}.jsonl{extension}"
+        self.checkpoint = None
+        if self.checkpoint_path:
+            self.lock = threading.Lock()
+            self.checkpoint = get_checkpoint(self.checkpoint_path)
+            self.checkpoint.claim(self.output_path)
+            self._recover_output()
 
         # Make sure the directory exists
         if os.path.dirname(self.output_path):
             os.makedirs(os.path.dirname(self.output_path), exist_ok=True)
 
+        # Compressed and interned outputs are written through streams kept open for the whole run
+        self.streamed = bool(self.compression or self.intern_strings)
+        self.output = None
+        self.interner = None
+        if self.streamed:
+            self.lock = threading.Lock()
+            self.output = open_output(self.output_path, self.compression)
+            if self.intern_strings:
+                table_path = f"{base}-{time_string}{STRING_TABLE_EXTENSION}.jsonl{extension}"
+                self.interner = StringInterner(
+                    open_output(table_path, self.compression), min_length=self.args.get("intern_min_length", 256)
+                )
+            atexit.register(self.close)
+
     def execute(self, data_model: ExperimentDataModel) -> ExperimentDataModel:
 
+        if self.checkpoint is not None:
+            self._write_checkpointed([data_model])
+            return data_model
+
+        if self.streamed:
+            self._write_streamed([data_model])
+            return data_model
+
         with open(self.output_path, "a") as f:
             f.write(json.dumps(data_model.to_dict()) + "\n")
 
@@ -50,6 +176,14 @@ class Writer(BaseWriterComponent[ExperimentDataModel]):
         updated data models.
         """
 
+        if self.checkpoint is not None:
+            self._write_checkpointed(data_models)
+            return data_models
+
+        if self.streamed:
+            self._write_streamed(data_models)
+            return data_models
+
         with open(self.output_path, "w") as f:
             for data_model in data_models:
                 f.write(json.dumps(data_model.to_dict()) + "\n")
@@ -57,4 +191,52 @@ class Writer(BaseWriterComponent[ExperimentDataModel]):
         return data_models
 
     def register_experiment_results(self) -> DataConfig:
+        self.close()
         return self._register_experiment_results(file_path=self.output_path)
+
+    def close(self):
+        """Completes the compressed streams, a no-op for plain outputs"""
+        if self.output is None:
+            return
+        with self.lock:
+            if self.interner is not None:
+                self.interner.table.close()
+                self.interner = None
+            self.output.close()
+            self.output = None
+
+    def _write_streamed(self, data_models: List[ExperimentDataModel]):
+        with self.lock:
+            if self.output is None:
+                raise RuntimeError(f"The output {self.output_path} is already closed")
+            for data_model in data_models:
+                record = data_model.to_dict()
+                if self.interner is not None:
+                    record = self.interner.intern(record)
+                self.output.write(json.dumps(record) + "\n")
+
+    def _write_checkpointed(self, data_models: List[ExperimentDataModel]):
+        records = [data_model.to_dict() for data_model in data_models]
+        with self.lock:
+            # The records are on disk before they are marked, see `_recover_output` for a crash in between
+            with open(self.output_path, "a") as f:
+                f.write("".join(json.dumps(record) + "\n" for record in records))
+                f.flush()
+                os.fsync(f.fileno())
+            self.checkpoint.mark(request_key(record["request"]) for record in records)
+
+    def _recover_output(self):
+        """Brings the output of an interrupted run in line with the checkpoint"""
+        if not os.path.exists(self.output_path):
+            return
+
+        with open(self.output_path, "rb+") as f:
+            content = f.read()
+            # Drop the record cut by the crash
+            if content and not content.endswith(b"\n"):
+                content = content[: content.rfind(b"\n") + 1]
+                f.truncate(len(content))
+
+        # Records written but not marked yet, mark them instead of running them again
+        written = Counter(request_key(json.loads(line)["request"]) for line in content.splitlines())
+        self.checkpoint.mark((written - self.checkpoint.completed).elements())
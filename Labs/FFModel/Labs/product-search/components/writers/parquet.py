@@ -0,0 +1,229 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+import atexit
+import json
+import numbers
+import os
+import threading
+from time import gmtime, strftime
+from typing import Any, Dict, List
+
+from components.writers.sqlite import metric_names
+from ffmodel.components.base import BaseWriterComponent
+from ffmodel.core.solution_config import DataConfig
+from ffmodel.data_models.base import ExperimentDataModel
+from utilities.lazy_import import lazy_import
+
+pa = lazy_import("pyarrow")
+pq = lazy_import("pyarrow.parquet")
+
+METRIC_COLUMN_PREFIX = "metrics."
+
+
+def _json_or_none(value: Any) -> str:
+    return json.dumps(value) if value else None
+
+
+def _numeric(values: List[Any]) -> bool:
+    return all(isinstance(value, numbers.Real) or value is None for value in values)
+
+
+class Writer(BaseWriterComponent[ExperimentDataModel]):
+    """
+    Writes the data models into a Parquet file, one row per data model.
+
+    Rows are buffered and written as row groups of `row_group_size` rows while the experiment runs.
+    The file is completed when the experiment results are registered (or when the process exits).
+
+    Columns:
+        - session_id, user_nl: strings
+        - expected_output: list of strings
+        - context: the model state context, list of dictionary encoded strings (the same static
+          context repeated on every row is stored once per row group)
+        - complementary_data, component_data, log: JSON strings
+        - error: string, null when the data model has no error
+        - prompt, completions: the bulky text, the stitched prompt (string) and the completions (list of strings)
+        - metrics.<evaluator>.<metric>: one column per metric with the values of the record,
+          list of doubles for numeric metrics and list of strings otherwise. The metrics are named like
+          with the SQLite writer: after the evaluator module, or after the component path when another
+          component of the record has a module of the same name
+        - extra_metrics: JSON string with the metrics that were not in the first row group, and the values
+          of a numeric metric column that are not numbers (e.g. a status string after numeric scores)
+
+    Reading only the needed columns skips the bulky text, e.g.:
+        pd.read_parquet(path, columns=["session_id", "metrics.fuzzy.simple"])
+
+    Component config:
+        - output_path: The path to the output file with the appropriate extension (e.g. outputs/output.parquet).
+        - row_group_size: Number of rows per row group, defaults to 1000
+        - compression: Parquet compression codec, defaults to "zstd"
+    """
+
+    def _post_init(self):
+        """
+        Get the file name from the config
+        To ensure uniqueness, we tack the current timestamp onto the end of the file name
+        """
+        self.output_path = self.args.get("output_path", None)
+        self.row_group_size = self.args.get("row_group_size", 1000)
+        self.compression = self.args.get("compression", "zstd")
+        self.solution_id = self.get_id().split(".components.")[0]
+
+        if not self.output_path:
+            raise ValueError("Missing output_path argument in writer component args.")
+
+        base = os.path.splitext(self.output_path)[0]
+        time_string = strftime("%Y%m%d-%H%M%S", gmtime())
+        self.output_path = f"{base}-{time_string}.parquet"
+
+        # Make sure the directory exists
+        if os.path.dirname(self.output_path):
+            os.makedirs(os.path.dirname(self.output_path), exist_ok=True)
+
+        self.rows: List[Dict[str, Any]] = []
+        self.schema = None
+        self.parquet_writer = None
+        self.lock = threading.Lock()
+        atexit.register(self.close)
+
+    def execute(self, data_model: ExperimentDataModel) -> ExperimentDataModel:
+        with self.lock:
+            self.rows.append(self._to_row(data_model.to_dict()))
+            if len(self.rows) >= self.row_group_size:
+                self._flush()
+
+        return data_model
+
+    def execute_batch(self, data_models: List[ExperimentDataModel]) -> List[ExperimentDataModel]:
+        """
+        Executes the component for the given data models and returns an
+        updated data models.
+        """
+        with self.lock:
+            for data_model in data_models:
+                self.rows.append(self._to_row(data_model.to_dict()))
+                if len(self.rows) >= self.row_group_size:
+                    self._flush()
+            self._flush()
+
+        return data_models
+
+    def register_experiment_results(self) -> DataConfig:
+        self.close()
+        return self._register_experiment_results(file_path=self.output_path)
+
+    def close(self):
+        """Writes the buffered rows and the file footer, the file can only be read once closed"""
+        with self.lock:
+            self._flush()
+            if self.parquet_writer is not None:
+                self.parquet_writer.close()
+                self.parquet_writer = None
+
+    def _to_row(self, record: Dict[str, Any]) -> Dict[str, Any]:
+        request = record.get("request", {})
+        state = record.get("state", {})
+        error = record.get("error")
+
+        row = {
+            "session_id": (request.get("complementary_data") or {}).get("session_id"),
+            "user_nl": request.get("user_nl"),
+            "expected_output": request.get("expected_output"),
+            "context": state.get("context"),
+            "complementary_data": _json_or_none(request.get("complementary_data")),
+            "component_data": _json_or_none(state.get("component_data")),
+            "log": _json_or_none(record.get("log")),
+            "error": None if error is None else (error if isinstance(error, str) else json.dumps(error, default=str)),
+            "prompt": (record.get("model_input") or {}).get("prompt"),
+            "completions": (record.get("model_output") or {}).get("completions"),
+        }
+        experiment_metrics = record.get("experiment_metrics") or {}
+        for (component_id, metric), name in metric_names(self.solution_id, experiment_metrics).items():
+            values = experiment_metrics[component_id][metric]
+            row[f"{METRIC_COLUMN_PREFIX}{name}"] = values if isinstance(values, list) else [values]
+
+        return row
+
+    def _build_schema(self, rows: List[Dict[str, Any]]):
+        """The schema is fixed by the first row group, metric types are inferred from their values"""
+        fields = [
+            pa.field("session_id", pa.string()),
+            pa.field("user_nl", pa.string()),
+            pa.field("expected_output", pa.list_(pa.string())),
+            pa.field("context", pa.list_(pa.dictionary(pa.int32(), pa.string()))),
+            pa.field("complementary_data", pa.string()),
+            pa.field("component_data", pa.string()),
+            pa.field("log", pa.string()),
+            pa.field("error", pa.string()),
+            pa.field("prompt", pa.string()),
+            pa.field("completions", pa.list_(pa.string())),
+        ]
+
+        metric_types = {}
+        for row in rows:
+            for column, values in row.items():
+                if not column.startswith(METRIC_COLUMN_PREFIX):
+                    continue
+                numeric = _numeric(values)
+                if not numeric or column not in metric_types:
+                    metric_types[column] = pa.list_(pa.float64()) if numeric else pa.list_(pa.string())
+
+        fields.extend(pa.field(column, metric_type) for column, metric_type in metric_types.items())
+        fields.append(pa.field("extra_metrics", pa.string()))
+        return pa.schema(fields)
+
+    def _to_table(self, rows: List[Dict[str, Any]]):
+        known_columns = set(self.schema.names)
+        numeric_columns = [
+            name
+            for name, field_type in zip(self.schema.names, self.schema.types)
+            if name.startswith(METRIC_COLUMN_PREFIX) and pa.types.is_floating(field_type.value_type)
+        ]
+
+        # Metrics that were not part of the first row group can not be added to the schema anymore, and the
+        # values not matching the type of their column would fail the conversion: both go to extra_metrics
+        extra_metrics = []
+        for position, row in enumerate(rows):
+            extra = {name: value for name, value in row.items() if name not in known_columns}
+            mismatched = [name for name in numeric_columns if row.get(name) is not None and not _numeric(row[name])]
+            if mismatched:
+                row = rows[position] = dict(row)
+                for name in mismatched:
+                    extra[name] = row.pop(name)
+            extra_metrics.append(_json_or_none(extra))
+
+        columns = {name: [row.get(name) for row in rows] for name in self.schema.names}
+        columns["extra_metrics"] = extra_metrics
+        for name, field_type in zip(self.schema.names, self.schema.types):
+            if name.startswith(METRIC_COLUMN_PREFIX) and pa.types.is_string(field_type.value_type):
+                columns[name] = [
+                    None if values is None else [None if value is None else str(value) for value in values]
+                    for values in columns[name]
+                ]
+
+        arrays = []
+        for name, field_type in zip(self.schema.names, self.schema.types):
+            if name == "context":
+                # Dictionary encode the strings of the lists, the context is mostly the same on every row
+                contexts = pa.array(columns[name], type=pa.list_(pa.string()))
+                arrays.append(
+                    pa.ListArray.from_arrays(
+                        contexts.offsets, contexts.flatten().dictionary_encode(), mask=contexts.is_null()
+                    )
+                )
+            else:
+                arrays.append(pa.array(columns[name], type=field_type))
+
+        return pa.Table.from_arrays(arrays, schema=self.schema)
+
+    def _flush(self):
+        if not self.rows:
+            return
+
+        if self.parquet_writer is None:
+            self.schema = self._build_schema(self.rows)
+            self.parquet_writer = pq.ParquetWriter(self.output_path, self.schema, compression=self.compression)
+
+        self.parquet_writer.write_table(self._to_table(self.rows), row_group_size=len(self.rows))
+        self.rows = []
@@ -0,0 +1,220 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+import atexit
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from time import gmtime, strftime
+from typing import Any, Dict, List, Tuple
+
+from ffmodel.components.base import BaseWriterComponent
+from ffmodel.core.solution_config import DataConfig
+from ffmodel.data_models.base import ExperimentDataModel
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    solution_id TEXT,
+    created_at REAL NOT NULL,
+    config TEXT
+);
+
+CREATE TABLE IF NOT EXISTS records (
+    record_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id TEXT NOT NULL REFERENCES runs(run_id),
+    record_index INTEGER NOT NULL,
+    session_id TEXT,
+    user_nl TEXT,
+    expected_output TEXT,
+    completions TEXT,
+    error TEXT,
+    data_model TEXT
+);
+
+CREATE TABLE IF NOT EXISTS metrics (
+    record_id INTEGER NOT NULL REFERENCES records(record_id),
+    run_id TEXT NOT NULL,
+    session_id TEXT,
+    metric TEXT NOT NULL,
+    value REAL,
+    "values" TEXT
+);
+
+CREATE INDEX IF NOT EXISTS records_run_id ON records(run_id, record_index);
+CREATE INDEX IF NOT EXISTS records_session_id ON records(session_id);
+CREATE INDEX IF NOT EXISTS metrics_run_id ON metrics(run_id, metric);
+-- Covers the per session comparisons of runs, e.g. the best run per session for a metric
+CREATE INDEX IF NOT EXISTS metrics_metric_session ON metrics(metric, session_id, run_id, value);
+"""
+
+
+def metric_name(component_id: str, metric: str) -> str:
+    """Metrics are named after the evaluator module, e.g. `fuzzy.simple`, like `result_analysis_utils`"""
+    return f"{component_id.rsplit('.', 1)[-1]}.{metric}"
+
+
+def metric_names(solution_id: str, experiment_metrics: Dict[str, Dict[str, Any]]) -> Dict[Tuple[str, str], str]:
+    """
+    Names the metrics of a record, by (component id, metric). A metric named like one of a previous component
+    (e.g. two modules named `fuzzy` in different packages) is named after the component path instead, without
+    the solution id, e.g. `my_components.evaluators.fuzzy.simple`, so a record has one value per metric name.
+    """
+    names = {}
+    for component_id, metrics in experiment_metrics.items():
+        # Reserved keys, e.g. the instrumentation of the components, are not metrics
+        if component_id.startswith("_"):
+            continue
+        for metric in metrics:
+            name = metric_name(component_id, metric)
+            if name in names.values():
+                prefix = f"{solution_id}."
+                path = component_id[len(prefix) :] if component_id.startswith(prefix) else component_id
+                name = f"{path}.{metric}"
+            names[component_id, metric] = name
+    return names
+
+
+def _max_numeric(values: List[Any]) -> float:
+    numbers = [value for value in values if isinstance(value, (int, float))]
+    return max(numbers) if numbers else None
+
+
+def connect(database_path: str, timeout: float = 30.0) -> sqlite3.Connection:
+    """Opens the results database in WAL mode, so analysis can read while experiments write"""
+    if os.path.dirname(database_path):
+        os.makedirs(os.path.dirname(database_path), exist_ok=True)
+
+    connection = sqlite3.connect(database_path, timeout=timeout, check_same_thread=False)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    connection.executescript(SCHEMA)
+    return connection
+
+
+class Writer(BaseWriterComponent[ExperimentDataModel]):
+    """
+    Appends the data models to a SQLite database shared by all the experiment runs.
+
+    Each run gets a row in the `runs` table, each data model a row in `records`, and each metric
+    of each data model a row in `metrics`, with the max over the completions in `value` and the
+    values of every completion, as JSON, in `values`. The records and metrics are indexed by run id,
+    session id and metric name, so comparing runs (e.g. `best_runs_per_session` in the result
+    analysis utilities) is an indexed lookup instead of a scan of every output file.
+
+    Rows are buffered and inserted in one transaction per `batch_size` data models.
+
+    Component config:
+        - database_path: The path to the SQLite database, e.g. outputs/results.db
+        - run_id: Name of the run, defaults to the solution id with a timestamp and a random suffix. Raises
+          when the database already has a run with this id, the records of two runs are never mixed
+        - run_config: Dictionary stored with the run, e.g. the hyperparameters of a sweep variant
+        - batch_size: Number of data models per insert transaction, defaults to 100
+        - store_data_model: Also store the full data model as JSON, defaults to False
+    """
+
+    def _post_init(self):
+        self.database_path = self.args.get("database_path", None)
+        if not self.database_path:
+            raise ValueError("Missing database_path argument in writer component args.")
+
+        self.solution_id = self.get_id().split(".components.")[0]
+        time_string = strftime("%Y%m%d-%H%M%S", gmtime())
+        self.run_id = self.args.get("run_id", f"{self.solution_id}-{time_string}-{uuid.uuid4().hex[:8]}")
+        self.batch_size = self.args.get("batch_size", 100)
+        self.store_data_model = self.args.get("store_data_model", False)
+
+        self.connection = connect(self.database_path)
+        try:
+            with self.connection:
+                self.connection.execute(
+                    "INSERT INTO runs (run_id, solution_id, created_at, config) VALUES (?, ?, ?, ?)",
+                    (self.run_id, self.solution_id, time.time(), json.dumps(self.args.get("run_config", {}))),
+                )
+        except sqlite3.IntegrityError:
+            self.connection.close()
+            self.connection = None
+            raise ValueError(f"The run {self.run_id} already exists in {self.database_path}, use another run_id")
+
+        self.pending: List[Dict[str, Any]] = []
+        self.record_index = 0
+        self.lock = threading.Lock()
+        atexit.register(self.close)
+
+    def execute(self, data_model: ExperimentDataModel) -> ExperimentDataModel:
+        with self.lock:
+            self.pending.append(data_model.to_dict())
+            if len(self.pending) >= self.batch_size:
+                self._flush()
+
+        return data_model
+
+    def execute_batch(self, data_models: List[ExperimentDataModel]) -> List[ExperimentDataModel]:
+        """
+        Executes the component for the given data models and returns an
+        updated data models.
+        """
+        with self.lock:
+            for data_model in data_models:
+                self.pending.append(data_model.to_dict())
+                if len(self.pending) >= self.batch_size:
+                    self._flush()
+            self._flush()
+
+        return data_models
+
+    def register_experiment_results(self) -> DataConfig:
+        self.close()
+        return self._register_experiment_results(file_path=self.database_path)
+
+    def close(self):
+        with self.lock:
+            if self.connection is None:
+                return
+            self._flush()
+            self.connection.close()
+            self.connection = None
+
+    def _flush(self):
+        if not self.pending:
+            return
+
+        with self.connection:
+            for record in self.pending:
+                request = record.get("request", {})
+                session_id = (request.get("complementary_data") or {}).get("session_id")
+                error = record.get("error")
+                cursor = self.connection.execute(
+                    "INSERT INTO records (run_id, record_index, session_id, user_nl, expected_output, completions, "
+                    "error, data_model) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        self.run_id,
+                        self.record_index,
+                        session_id,
+                        request.get("user_nl"),
+                        json.dumps(request.get("expected_output")),
+                        json.dumps((record.get("model_output") or {}).get("completions")),
+                        None if error is None else str(error),
+                        json.dumps(record) if self.store_data_model else None,
+                    ),
+                )
+                self.record_index += 1
+
+                experiment_metrics = record.get("experiment_metrics") or {}
+                metric_rows = []
+                for (component_id, metric), name in metric_names(self.solution_id, experiment_metrics).items():
+                    values = experiment_metrics[component_id][metric]
+                    values = values if isinstance(values, list) else [values]
+                    metric_rows.append(
+                        (cursor.lastrowid, self.run_id, session_id, name, _max_numeric(values), json.dumps(values))
+                    )
+                self.connection.executemany(
+                    'INSERT INTO metrics (record_id, run_id, session_id, metric, value, "values") '
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    metric_rows,
+                )
+
+        self.pending = []
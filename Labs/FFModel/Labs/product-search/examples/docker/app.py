@@ -4,6 +4,7 @@
 # Licensed under the MIT License.
 
 import json
+import os
 import uuid
 
 from flask import Flask, request
@@ -43,4 +44,4 @@ def inference() -> str:
     return json.dumps(response.to_dict())
 
 
-app.run(host="0.0.0.0", port=8080)
+app.run(host="0.0.0.0", port=int(os.environ.get("PORT", "8080")))
@@ -0,0 +1,31 @@
+-- Stand-in database for the execution based evaluator (components.evaluators.sql_execution).
+-- Mirrors the tables the nl2sql dataset asks about, with a small deterministic seed.
+
+CREATE TABLE Customers (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    Country TEXT NOT NULL
+);
+
+CREATE TABLE orders (
+    id INTEGER PRIMARY KEY,
+    customer_id INTEGER NOT NULL REFERENCES Customers(id),
+    price REAL NOT NULL
+);
+
+INSERT INTO Customers (id, name, Country) VALUES
+    (1, 'Ana Trujillo', 'Mexico'),
+    (2, 'Antonio Moreno', 'Mexico'),
+    (3, 'Thomas Hardy', 'UK'),
+    (4, 'Christina Berglund', 'Sweden'),
+    (5, 'Hanna Moos', 'Germany'),
+    (6, 'Frederique Citeaux', 'France');
+
+INSERT INTO orders (id, customer_id, price) VALUES
+    (1, 1, 12.5),
+    (2, 1, 40.0),
+    (3, 3, 7.25),
+    (4, 4, 99.99),
+    (5, 5, 15.0),
+    (6, 6, 23.4),
+    (7, 3, 5.0);
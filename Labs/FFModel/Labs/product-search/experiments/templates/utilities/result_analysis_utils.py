@@ -1,98 +1,569 @@
 # Copyright (c) Microsoft Corporation.
 # Licensed under the MIT License.
 
+import contextlib
+import gzip
+import hashlib
+import io
+import json
 import os
+import re
+import sqlite3
+from array import array
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import List
+from typing import Any, Dict, List, Optional, Sequence
 
+import numpy as np
 import pandas as pd
 
+# Key of the parquet schema metadata listing the nested columns stored as JSON strings
+_JSON_COLUMNS_METADATA_KEY = b"ffmodel.json_columns"
 
-def load_experiments_outputs(outputs_dir: str) -> pd.DataFrame:
+
+# Experiment outputs written by `components.writers.jsonl`, plain or compressed
+_OUTPUT_SUFFIXES = (".jsonl.gz", ".jsonl.zst", ".jsonl")
+
+# Side table of the interned strings, `<experiment>.strings.jsonl[.gz|.zst]` next to the output
+_STRING_TABLE_SUFFIX = ".strings"
+
+# Key of the objects replacing the interned strings in the records
+_INTERNED_KEY = "__interned__"
+
+
+def _experiment_name(path: str) -> str:
+    """The output file name without the .jsonl and compression extensions"""
+    name = os.path.basename(path)
+    for suffix in _OUTPUT_SUFFIXES:
+        if name.endswith(suffix):
+            return name[: -len(suffix)]
+    return Path(path).stem
+
+
+def _open_text(path: str):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8")
+    if path.endswith(".zst"):
+        import zstandard
+
+        # The writer may have appended several frames
+        reader = zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), read_across_frames=True, closefd=True)
+        return io.TextIOWrapper(reader, encoding="utf-8")
+    return open(path, encoding="utf-8")
+
+
+def _load_string_table(path: str) -> Optional[Dict[int, str]]:
+    """Loads the side table of the interned strings of an output, None when the strings were not interned"""
+    name = _experiment_name(path)
+    suffix = os.path.basename(path)[len(name) :]
+    table_path = os.path.join(os.path.dirname(path), f"{name}{_STRING_TABLE_SUFFIX}{suffix}")
+    if not os.path.exists(table_path):
+        return None
+
+    table = {}
+    with _open_text(table_path) as f:
+        for line in f:
+            if line.strip():
+                string_id, string = json.loads(line)
+                table[string_id] = string
+    return table
+
+
+def _resolve_interned(value: Any, table: Dict[int, str]) -> Any:
+    if isinstance(value, dict):
+        if len(value) == 1 and _INTERNED_KEY in value:
+            return "\n".join(table[part] if isinstance(part, int) else part for part in value[_INTERNED_KEY])
+        return {key: _resolve_interned(item, table) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_resolve_interned(item, table) for item in value]
+    return value
+
+
+def _read_records(path: str, columns: Optional[List[str]]):
+    """Yields the records of a JSONL file, projected to the given top level columns"""
+    table = _load_string_table(path)
+    with _open_text(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if columns is not None:
+                record = {column: record.get(column) for column in columns}
+            if table is not None:
+                record = _resolve_interned(record, table)
+            yield record
+
+
+def _parse_experiment_output(path: str, columns: Optional[List[str]]) -> pd.DataFrame:
+    """Parses an experiment output file and adds the experiment, session id and expected output columns"""
+    # The request is always needed to derive the session id and expected output columns
+    read_columns = None if columns is None else list(dict.fromkeys(["request", *columns]))
+    df = pd.DataFrame.from_records(_read_records(path, read_columns), columns=read_columns)
+
+    # Single pass over the request column, json_normalize deep copies every record
+    requests = [request or {} for request in df["request"]] if "request" in df else [{}] * len(df)
+    session_ids = [(request.get("complementary_data") or {}).get("session_id") for request in requests]
+    expected_outputs = [request.get("expected_output") for request in requests]
+    if columns is not None and "request" not in columns:
+        df = df.drop(columns="request")
+
+    df.insert(0, "session_id", session_ids)
+    df.insert(0, "experiment", _experiment_name(path))
+    df.insert(0, "expected_output", expected_outputs)
+    return df
+
+
+def _columns_key(columns: Optional[List[str]]) -> str:
+    return hashlib.sha1(json.dumps(columns).encode("utf-8")).hexdigest()[:8]
+
+
+def _cache_path(cache_dir: str, path: str, columns: Optional[List[str]]) -> str:
+    stat = os.stat(path)
+    return os.path.join(
+        cache_dir, f"{_experiment_name(path)}.{stat.st_mtime_ns}-{stat.st_size}.{_columns_key(columns)}.parquet"
+    )
+
+
+def _write_parquet_cache(df: pd.DataFrame, cache_path: str):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    # Nested values (dicts and lists) are stored as JSON strings, parquet needs a fixed schema per column
+    json_columns = [
+        column
+        for column in df.columns
+        if df[column].dtype == object and df[column].map(lambda value: isinstance(value, (dict, list))).any()
+    ]
+    encoded = df.copy()
+    for column in json_columns:
+        encoded[column] = [json.dumps(value) for value in encoded[column]]
+
+    table = pa.Table.from_pandas(encoded, preserve_index=False)
+    metadata = {**(table.schema.metadata or {}), _JSON_COLUMNS_METADATA_KEY: json.dumps(json_columns).encode("utf-8")}
+
+    # Write under a temporary name so a concurrent or interrupted session never reads a partial file
+    partial_path = f"{cache_path}.{os.getpid()}.partial"
+    pq.write_table(table.replace_schema_metadata(metadata), partial_path)
+    os.replace(partial_path, cache_path)
+
+
+def _read_parquet_cache(cache_path: str) -> pd.DataFrame:
+    import pyarrow.parquet as pq
+
+    table = pq.read_table(cache_path)
+    json_columns = json.loads((table.schema.metadata or {}).get(_JSON_COLUMNS_METADATA_KEY, b"[]"))
+
+    df = table.drop_columns(json_columns).to_pandas()
+    for column in json_columns:
+        # Decoding the whole column as a single JSON array is much faster than decoding value by value
+        df[column] = json.loads("[" + ",".join(table.column(column).to_pylist()) + "]")
+    return df[table.column_names]
+
+
+def _load_experiment_output(path: str, columns: Optional[List[str]], cache_dir: Optional[str]):
+    """
+    Loads an experiment output file, through the parquet cache when enabled.
+
+    With the cache, the parsed file is written as parquet and its path is returned instead of the
+    DataFrame: reading the parquet file is cheaper than sending the DataFrame between processes.
+    """
+    if cache_dir is None:
+        return _parse_experiment_output(path, columns)
+
+    cache_path = _cache_path(cache_dir, path, columns)
+    if not os.path.exists(cache_path):
+        # Drop the caches of previous versions of the file
+        stale_pattern = re.compile(rf"{re.escape(_experiment_name(path))}\.\d+-\d+\.{_columns_key(columns)}\.parquet")
+        for stale in Path(cache_dir).iterdir():
+            if stale_pattern.fullmatch(stale.name):
+                stale.unlink(missing_ok=True)
+        _write_parquet_cache(_parse_experiment_output(path, columns), cache_path)
+    return cache_path
+
+
+def _list_experiment_outputs(outputs_dir: str) -> List[str]:
+    paths = sorted(
+        os.path.join(outputs_dir, name)
+        for name in os.listdir(outputs_dir)
+        if name.endswith(_OUTPUT_SUFFIXES) and not _experiment_name(name).endswith(_STRING_TABLE_SUFFIX)
+    )
+    if not paths:
+        raise ValueError(f"No experiment outputs (.jsonl, .jsonl.gz or .jsonl.zst files) found in {outputs_dir}")
+    return paths
+
+
+def load_parquet_outputs(outputs_dir: str, columns: List[str] = None) -> pd.DataFrame:
+    """
+    Given a folder with the Parquet outputs from FFModel experiments (`components.writers.parquet`),
+    load them into a Panda DataFrame.
+
+    Only the requested columns are read from disk, e.g. ["session_id", "metrics.fuzzy.simple"]
+    skips the prompts and completions.
+
+    Parameters:
+    outputs_dir (str): The path to the directory holding the experiments outputs.
+    columns (List[str]): The columns to read, defaults to all the columns.
+
+    Returns
+    -------
+    pd.DataFrame: Output results with an additional experiment column.
+    """
+    paths = sorted(Path(outputs_dir).glob("*.parquet"))
+    if not paths:
+        raise ValueError(f"No experiment outputs (.parquet files) found in {outputs_dir}")
+
+    dfs = []
+    for path in paths:
+        df = pd.read_parquet(path, columns=columns)
+        df.insert(0, "experiment", path.stem)
+        dfs.append(df)
+
+    return pd.concat(dfs)
+
+
+def _connect_read_only(database_path: str) -> sqlite3.Connection:
+    if not os.path.exists(database_path):
+        raise ValueError(f"No results database found at {database_path}")
+    return sqlite3.connect(f"file:{database_path}?mode=ro", uri=True)
+
+
+def load_sqlite_metrics(database_path: str, metrics: List[str] = None, run_ids: List[str] = None) -> pd.DataFrame:
+    """
+    Loads the metrics stored by the SQLite writer (`components.writers.sqlite`) into a Panda DataFrame,
+    one row per record with the max over completions of each metric, like `extract_metrics`.
+
+    Parameters:
+    database_path (str): The path to the results database.
+    metrics (List[str]): The metrics to load, e.g. ["fuzzy.simple"], defaults to all the metrics.
+    run_ids (List[str]): The runs to load, defaults to all the runs.
+
+    Returns
+    -------
+    pd.DataFrame: One row per record with the experiment (run id), session id and a column per metric.
+    """
+    conditions, parameters = [], []
+    for column, values in (("metric", metrics), ("run_id", run_ids)):
+        if values:
+            conditions.append(f"{column} IN ({','.join('?' * len(values))})")
+            parameters.extend(values)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    with contextlib.closing(_connect_read_only(database_path)) as connection:
+        df = pd.read_sql_query(
+            f"SELECT record_id, run_id AS experiment, session_id, metric, value FROM metrics {where}",
+            connection,
+            params=parameters,
+        )
+
+    # Databases written before the metrics of the components sharing a module name were told apart can hold
+    # several values of a metric for a record, keep the max like for the completions
+    df = df.groupby(["record_id", "experiment", "session_id", "metric"], dropna=False)["value"].max().unstack("metric")
+    df = df.reset_index().drop(columns="record_id")
+    df.columns.name = None
+    return df
+
+
+def best_runs_per_session(database_path: str, metric: str) -> pd.DataFrame:
+    """
+    Finds the run with the best mean of a metric for each session, from the SQLite writer database.
+
+    The query is answered from the (metric, session_id, run_id, value) index of the metrics table.
+
+    Parameters:
+    database_path (str): The path to the results database.
+    metric (str): The metric to rank the runs with, e.g. "fuzzy.simple".
+
+    Returns
+    -------
+    pd.DataFrame: One row per session with the best run id, its mean score, number of records and run config.
+    """
+    query = """
+        WITH per_run AS (
+            SELECT session_id, run_id, AVG(value) AS score, COUNT(*) AS records
+            FROM metrics
+            WHERE metric = ?
+            GROUP BY session_id, run_id
+        ),
+        ranked AS (
+            SELECT *, ROW_NUMBER() OVER (PARTITION BY session_id ORDER BY score DESC) AS rank
+            FROM per_run
+        )
+        SELECT ranked.session_id, ranked.run_id, ranked.score, ranked.records, runs.config
+        FROM ranked JOIN runs ON runs.run_id = ranked.run_id
+        WHERE ranked.rank = 1
+        ORDER BY ranked.session_id
+    """
+    with contextlib.closing(_connect_read_only(database_path)) as connection:
+        df = pd.read_sql_query(query, connection, params=[metric])
+
+    df["config"] = [json.loads(config) if config else {} for config in df["config"]]
+    return df
+
+
+def _parquet_available() -> bool:
+    try:
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def load_experiments_outputs(
+    outputs_dir: str, columns: List[str] = None, processes: int = None, cache: bool = True
+) -> pd.DataFrame:
     """
     Given a folder with the JSONL outputs from FFModel experiments, load them into a Panda DataFrame.
 
+    The files are parsed in parallel, one process per file. Parsed files are cached as parquet in
+    `<outputs_dir>/.cache`, keyed by the modification time and size of each file, so loading the
+    same outputs again (e.g. in a new notebook session) skips the JSON parsing.
+    The cache needs pyarrow, it is disabled when pyarrow is not installed.
+    Compressed outputs (.jsonl.gz, .jsonl.zst) are read as well, and the interned strings of the
+    outputs written with `intern_strings` are restored from their side table.
+
     Parameters:
     outputs_dir (str): The path to the directory holding the experiments outputs.
+    columns (List[str]): Top level data model fields to load, e.g. ["request", "experiment_metrics"].
+        Loading only the needed fields saves memory on large outputs. Defaults to all the fields.
+    processes (int): Number of processes parsing the files, defaults to one per core.
+    cache (bool): Whether to use the parquet cache.
 
     Returns
     -------
     pd.DataFrame: Output results loaded and stored as a DataFrame.
     """
 
-    experiments = []
+    paths = _list_experiment_outputs(outputs_dir)
 
-    for exp in os.listdir(outputs_dir):
-        if exp[-6:] == ".jsonl" and exp:
-            experiments.append(Path(f"{exp}"))
+    cache_dir = None
+    if cache and _parquet_available():
+        cache_dir = os.path.join(outputs_dir, ".cache")
+        os.makedirs(cache_dir, exist_ok=True)
 
-    # load each experiment
-    dfs = []
-    for path in experiments:
-        df = pd.read_json(os.path.join(outputs_dir, Path(path)), lines=True)
-        session_ids = [df.iloc[idx]["request"]["complementary_data"]["session_id"] for idx, _ in df.iterrows()]
-        expected_output = [df.iloc[idx]["request"]["expected_output"] for idx, _ in df.iterrows()]
-        df.insert(0, "session_id", session_ids)
-        df.insert(0, "experiment", path.stem)
-        df.insert(0, "expected_output", expected_output)
-        dfs.append(df)
+    processes = min(processes or os.cpu_count() or 1, len(paths))
+    if processes > 1:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            loaded = list(
+                executor.map(_load_experiment_output, paths, [columns] * len(paths), [cache_dir] * len(paths))
+            )
+    else:
+        loaded = [_load_experiment_output(path, columns, cache_dir) for path in paths]
+
+    dfs = [_read_parquet_cache(item) if isinstance(item, str) else item for item in loaded]
 
     # concatenate dfs to single df
     df = pd.concat(dfs)
     return df
 
 
-def extract_metrics(df: pd.DataFrame, metrics: List[str] = None):
+_NUMBER_TYPES = (int, float, np.number)
+
+
+def _reduce_values(values: Any, reduce: str) -> Any:
+    """Reduces the per completion values of a metric to a single value, None when there are none"""
+    if not isinstance(values, list):
+        return values
+    if len(values) == 1:
+        return values[0]
+
+    # Fast path for complete numeric values, the common case
+    try:
+        if reduce == "max":
+            return max(values)
+        if reduce == "mean":
+            return sum(values) / len(values)
+    except (TypeError, ValueError, ZeroDivisionError):
+        pass
+
+    values = [value for value in values if value is not None]
+    if not values:
+        return None
+    if reduce == "first" or not all(isinstance(value, _NUMBER_TYPES) for value in values):
+        return values[0]
+    return max(values) if reduce == "max" else sum(values) / len(values)
+
+
+def extract_metric_columns(
+    experiment_metrics: Sequence[Dict[str, Dict[str, Any]]], metrics: List[str] = None, reduce: str = "max"
+) -> Dict[str, np.ndarray]:
+    """
+    Flattens the `experiment_metrics` of each record into one array per metric.
+
+    Metrics are named `<evaluator module>.<metric>`, e.g. `fuzzy.simple`. The values of each record
+    (one per completion, or per expected output and completion pair) are reduced to a single value.
+    Records without a metric get an explicit null: NaN in numeric arrays, None otherwise.
+
+    Parameters:
+    experiment_metrics (Sequence[Dict]): The `experiment_metrics` of each record.
+    metrics (List[str]): The metrics to extract, defaults to every metric found.
+        Requested metrics that no record has are returned as all null arrays.
+    reduce (str): How to reduce the values of a record: "max" (max over completions), "mean" or "first".
+
+    Returns
+    -------
+    Dict[str, np.ndarray]: A float64 array per numeric metric and an object array per non-numeric metric.
+    """
+    if reduce not in ("max", "mean", "first"):
+        raise ValueError(f"Invalid reduce: {reduce}, must be one of max, mean or first")
+
+    wanted = set(metrics) if metrics is not None else None
+    size = len(experiment_metrics)
+    columns: Dict[str, List[Any]] = {name: [None] * size for name in metrics or []}
+    non_numeric = set()
+
+    # (component id, metric) -> metric name, None for the metrics that are not extracted
+    metric_names = {}
+
+    for row, element in enumerate(experiment_metrics):
+        for key, sub_dict in (element or {}).items():
+            # Keys starting with "_" are reserved, e.g. the instrumentation of the components
+            if key.startswith("_"):
+                continue
+            for sub_key, sub_values in sub_dict.items():
+                metric_name = metric_names.get((key, sub_key), "")
+                if metric_name == "":
+                    metric_name = f"{key.rsplit('.', 1)[-1]}.{sub_key}"
+                    if wanted is not None and metric_name not in wanted:
+                        metric_name = None
+                    metric_names[key, sub_key] = metric_name
+                if metric_name is None:
+                    continue
+
+                column = columns.get(metric_name)
+                if column is None:
+                    column = columns[metric_name] = [None] * size
+                if type(sub_values) is list and len(sub_values) == 1:
+                    value = sub_values[0]
+                else:
+                    value = _reduce_values(sub_values, reduce)
+                if value is not None and not isinstance(value, _NUMBER_TYPES):
+                    non_numeric.add(metric_name)
+                column[row] = value
+
+    # None becomes NaN in the float arrays
+    return {
+        metric_name: np.array(values, dtype=object if metric_name in non_numeric else float)
+        for metric_name, values in columns.items()
+    }
+
+
+def extract_metrics(df: pd.DataFrame, metrics: List[str] = None, reduce: str = "max") -> pd.DataFrame:
     """
     Function used to extract metrics from output results from FFModel Experiments
 
     Parameters:
     df (pd.DataFrame): Input df consisting of output results
     metrics (List[str]): A list of metrics to extract
+    reduce (str): How to reduce the values of a record, see `extract_metric_columns`.
+        Defaults to the max over completions
 
     Returns
     -------
-    pd.DataFrame: Output Dataframe consisting of metrics calculated for each respective experiment
+    pd.DataFrame: Output Dataframe consisting of metrics calculated for each respective experiment,
+    with NaN for the records missing a metric
     """
 
-    # instantiate dict to hold metrics in
-    metrics_dict = {}
+    metric_columns = extract_metric_columns(df["experiment_metrics"].tolist(), metrics, reduce)
+    print(f"Extracted the following metrics {metric_columns.keys()}")
+
+    metrics_df = pd.DataFrame(metric_columns, index=df.index)
+    metrics_df.insert(0, "experiment", df["experiment"].to_numpy())
+    return metrics_df
 
-    # grab values from dataframe
-    exp_metrics = df["experiment_metrics"].values
 
-    # loop and extract metrics
-    for element in exp_metrics:
-        # grab metric class
-        for key in element:
+class _MetricAggregate:
+    """Running aggregate of a metric over the records of an experiment"""
 
-            metric_class = key.split(".")[-1]
-            sub_dict = element[key]
+    def __init__(self):
+        self.records = 0
+        self.values_sum = 0.0
+        self.values_count = 0
+        self.max_value = -np.inf
+        # One float per record (the max over its completions) to compute the percentiles
+        self.record_max = array("d")
 
-            # iterate through sub dict and extract results
+    def add(self, values: List[float]):
+        self.records += 1
+        self.values_sum += sum(values)
+        self.values_count += len(values)
+        record_max = max(values)
+        self.max_value = max(self.max_value, record_max)
+        self.record_max.append(record_max)
+
+
+def _aggregate_experiment_output(path: str, metrics: Optional[List[str]], percentiles: Sequence[float]) -> List[dict]:
+    wanted = set(metrics) if metrics is not None else None
+    aggregates: Dict[str, _MetricAggregate] = {}
+    total_records = 0
+
+    for record in _read_records(path, ["experiment_metrics"]):
+        total_records += 1
+        for key, sub_dict in (record["experiment_metrics"] or {}).items():
+            if key.startswith("_"):
+                continue
+            metric_class = key.rsplit(".", 1)[-1]
             for sub_key, sub_values in sub_dict.items():
                 metric_name = f"{metric_class}.{sub_key}"
-                # if metrics is not None, only extract metrics in list
-                if metrics is not None:
-                    if metric_name not in metrics:
-                        continue
-                if metric_name not in metrics_dict:
-                    metrics_dict[metric_name] = []
-
-                if len(sub_values) > 1:
-                    metrics_dict[metric_name].append(max(sub_values))
-                else:
-                    metrics_dict[metric_name].append(sub_values[0])
+                if wanted is not None and metric_name not in wanted:
+                    continue
+                if not isinstance(sub_values, list):
+                    sub_values = [sub_values]
+                values = [value for value in sub_values if value is not None]
+                # Only numeric metrics are aggregated, e.g. the explanations of the LLM evaluators are skipped
+                if not values or not all(isinstance(value, _NUMBER_TYPES) for value in values):
+                    continue
+                aggregate = aggregates.get(metric_name)
+                if aggregate is None:
+                    aggregate = aggregates[metric_name] = _MetricAggregate()
+                aggregate.add(values)
 
-    print(f"Extracted the following metrics {metrics_dict.keys()}")
-    # set columns
-    columns = ["experiment"]
-    for item in metrics_dict:
-        columns.append(item)
+    rows = []
+    for metric_name, aggregate in aggregates.items():
+        record_max = np.frombuffer(aggregate.record_max, dtype=float)
+        row = {
+            "experiment": _experiment_name(path),
+            "metric": metric_name,
+            "records": aggregate.records,
+            "missing": total_records - aggregate.records,
+            "mean": aggregate.values_sum / aggregate.values_count,
+            "max_over_completions_mean": float(record_max.mean()),
+            "max": aggregate.max_value,
+        }
+        for percentile, value in zip(percentiles, np.percentile(record_max, percentiles)):
+            row[f"p{percentile:g}"] = float(value)
+        rows.append(row)
 
-    for column in columns[1:]:
-        df[column] = metrics_dict[column]
+    return rows
 
-    # update df to only hold metrics columns
-    df = df[columns]
-    return df
+
+def aggregate_experiments_outputs(
+    outputs_dir: str, metrics: List[str] = None, percentiles: Sequence[float] = (50, 90, 99), processes: int = None
+) -> pd.DataFrame:
+    """
+    Computes per experiment aggregates of the metrics by streaming over the JSONL outputs,
+    without loading the outputs into a DataFrame. Files are processed in parallel, one process per file.
+
+    Parameters:
+    outputs_dir (str): The path to the directory holding the experiments outputs.
+    metrics (List[str]): The metrics to aggregate, defaults to every numeric metric found.
+    percentiles (Sequence[float]): Percentiles of the per record max over completions to compute.
+    processes (int): Number of processes reading the files, defaults to one per core.
+
+    Returns
+    -------
+    pd.DataFrame: One row per experiment and metric with the number of records having the metric,
+    the number of records missing it, the mean over all the values, the mean of the per record max
+    over completions, the max and the percentiles of the per record max over completions.
+    """
+    paths = _list_experiment_outputs(outputs_dir)
+    percentiles = list(percentiles)
+
+    processes = min(processes or os.cpu_count() or 1, len(paths))
+    arguments = ([metrics] * len(paths), [percentiles] * len(paths))
+    if processes > 1:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            results = list(executor.map(_aggregate_experiment_output, paths, *arguments))
+    else:
+        results = [_aggregate_experiment_output(path, metrics, percentiles) for path in paths]
+
+    return pd.DataFrame([row for rows in results for row in rows])
@@ -0,0 +1,25 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+import os
+import sys
+
+import pytest
+
+# The components and utilities are imported from the project root, like the ffmodel runner does
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+
+@pytest.fixture
+def data_models():
+    """Factory of experiment data models, record `index` asks for `request {index}` expecting `answer {index}`"""
+    from ffmodel.data_models.base import ExperimentDataModel
+    from ffmodel.utils.data_model_util import create_data_models
+
+    def create(count: int):
+        records = [{"nl_prompt": f"request {index}", "completion": f"answer {index}"} for index in range(count)]
+        return create_data_models(records, ExperimentDataModel)
+
+    return create
@@ -0,0 +1,123 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+import asyncio
+import threading
+import time
+
+from utilities import executor
+from utilities.async_runner import AsyncExecutor
+
+
+class _AsyncCaller:
+    """Awaits like a model caller, keeps track of the calls in flight"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.max_tasks = 0
+        self.max_lag = 0.0
+
+    def get_id(self) -> str:
+        return self.name
+
+    def execute(self, data_model):
+        raise AssertionError("the async executor awaits execute_async")
+
+    async def execute_async(self, data_model):
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            self.max_tasks = max(self.max_tasks, len(asyncio.all_tasks()))
+        start = time.perf_counter()
+        await asyncio.sleep(0.05)
+        with self.lock:
+            self.in_flight -= 1
+            self.max_lag = max(self.max_lag, time.perf_counter() - start - 0.05)
+        if data_model.request.user_nl == "request 3":
+            raise ValueError("failed")
+        data_model.model_output.completions = [data_model.request.expected_output[0]]
+        return data_model
+
+
+class _Evaluator:
+    """Runs in the thread pool, it has no execute_async"""
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def get_id(self) -> str:
+        return self.name
+
+    def execute(self, data_model):
+        data_model.experiment_metrics[self.name] = {"match": 1.0}
+        return data_model
+
+
+def _executor(monkeypatch, components, **config) -> AsyncExecutor:
+    monkeypatch.setattr(executor, "create_component", lambda component_config, *args, **kwargs: components.pop(0))
+    solution_config = {
+        "id": "async-test",
+        "experimentation": {"executor": {"mode": "async", "threads": 2, **config}},
+        "components": [
+            {"name": "components.model_callers.openai"},
+            {"name": "components.evaluators.first"},
+            {"name": "components.evaluators.second"},
+        ],
+    }
+    return AsyncExecutor(solution_config)
+
+
+def test_async_executor_runs_the_records_in_order(monkeypatch, data_models):
+    caller = _AsyncCaller("caller")
+    async_executor = _executor(monkeypatch, [caller, _Evaluator("first"), _Evaluator("second")], concurrency=4)
+    results = async_executor.run(data_models(20))
+
+    assert [result.request.user_nl for result in results] == [f"request {index}" for index in range(20)]
+    assert [segment.name for segment in async_executor.segments] == ["chain", "evaluators"]
+    assert caller.max_in_flight == 4
+
+    # The failing record skips the evaluators, the others go on
+    assert async_executor.report.failures == [(3, results[3].error)]
+    assert results[3].error["component"] == "caller" and not results[3].experiment_metrics
+    assert results[4].model_output.completions == ["answer 4"]
+    assert set(results[4].experiment_metrics) == {"first", "second"}
+
+
+def test_async_executor_bounds_the_pending_records(monkeypatch, data_models):
+    caller = _AsyncCaller("caller")
+    async_executor = _executor(monkeypatch, [caller, _Evaluator("first"), _Evaluator("second")], concurrency=4)
+    results = async_executor.run(data_models(200))
+
+    assert len(results) == 200 and caller.max_in_flight == 4
+    # The main task and a worker per record in flight, with the evaluators of each running concurrently
+    assert caller.max_tasks <= 1 + 4 * 3
+
+
+class _SlowWriter:
+    """Blocks like the checkpoint mode of the JSONL writer syncing every record to disk"""
+
+    def __init__(self):
+        self.user_nls = []
+
+    def execute(self, data_model):
+        time.sleep(0.2)
+        self.user_nls.append(data_model.request.user_nl)
+        return data_model
+
+    def register_experiment_results(self):
+        pass
+
+
+def test_async_executor_writes_off_the_event_loop(monkeypatch, data_models):
+    caller = _AsyncCaller("caller")
+    async_executor = _executor(monkeypatch, [caller, _Evaluator("first"), _Evaluator("second")], concurrency=4)
+    writer = _SlowWriter()
+    async_executor.writers = [writer]
+    async_executor.run(data_models(8))
+
+    assert writer.user_nls == [f"request {index}" for index in range(8)]
+    # The calls in flight are not held up by the writes
+    assert caller.max_lag < 0.15
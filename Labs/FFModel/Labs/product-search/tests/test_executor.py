@@ -0,0 +1,179 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+import glob
+import json
+import logging
+import os
+import sys
+
+import yaml
+
+from utilities import executor
+from utilities.cache import CacheStats
+from utilities.executor import PipelineExecutor, load_solution_config, main, run_chain_batch
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class _Caller:
+    """Adds a completion to each record like the model callers, raises for the failing requests"""
+
+    def __init__(self, failing=()):
+        self.failing = failing
+        self.calls = 0
+        self.batches = 0
+
+    def get_id(self) -> str:
+        return "test.caller"
+
+    def execute(self, data_model):
+        self.calls += 1
+        if data_model.request.user_nl in self.failing:
+            raise ValueError("failed")
+        data_model.model_output.completions = (data_model.model_output.completions or []) + ["completion"]
+        return data_model
+
+    def execute_batch(self, data_models):
+        self.batches += 1
+        return [self.execute(data_model) for data_model in data_models]
+
+
+class _Evaluator(_Caller):
+    """Assigns its metric like the batching evaluators, so its batches can run again"""
+
+    batch_retry_safe = True
+
+    def get_id(self) -> str:
+        return "test.evaluator"
+
+    def execute(self, data_model):
+        self.calls += 1
+        if data_model.request.user_nl in self.failing:
+            raise ValueError("failed")
+        data_model.experiment_metrics["test.evaluator"] = {"match": 1.0}
+        return data_model
+
+
+def test_run_chain_batch_batches_the_components_safe_to_retry(data_models):
+    caller, evaluator = _Caller(), _Evaluator()
+    results = run_chain_batch([caller, evaluator], data_models(3))
+
+    assert [success for _, success in results] == [True, True, True]
+    assert [data_model.model_output.completions for data_model, _ in results] == [["completion"]] * 3
+    assert (caller.batches, caller.calls) == (0, 3)
+    assert (evaluator.batches, evaluator.calls) == (1, 3)
+
+
+def test_run_chain_batch_isolates_the_failing_records(data_models):
+    caller, evaluator = _Caller(failing=["request 1"]), _Evaluator(failing=["request 2"])
+    results = run_chain_batch([caller, evaluator], data_models(4))
+
+    assert [success for _, success in results] == [True, False, False, True]
+    assert results[1][0].error["component"] == "test.caller"
+    assert results[2][0].error["component"] == "test.evaluator"
+    # The caller ran each record once, the batch of the evaluator raised and its records ran again in place
+    completions = [data_model.model_output.completions for data_model, _ in results]
+    assert completions == [["completion"], None, ["completion"], ["completion"]]
+    assert caller.calls == 4
+    # The batch raised at its second record
+    assert (evaluator.batches, evaluator.calls) == (1, 2 + 3)
+    assert results[3][0].experiment_metrics == {"test.evaluator": {"match": 1.0}}
+
+
+class _CachedEvaluator(_Evaluator):
+    """Stands in for an evaluator decorated with `cache_results`"""
+
+    def __init__(self):
+        super().__init__()
+        self.result_cache = type("ResultCache", (), {"stats": CacheStats()})()
+
+    def execute(self, data_model):
+        self.result_cache.stats.record(hits=0, misses=1)
+        return super().execute(data_model)
+
+
+def test_the_result_caches_are_summed_up_once_per_run(monkeypatch, caplog, data_models):
+    monkeypatch.setattr(executor, "create_component", lambda *args, **kwargs: _CachedEvaluator())
+    pipeline_executor = PipelineExecutor({"id": "test", "components": [{"name": "components.evaluators.cached"}]})
+    with caplog.at_level(logging.INFO, logger=executor.__name__):
+        pipeline_executor.run(data_models(3))
+
+    summaries = [record.message for record in caplog.records if record.message.startswith("Result cache")]
+    assert summaries == ["Result cache of test.evaluator: CacheStats(hits=0, misses=3, hit_rate=0.00%)"]
+
+
+_STATIC_CONTEXT = {"name": "components.pre_processors.static_context", "args": {"static_context": "tables"}}
+_SQL_EXECUTION = {
+    "name": "components.evaluators.sql_execution",
+    "supporting_data": {"database_script": {"file_path": "./data/fixture.sql"}},
+}
+
+
+def _write_solution(solution_dir, records: int, components) -> str:
+    """A solution directory like the examples: the config next to its data, the project root two levels up"""
+    os.makedirs(solution_dir / "data")
+    with open(solution_dir / "data" / "records.jsonl", "w", encoding="utf-8") as f:
+        for index in range(records):
+            f.write(json.dumps({"nl_prompt": f"request {index}", "completion": f"answer {index}"}) + "\n")
+    config = {
+        "id": "executor-test",
+        "project_root": os.path.relpath(PROJECT_ROOT, solution_dir),
+        "experimentation": {
+            "executor": {"threads": 2},
+            "data": {"file_path": "./data/records.jsonl"},
+            "reader": {"name": "components.readers.jsonl"},
+            "writers": [{"name": "components.writers.jsonl", "args": {"output_path": "outputs/results.jsonl"}}],
+        },
+        "components": components,
+    }
+    config_path = solution_dir / "config.yaml"
+    with open(config_path, "w", encoding="utf-8") as f:
+        yaml.safe_dump(config, f)
+    return str(config_path)
+
+
+def test_load_solution_config_resolves_the_paths_against_the_config_directory(tmp_path, monkeypatch):
+    monkeypatch.setattr(sys, "path", [path for path in sys.path if path != PROJECT_ROOT])
+    solution_config = load_solution_config(_write_solution(tmp_path / "solution", 1, [_STATIC_CONTEXT, _SQL_EXECUTION]))
+
+    assert sys.path[0] == PROJECT_ROOT
+    assert solution_config["experimentation"]["data"]["file_path"] == str(tmp_path / "solution/data/records.jsonl")
+    supporting_data = solution_config["components"][1]["supporting_data"]["database_script"]
+    assert supporting_data["file_path"] == str(tmp_path / "solution/data/fixture.sql")
+
+
+def test_load_solution_config_resolves_the_paths_against_the_base_directory(tmp_path):
+    config_path = _write_solution(tmp_path / "solution", 1, [_STATIC_CONTEXT])
+    os.makedirs(tmp_path / "solution_configs")
+    moved_path = tmp_path / "solution_configs" / "config.yaml"
+    os.rename(config_path, moved_path)
+
+    solution_config = load_solution_config(str(moved_path), base_dir=str(tmp_path / "solution"))
+    assert solution_config["experimentation"]["data"]["file_path"] == str(tmp_path / "solution/data/records.jsonl")
+
+
+def test_the_example_configs_resolve_from_the_project_root(monkeypatch):
+    monkeypatch.chdir(PROJECT_ROOT)
+    solution_config = load_solution_config("examples/nl2python/nl2python_solution.yaml")
+    assert os.path.isfile(solution_config["experimentation"]["data"]["file_path"])
+    assert os.path.isfile(solution_config["components"][1]["supporting_data"]["few_shot_file"]["file_path"])
+
+    solution_config = load_solution_config(
+        "examples/nl2sql/solution_configs/nl2sql_config.yaml", base_dir="examples/nl2sql"
+    )
+    assert os.path.isfile(solution_config["experimentation"]["data"]["file_path"])
+
+
+def test_main_runs_the_experiment_from_another_directory(tmp_path, monkeypatch):
+    config_path = _write_solution(tmp_path / "solution", 5, [_STATIC_CONTEXT, {"name": "components.stitchers.sql"}])
+    os.makedirs(tmp_path / "cwd")
+    monkeypatch.chdir(tmp_path / "cwd")
+
+    assert main([config_path]) == 0
+
+    [output_path] = glob.glob(str(tmp_path / "cwd" / "outputs" / "results*.jsonl"))
+    with open(output_path, encoding="utf-8") as f:
+        outputs = [json.loads(line) for line in f]
+    assert [output["request"]["user_nl"] for output in outputs] == [f"request {index}" for index in range(5)]
+    assert all(output["state"]["context"] == ["tables"] and output["model_input"]["prompt"] for output in outputs)
@@ -0,0 +1,83 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+from utilities import sweep
+from utilities.halving import HalvingConfig, SuccessiveHalving
+from utilities.sweep import SweepRunner
+
+
+class _Component:
+    """Scores each record with its `quality` arg, raises for the `failing` requests, keeps track of its records"""
+
+    def __init__(self, name: str, args, solution_id: str):
+        self.component_id = f"{solution_id}.{name}"
+        self.args = args or {}
+        self.user_nls = []
+
+    def get_id(self) -> str:
+        return self.component_id
+
+    def execute(self, data_model):
+        self.user_nls.append(data_model.request.user_nl)
+        if data_model.request.user_nl in self.args.get("failing", []):
+            raise ValueError("failed")
+        if "quality" in self.args:
+            data_model.experiment_metrics[self.component_id] = {"score": self.args["quality"]}
+        return data_model
+
+
+def _halving(monkeypatch, judges, **config):
+    created = {}
+
+    def create_component(component_config, class_name, solution_id, **kwargs):
+        component = _Component(component_config["name"], component_config.get("args"), solution_id)
+        created[(solution_id, component_config["name"])] = component
+        return component
+
+    monkeypatch.setattr(sweep, "create_component", create_component)
+    solution_configs = [
+        {
+            "id": f"halving-{index}",
+            "experimentation": {"executor": {"threads": 2}},
+            "components": [
+                {"name": "components.pre_processors.static_context", "args": {"static_context": "tables"}},
+                {"name": "components.evaluators.judge", "args": args},
+            ],
+        }
+        for index, args in enumerate(judges)
+    ]
+    return SuccessiveHalving(SweepRunner(solution_configs), HalvingConfig(metric="judge.score", **config)), created
+
+
+def test_halving_promotes_the_best_configs_on_nested_samples(monkeypatch, data_models):
+    halving, created = _halving(monkeypatch, [{"quality": index / 10} for index in range(9)], min_records=2, eta=3)
+    result = halving.run(data_models(18))
+
+    assert [(rung.records, rung.new_records, len(rung.candidates)) for rung in result.rungs] == [(2, 2, 9), (6, 4, 3)]
+    assert result.rungs[0].promoted == ["halving-8", "halving-7", "halving-6"]
+    assert result.rungs[1].promoted == ["halving-8"]
+    assert result.best.solution_id == "halving-8" and abs(result.best.score - 0.8) < 1e-9
+
+    # Each rung extends the sample of the previous one, a config never runs a record twice
+    best_judge = created[("halving-8", "components.evaluators.judge")].user_nls
+    assert len(best_judge) == len(set(best_judge)) == 6
+    assert set(created[("halving-0", "components.evaluators.judge")].user_nls) == set(best_judge[:2])
+    # The shared static context ran once per record
+    assert result.executions["components.pre_processors.static_context"] == [6, 9 * 18]
+    assert result.executions["components.evaluators.judge"] == [9 * 2 + 3 * 4, 9 * 18]
+
+
+def test_failed_records_count_as_the_worst_value(monkeypatch, data_models):
+    judges = [
+        {"quality": 0.9, "failing": ["request 0", "request 1", "request 2"]},
+        {"quality": 0.6},
+        {"quality": 0.3},
+    ]
+    halving, _ = _halving(monkeypatch, judges, min_records=4, eta=3)
+    result = halving.run(data_models(4))
+
+    [rung] = result.rungs
+    scores = {candidate.solution_id: candidate for candidate in rung.candidates}
+    assert (scores["halving-0"].scored_records, scores["halving-0"].failures) == (1, 3)
+    assert abs(scores["halving-0"].score - (0.9 + 3 * 0.3) / 4) < 1e-9
+    assert result.best.solution_id == "halving-1"
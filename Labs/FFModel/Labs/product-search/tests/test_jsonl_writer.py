@@ -0,0 +1,38 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+import json
+from collections import Counter
+
+import pytest
+
+from components.writers.jsonl import Writer
+from utilities.checkpoint import get_checkpoint, record_key
+
+
+def _writer(tmp_path, output_name: str) -> Writer:
+    checkpoint_path = str(tmp_path / "run.checkpoint")
+    return Writer(args={"output_path": str(tmp_path / output_name), "checkpoint_path": checkpoint_path})
+
+
+def test_records_written_but_not_marked_are_marked_by_their_ids(tmp_path, data_models):
+    records = data_models(3)
+    # A crash between writing the third record and marking it, after the records were marked out of order
+    with open(tmp_path / "output.jsonl", "w", encoding="utf-8") as f:
+        f.write("".join(json.dumps(data_model.to_dict()) + "\n" for data_model in records))
+    with open(tmp_path / "run.checkpoint", "w", encoding="utf-8") as f:
+        f.write(f"{record_key(records[2])}\n{record_key(records[0])}\n")
+
+    _writer(tmp_path, "output.jsonl")
+
+    checkpoint = get_checkpoint(str(tmp_path / "run.checkpoint"))
+    assert checkpoint.completed == Counter(record_key(data_model) for data_model in records)
+
+
+def test_writers_can_not_share_a_checkpoint(tmp_path):
+    _writer(tmp_path, "output.jsonl")
+    # The same writer created again, e.g. to resume the run in the same process
+    _writer(tmp_path, "output.jsonl")
+
+    with pytest.raises(ValueError, match="each writer needs its own checkpoint_path"):
+        _writer(tmp_path, "other.jsonl")
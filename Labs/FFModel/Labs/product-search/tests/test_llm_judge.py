@@ -0,0 +1,39 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+import pytest
+
+from utilities.llm_judge import JudgeRunner
+
+
+class _Judge:
+    """Scores the completions like a judge model, raises for the completions asking for it"""
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, prompt: str, expected_output: str, completion: str):
+        self.calls.append(completion)
+        if completion == "fail":
+            raise TimeoutError("the judge timed out")
+        return float(completion == expected_output), "explanation"
+
+
+@pytest.mark.parametrize("max_concurrency", [1, 4])
+def test_verdicts_are_cached_when_a_call_fails(max_concurrency):
+    judge = _Judge()
+    runner = JudgeRunner(judge, "instructions", {"model": "judge"}, max_concurrency=max_concurrency)
+    tasks = [("prompt", "a", "a"), ("prompt", "a", "b"), ("prompt", "a", "fail")]
+
+    with pytest.raises(TimeoutError):
+        runner.score(tasks)
+
+    # The verdicts paid for before the failure are not scored again
+    judge.calls.clear()
+    with pytest.raises(TimeoutError):
+        runner.score(tasks)
+    assert judge.calls == ["fail"]
+
+    assert runner.score(tasks[:2]) == [(1.0, "explanation"), (0.0, "explanation")]
+    assert judge.calls == ["fail"]
+    runner.close()
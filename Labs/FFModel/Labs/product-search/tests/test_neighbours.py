@@ -0,0 +1,74 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+import copy
+import pickle
+
+import numpy as np
+import pytest
+
+from utilities.executor import create_component
+from utilities.neighbours import compute_neighbour_table
+
+
+def _bank(tmp_path, data_models):
+    """A bank of 8 items with two pairs of identical embeddings, and the embeddings of 4 prompts"""
+    rng = np.random.default_rng(0)
+    embeddings = rng.normal(size=(8, 3))
+    embeddings[5] = embeddings[1]
+    embeddings[7] = embeddings[3]
+    items = [
+        {"user_nl": f"shot {index}", "expected_output": f"output {index}", "context": f"context {index}"}
+        for index in range(8)
+    ]
+    for item, embedding in zip(items, embeddings):
+        item["embedding"] = embedding.tolist()
+    bank = {"metadata": {"embedding_model": "test-embedding"}, "data": items}
+
+    prompts = data_models(4)
+    # The first prompt has the embedding of the identical items 1 and 5, the others are random
+    queries = np.vstack([embeddings[1], rng.normal(size=(3, 3))])
+    with open(tmp_path / "bank.pkl", "wb") as f:
+        pickle.dump(bank, f)
+    with open(tmp_path / "prompts.pkl", "wb") as f:
+        cached = [
+            {"user_nl": data_model.request.user_nl, "embedding": query.tolist()}
+            for data_model, query in zip(prompts, queries)
+        ]
+        pickle.dump({"metadata": bank["metadata"], "data": cached}, f)
+    return bank, prompts, queries
+
+
+@pytest.mark.parametrize(
+    "name, bank_file",
+    [
+        ("components.pre_processors.few_shot_embedding", "few_shot_file"),
+        ("components.pre_processors.dynamic_context_embedding", "context_file"),
+    ],
+)
+def test_the_table_returns_the_ranking_of_the_components(tmp_path, data_models, name, bank_file):
+    bank, prompts, queries = _bank(tmp_path, data_models)
+    table = compute_neighbour_table(bank, [data_model.request.user_nl for data_model in prompts], queries, k=4)
+    table.save(str(tmp_path / "neighbours"))
+
+    for count in range(1, 7):
+        supporting_data = {
+            bank_file: {"file_path": str(tmp_path / "bank.pkl")},
+            "cached_embeddings": {"file_path": str(tmp_path / "prompts.pkl")},
+        }
+        component_config = {"name": name, "args": {"count": count}, "supporting_data": supporting_data}
+        component = create_component(component_config, "Component", "test")
+        supporting_data["neighbour_tables"] = {"file_path": str(tmp_path / "neighbours")}
+        with_table = create_component(component_config, "Component", "test")
+        assert with_table.neighbours is not None
+
+        for data_model, query in zip(prompts, queries):
+            ranking = component._get_top_n_index(query.tolist())
+            lookup = table.lookup(data_model.request.user_nl, count)
+            # Past k the table can not answer, the components rank the bank
+            assert lookup == (ranking if count <= table.k else None)
+            expected = component.execute(copy.deepcopy(data_model)).to_dict()
+            assert with_table.execute(copy.deepcopy(data_model)).to_dict() == expected
+
+    # The identical items are ranked in the bank order
+    assert table.lookup("request 0", 2) == [1, 5]
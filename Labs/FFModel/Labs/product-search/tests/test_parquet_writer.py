@@ -0,0 +1,49 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+import json
+import os
+
+import pyarrow.parquet as pq
+from components.writers.parquet import Writer
+from ffmodel.data_models.base import ExperimentDataModel
+
+
+def _write(tmp_path, scores):
+    writer = Writer(args={"output_path": os.path.join(tmp_path, "output.parquet"), "row_group_size": 2})
+    for score in scores:
+        data_model = ExperimentDataModel()
+        data_model.experiment_metrics = {"solution.evaluators.judge": {"score": score}}
+        writer.execute(data_model)
+    writer.close()
+    return pq.read_table(writer.output_path).to_pydict()
+
+
+def test_metric_types_are_inferred_from_the_first_row_group(tmp_path):
+    table = _write(tmp_path, [1.0, "ok", "fine"])
+
+    assert table["metrics.judge.score"] == [["1.0"], ["ok"], ["fine"]]
+    assert table["extra_metrics"] == [None, None, None]
+
+
+def test_values_not_matching_a_numeric_column_go_to_extra_metrics(tmp_path):
+    table = _write(tmp_path, [1.0, 0.5, "ok", 3, None])
+
+    assert table["metrics.judge.score"] == [[1.0], [0.5], None, [3.0], [None]]
+    assert json.loads(table["extra_metrics"][2]) == {"metrics.judge.score": ["ok"]}
+    assert table["extra_metrics"][3] is None
+
+
+def test_metrics_of_modules_sharing_a_name_get_their_own_column(tmp_path):
+    writer = Writer(args={"output_path": os.path.join(tmp_path, "output.parquet")}, solution_id="solution")
+    data_model = ExperimentDataModel()
+    data_model.experiment_metrics = {
+        "solution.components.evaluators.rouge": {"rougeL": 0.5},
+        "solution.my_components.evaluators.rouge": {"rougeL": 0.75},
+    }
+    writer.execute(data_model)
+    writer.close()
+    table = pq.read_table(writer.output_path).to_pydict()
+
+    assert table["metrics.rouge.rougeL"] == [[0.5]]
+    assert table["metrics.my_components.evaluators.rouge.rougeL"] == [[0.75]]
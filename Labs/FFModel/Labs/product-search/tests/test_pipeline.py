@@ -0,0 +1,57 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+import threading
+
+from utilities import pipeline
+from utilities.pipeline import StagePipeline
+
+
+def _solution_config(**executor):
+    return {
+        "id": "pipeline-test",
+        "experimentation": {"executor": {"mode": "pipeline", "threads": 2, **executor}},
+        "components": [
+            {"name": "components.pre_processors.static_context", "args": {"static_context": "tables"}},
+            {"name": "components.stitchers.sql"},
+        ],
+    }
+
+
+def _run(executor: StagePipeline, data_models):
+    """Runs the pipeline on a thread, so a hang fails the test instead of blocking it"""
+    results = []
+    thread = threading.Thread(target=lambda: results.append(executor.run(data_models)), daemon=True)
+    thread.start()
+    thread.join(timeout=60)
+    assert not thread.is_alive(), "the pipeline did not complete"
+    return results[0]
+
+
+def test_pipeline_runs_the_records_through_the_stages(data_models):
+    executor = StagePipeline(_solution_config(stages={"stitchers": {"workers": 1, "batch_size": 4}}))
+    results = _run(executor, data_models(20))
+
+    assert [stage.name for stage in executor.report.stages] == ["pre_processors", "stitchers"]
+    assert [result.request.user_nl for result in results] == [f"request {index}" for index in range(20)]
+    assert all(result.state.context == ["tables"] for result in results)
+    assert all(result.model_input.prompt for result in results)
+    assert not executor.report.failures
+
+
+def test_a_stage_raising_fails_its_records_instead_of_hanging(monkeypatch, data_models):
+    run_stage = StagePipeline._run_stage
+
+    def broken_stitchers(self, stage, items, process_pool):
+        if stage.segment.name == "stitchers" and items[0][0] % 2 == 0:
+            raise RuntimeError("broken process pool")
+        return run_stage(self, stage, items, process_pool)
+
+    monkeypatch.setattr(pipeline.StagePipeline, "_run_stage", broken_stitchers)
+    executor = StagePipeline(_solution_config())
+    results = _run(executor, data_models(10))
+
+    assert [index for index, _ in executor.report.failures] == [0, 2, 4, 6, 8]
+    assert all(error["component"] == "stitchers" for _, error in executor.report.failures)
+    assert results[0].error["message"] == "broken process pool"
+    assert results[1].error is None and results[1].model_input.prompt
@@ -0,0 +1,35 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+import pytest
+
+from utilities.sandbox_pool import SandboxPool
+
+
+@pytest.fixture
+def pool():
+    pool = SandboxPool(size=2, timeout=1.0, max_tasks_per_worker=3, preload_modules=["json"])
+    yield pool
+    pool.close()
+
+
+def test_snippets_run_in_fresh_globals(pool):
+    assert pool.run("x = 1").success
+    result = pool.run("assert 'x' not in globals()", setup="import json")
+    assert result.syntax_valid and result.success
+
+    result = pool.run("def broken(:")
+    assert not result.syntax_valid and result.error.startswith("SyntaxError")
+
+
+def test_workers_are_replaced_from_the_threads_running_the_snippets(pool):
+    tasks = [("import time; time.sleep(5)", ""), ("import os; os._exit(1)", "")] + [("x = 1", "")] * 20
+    results = pool.map(tasks)
+
+    assert results[0].timed_out
+    assert results[1].error == "The worker process died"
+    assert all(result.success for result in results[2:])
+
+    # Every worker ran fewer snippets than the recycling limit, the pool still has its size
+    assert len(pool._workers) == 2
+    assert all(worker.tasks < 3 for worker in pool._workers)
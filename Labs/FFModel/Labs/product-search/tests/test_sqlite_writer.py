@@ -0,0 +1,55 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+import pytest
+
+from components.writers.sqlite import Writer, connect
+from ffmodel.data_models.base import ExperimentDataModel
+
+
+def _data_model(experiment_metrics):
+    data_model = ExperimentDataModel()
+    data_model.experiment_metrics = experiment_metrics
+    return data_model
+
+
+def test_runs_started_together_get_their_own_run_id(tmp_path):
+    database_path = str(tmp_path / "results.db")
+    writers = [Writer(args={"database_path": database_path}, solution_id="solution") for _ in range(2)]
+    for writer in writers:
+        writer.execute(_data_model({"solution.components.evaluators.fuzzy": {"simple": 1.0}}))
+        writer.close()
+
+    assert writers[0].run_id != writers[1].run_id
+    connection = connect(database_path)
+    runs = connection.execute("SELECT run_id, COUNT(*) FROM records GROUP BY run_id ORDER BY run_id").fetchall()
+    assert runs == sorted((writer.run_id, 1) for writer in writers)
+    connection.close()
+
+
+def test_an_existing_run_id_raises(tmp_path):
+    database_path = str(tmp_path / "results.db")
+    Writer(args={"database_path": database_path, "run_id": "baseline"}, solution_id="solution").close()
+
+    with pytest.raises(ValueError, match="baseline already exists"):
+        Writer(args={"database_path": database_path, "run_id": "baseline"}, solution_id="solution")
+
+
+def test_metrics_of_modules_sharing_a_name_are_told_apart(tmp_path):
+    database_path = str(tmp_path / "results.db")
+    writer = Writer(args={"database_path": database_path}, solution_id="solution")
+    writer.execute(
+        _data_model(
+            {
+                "solution.components.evaluators.fuzzy": {"simple": [0.5, 1.0]},
+                "solution.my_components.evaluators.fuzzy": {"simple": 0.25},
+                "_instrumentation": {"solution.components.evaluators.fuzzy": {"wall_time": 0.1}},
+            }
+        )
+    )
+    writer.close()
+
+    connection = connect(database_path)
+    metrics = connection.execute("SELECT metric, value FROM metrics ORDER BY metric").fetchall()
+    assert metrics == [("fuzzy.simple", 1.0), ("my_components.evaluators.fuzzy.simple", 0.25)]
+    connection.close()
@@ -0,0 +1,117 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+import glob
+import json
+import os
+
+import yaml
+
+from utilities import sweep
+from utilities.sweep import SweepRunner
+
+
+class _Component:
+    """Adds its args to the context and a metric keyed by its id, like the components do"""
+
+    def __init__(self, name: str, args, solution_id: str):
+        self.component_id = f"{solution_id}.{name}"
+        self.args = args
+        self.executions = 0
+
+    def get_id(self) -> str:
+        return self.component_id
+
+    def execute(self, data_model):
+        self.executions += 1
+        data_model.state.context = (data_model.state.context or []) + [str(self.args)]
+        data_model.experiment_metrics[self.component_id] = {"executions": 1.0}
+        return data_model
+
+
+class _Writer:
+    def __init__(self):
+        self.data_models = []
+        self.registered = False
+
+    def execute(self, data_model):
+        self.data_models.append(data_model)
+        return data_model
+
+    def register_experiment_results(self):
+        self.registered = True
+
+
+def _runner(monkeypatch, temperatures):
+    created = {}
+
+    def create_component(component_config, class_name, solution_id, **kwargs):
+        if class_name == "Writer":
+            component = _Writer()
+        else:
+            component = _Component(component_config["name"], component_config.get("args"), solution_id)
+        created.setdefault(solution_id, []).append(component)
+        return component
+
+    monkeypatch.setattr(sweep, "create_component", create_component)
+    solution_configs = [
+        {
+            "id": f"sweep-{temperature}",
+            "experimentation": {"executor": {"threads": 2}, "writers": [{"name": "components.writers.jsonl"}]},
+            "components": [
+                {"name": "components.pre_processors.static_context", "args": {"static_context": "tables"}},
+                {"name": "components.model_callers.openai", "args": {"temperature": temperature}},
+            ],
+        }
+        for temperature in temperatures
+    ]
+    return SweepRunner(solution_configs), created
+
+
+def test_sweep_runs_the_shared_components_once_per_record(monkeypatch, data_models):
+    runner, created = _runner(monkeypatch, [0.0, 0.5, 1.0])
+    report = runner.run(data_models(4))
+
+    assert report.executions["components.pre_processors.static_context"] == 4
+    assert report.independent_executions["components.pre_processors.static_context"] == 12
+    assert report.executions["components.model_callers.openai"] == 12
+
+    # Each config gets the records in order, as if it ran on its own
+    for temperature in [0.0, 0.5, 1.0]:
+        writer = created[f"sweep-{temperature}"][0]
+        assert writer.registered
+        assert [data_model.request.user_nl for data_model in writer.data_models] == [f"request {i}" for i in range(4)]
+        for data_model in writer.data_models:
+            assert data_model.state.context == ["{'static_context': 'tables'}", f"{{'temperature': {temperature}}}"]
+            assert set(data_model.experiment_metrics) == {
+                f"sweep-{temperature}.components.pre_processors.static_context",
+                f"sweep-{temperature}.components.model_callers.openai",
+            }
+
+
+def test_main_resolves_the_generated_configs_against_the_base_dir(tmp_path):
+    with open(tmp_path / "data.jsonl", "w", encoding="utf-8") as f:
+        for index in range(3):
+            f.write(json.dumps({"nl_prompt": f"request {index}", "completion": f"answer {index}"}) + "\n")
+    os.makedirs(tmp_path / "generated")
+    for context in ["tables", "columns"]:
+        config = {
+            "id": f"sweep-{context}",
+            "experimentation": {
+                "data": {"file_path": "./data.jsonl"},
+                "reader": {"name": "components.readers.jsonl"},
+                "writers": [
+                    {"name": "components.writers.jsonl", "args": {"output_path": str(tmp_path / f"{context}.jsonl")}}
+                ],
+            },
+            "components": [{"name": "components.pre_processors.static_context", "args": {"static_context": context}}],
+        }
+        with open(tmp_path / "generated" / f"{context}.yaml", "w", encoding="utf-8") as f:
+            yaml.safe_dump(config, f)
+
+    assert sweep.main([str(tmp_path / "generated"), "--base-dir", str(tmp_path)]) == 0
+
+    for context in ["tables", "columns"]:
+        [output_path] = glob.glob(str(tmp_path / f"{context}-*.jsonl"))
+        with open(output_path, encoding="utf-8") as f:
+            assert [json.loads(line)["state"]["context"] for line in f] == [[context]] * 3
@@ -0,0 +1,209 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+import json
+import multiprocessing
+import os
+import time
+
+import yaml
+
+from utilities import work_queue
+from utilities.work_queue import Worker, enqueue, merge, status
+
+# The workers are spawned, like the `work` command does
+_context = multiprocessing.get_context("spawn")
+
+
+def _claim_all(queue_path: str, claimed):
+    worker = Worker(queue_path, lease=60)
+    try:
+        while True:
+            item = worker.claim()
+            if item is None:
+                return
+            claimed.put(item.item_id)
+    finally:
+        worker.close()
+
+
+def _claim_one(queue_path: str, claimed):
+    worker = Worker(queue_path, lease=60)
+    try:
+        item = worker.claim()
+        claimed.put(None if item is None else (item.item_id, item.attempts))
+    finally:
+        worker.close()
+
+
+def _slow_run_item(config_path: str, shard: int, shards: int, output_dir: str, base_dir=None) -> int:
+    time.sleep(2.0)
+    return 1
+
+
+def _work_slowly(queue_path: str, lease: float):
+    work_queue.run_item = _slow_run_item
+    worker = Worker(queue_path, lease)
+    try:
+        worker.run()
+    finally:
+        worker.close()
+
+
+def _start(target, *args) -> multiprocessing.Process:
+    process = _context.Process(target=target, args=args)
+    process.start()
+    return process
+
+
+def test_claims_are_exclusive_across_processes(tmp_path):
+    queue_path = str(tmp_path / "queue.db")
+    assert enqueue(queue_path, [f"config-{index}.yaml" for index in range(4)], shards=10) == 40
+
+    claimed = _context.Queue()
+    processes = [_start(_claim_all, queue_path, claimed) for _ in range(4)]
+    for process in processes:
+        process.join(timeout=60)
+        assert process.exitcode == 0
+
+    item_ids = [claimed.get(timeout=10) for _ in range(40)]
+    assert sorted(item_ids) == list(range(1, 41))
+    assert status(queue_path)["running"] == 40
+
+
+def test_expired_lease_is_claimed_again(tmp_path):
+    queue_path = str(tmp_path / "queue.db")
+    enqueue(queue_path, ["config.yaml"], max_attempts=3)
+
+    first = Worker(queue_path, lease=0.5)
+    item = first.claim()
+    assert item.attempts == 1
+
+    # Leased: not claimed by another process until the lease expires
+    claimed = _context.Queue()
+    _start(_claim_one, queue_path, claimed).join(timeout=60)
+    assert claimed.get(timeout=10) is None
+
+    time.sleep(0.6)
+    _start(_claim_one, queue_path, claimed).join(timeout=60)
+    assert claimed.get(timeout=10) == (item.item_id, 2)
+
+    # The first worker lost the lease, it can not complete the item anymore
+    assert not first._owned_update(item, "UPDATE items SET status = 'done'", ())
+    first.close()
+
+
+def test_lease_is_renewed_while_the_item_runs(tmp_path):
+    queue_path = str(tmp_path / "queue.db")
+    enqueue(queue_path, ["config.yaml"])
+
+    # The item runs for 2s with a lease of 0.6s, renewed every 0.2s
+    process = _start(_work_slowly, queue_path, 0.6)
+    other = Worker(queue_path, lease=0.6)
+    try:
+        deadline = time.monotonic() + 30
+        while status(queue_path)["running"] == 0:
+            assert time.monotonic() < deadline
+            time.sleep(0.05)
+        while process.is_alive():
+            assert other.claim() is None
+            time.sleep(0.1)
+    finally:
+        other.close()
+        process.join(timeout=60)
+
+    assert process.exitcode == 0
+    assert status(queue_path)["done"] == 1
+    connection = work_queue.connect(queue_path)
+    assert connection.execute("SELECT attempts FROM items").fetchone()[0] == 1
+    connection.close()
+
+
+def _write_config(tmp_path, records: int, writers=None) -> str:
+    data_path = tmp_path / "data.jsonl"
+    with open(data_path, "w", encoding="utf-8") as f:
+        for index in range(records):
+            f.write(json.dumps({"nl_prompt": f"request {index}", "completion": f"answer {index}"}) + "\n")
+    config = {
+        "id": "work-queue-test",
+        "experimentation": {
+            "data": {"file_path": str(data_path)},
+            "reader": {"name": "components.readers.jsonl"},
+            "writers": writers
+            or [{"name": "components.writers.jsonl", "args": {"output_path": str(tmp_path / "out.jsonl")}}],
+        },
+        "components": [{"name": "components.pre_processors.static_context", "args": {"static_context": "tables"}}],
+    }
+    config_path = tmp_path / "config.yaml"
+    with open(config_path, "w", encoding="utf-8") as f:
+        yaml.safe_dump(config, f)
+    return str(config_path)
+
+
+def test_workers_run_the_shards_and_merge_in_order(tmp_path):
+    queue_path = str(tmp_path / "queue.db")
+    config_path = _write_config(tmp_path, records=10)
+    enqueue(queue_path, [config_path], shards=3)
+
+    processes = [_start(work_queue._work, queue_path, 60.0, None) for _ in range(2)]
+    for process in processes:
+        process.join(timeout=120)
+        assert process.exitcode == 0
+    assert status(queue_path) == {"pending": 0, "running": 0, "done": 3, "failed": 0}
+
+    outputs = merge(queue_path)[config_path]
+    assert len(outputs) == 1 and os.path.dirname(outputs[0]) == str(tmp_path)
+    with open(outputs[0], encoding="utf-8") as f:
+        user_nls = [json.loads(line)["request"]["user_nl"] for line in f]
+    assert user_nls == [f"request {index}" for index in range(10)]
+
+    # Merged once, unless forced
+    assert merge(queue_path) == {}
+
+
+def test_merging_again_replaces_the_merged_run(tmp_path):
+    queue_path = str(tmp_path / "queue.db")
+    database_path = str(tmp_path / "results.db")
+    writers = [{"name": "components.writers.sqlite", "args": {"database_path": database_path}}]
+    config_path = _write_config(tmp_path, records=6, writers=writers)
+    enqueue(queue_path, [config_path], shards=2)
+    _start(work_queue._work, queue_path, 60.0, None).join(timeout=120)
+
+    def run_rows():
+        connection = work_queue.connect(database_path)
+        try:
+            return [
+                connection.execute(f"SELECT run_id, COUNT(*) FROM {table} GROUP BY run_id").fetchall()
+                for table in ("runs", "records", "metrics")
+            ]
+        finally:
+            connection.close()
+
+    assert merge(queue_path) == {config_path: [database_path]}
+    runs, records, _ = merged = run_rows()
+    assert len(runs) == 1 and records == [(runs[0][0], 6)]
+
+    # Forced, or after a crash before the merge was recorded, the run is replaced instead of duplicated
+    merge(queue_path, force=True)
+    assert run_rows() == merged
+
+
+def test_items_resolve_their_config_against_the_base_dir(tmp_path):
+    queue_path = str(tmp_path / "queue.db")
+    _write_config(tmp_path, records=4)
+    # A generated config in its own folder, with the data path relative to the solution directory
+    with open(tmp_path / "config.yaml", encoding="utf-8") as f:
+        config = yaml.safe_load(f)
+    config["experimentation"]["data"]["file_path"] = "./data.jsonl"
+    os.makedirs(tmp_path / "generated")
+    config_path = str(tmp_path / "generated" / "config.yaml")
+    with open(config_path, "w", encoding="utf-8") as f:
+        yaml.safe_dump(config, f)
+
+    enqueue(queue_path, [config_path], shards=2, base_dir=str(tmp_path))
+    _start(work_queue._work, queue_path, 60.0, None).join(timeout=120)
+    assert status(queue_path)["done"] == 2
+
+    [output_path] = merge(queue_path)[config_path]
+    with open(output_path, encoding="utf-8") as f:
+        assert [json.loads(line)["request"]["user_nl"] for line in f] == [f"request {index}" for index in range(4)]
@@ -0,0 +1,147 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+"""
+Async execution of experiment runs.
+
+Components may implement, next to `execute`, an optional coroutine:
+
+    async def execute_async(self, data_model: DataModel) -> DataModel
+
+The async runner awaits it, so the OpenAI calls of the records in flight share one event loop
+instead of holding a thread each. Components without it keep working: their `execute` runs in a
+thread pool. The model callers, the LLM judges, the semantic similarity evaluator and the embedding
+pre-processors implement it.
+
+Within a record, the components of the `concurrent_groups` (the evaluators by default, they only
+read the model output and write their own metrics) run concurrently, so e.g. the calls of several
+LLM judges of a record overlap instead of running one after the other.
+
+Configured in the executor section of the experimentation config:
+
+    experimentation:
+      executor:
+        mode: async
+        concurrency: 64        # records in flight, defaults to 64
+        threads: 8             # thread pool running the components without execute_async
+        concurrent_groups:     # component groups run concurrently within a record
+          - evaluators
+
+The `processes` and `cpu_bound` configs work as with the records executor.
+"""
+
+import asyncio
+import inspect
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from ffmodel.data_models.base import ExperimentDataModel
+from utilities.executor import (
+    PipelineExecutor,
+    _OrderedOutput,
+    _run_process_segment,
+    _set_error,
+)
+
+
+def has_execute_async(component: Any) -> bool:
+    return inspect.iscoroutinefunction(getattr(component, "execute_async", None))
+
+
+async def execute_component(component: Any, data_model: Any, executor: Optional[Executor] = None) -> Any:
+    """Awaits the `execute_async` of the component, or runs its `execute` in the executor when it has none"""
+    if has_execute_async(component):
+        return await component.execute_async(data_model)
+    return await asyncio.get_running_loop().run_in_executor(executor, component.execute, data_model)
+
+
+class AsyncExecutor(PipelineExecutor):
+    """
+    Args:
+        - solution_config: The solution config, as loaded by `utilities.executor.load_solution_config`
+        - config: The executor config, defaults to the `executor` entry of the experimentation section
+    """
+
+    def __init__(self, solution_config: Dict[str, Any], config=None):
+        super().__init__(solution_config, config)
+        if self.config.concurrency < 1:
+            raise ValueError(f"concurrency must be at least 1, got {self.config.concurrency}")
+
+    def _segment_name(self, component_config: Dict[str, Any]) -> str:
+        parts = component_config["name"].split(".")
+        group = parts[-2] if len(parts) > 2 else None
+        return group if group in self.config.concurrent_groups else "chain"
+
+    def run(self, data_models: Optional[List[ExperimentDataModel]] = None) -> List[ExperimentDataModel]:
+        """Runs the data models (read with the reader when not given) on an event loop, returns them in order"""
+        if data_models is None:
+            data_models = self.read()
+
+        start = self._start_run(data_models)
+        output = _OrderedOutput(self.writers, len(data_models))
+
+        process_pool = self._start_process_pool()
+        try:
+            with ThreadPoolExecutor(max_workers=self.config.threads) as thread_pool:
+                asyncio.run(self._run_all(data_models, output, thread_pool, process_pool))
+        finally:
+            if process_pool is not None:
+                process_pool.shutdown()
+
+        self._finish(start)
+        return output.results
+
+    async def _run_all(
+        self,
+        data_models: List[ExperimentDataModel],
+        output: _OrderedOutput,
+        thread_pool: ThreadPoolExecutor,
+        process_pool: Optional[ProcessPoolExecutor],
+    ):
+        # The workers take the next record when they are done with theirs, so there are never more than
+        # `concurrency` records in flight, and no coroutine waiting for its turn for each of the others
+        records = iter(enumerate(data_models))
+        loop = asyncio.get_running_loop()
+
+        # The writers run on a thread of their own, one record at a time in the dataset order: a writer
+        # blocking (e.g. the checkpoint mode syncing every record to disk) does not stall the event loop
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix="writers") as writer_thread:
+
+            async def worker():
+                for index, data_model in records:
+                    data_model, success = await self._run_record_async(data_model, thread_pool, process_pool)
+                    await loop.run_in_executor(writer_thread, self._collect, output, index, data_model, success)
+
+            await asyncio.gather(*(worker() for _ in range(min(self.config.concurrency, len(data_models)))))
+
+    async def _run_record_async(
+        self, data_model: Any, thread_pool: ThreadPoolExecutor, process_pool: Optional[ProcessPoolExecutor]
+    ) -> Tuple[Any, bool]:
+        loop = asyncio.get_running_loop()
+        for index, segment in enumerate(self.segments):
+            if segment.cpu_bound:
+                data_model, success = await loop.run_in_executor(process_pool, _run_process_segment, index, data_model)
+                if not success:
+                    return data_model, False
+                continue
+
+            if segment.name in self.config.concurrent_groups:
+                # The components of the group write to separate fields of the data model
+                results = await asyncio.gather(
+                    *(execute_component(component, data_model, thread_pool) for component in segment.components),
+                    return_exceptions=True,
+                )
+                for component, result in zip(segment.components, results):
+                    if isinstance(result, Exception):
+                        _set_error(data_model, component, result)
+                        return data_model, False
+                continue
+
+            for component in segment.components:
+                try:
+                    data_model = await execute_component(component, data_model, thread_pool)
+                except Exception as e:
+                    _set_error(data_model, component, e)
+                    return data_model, False
+
+        return data_model, True
@@ -0,0 +1,145 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+import hashlib
+import json
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, Optional
+
+
+def make_key(*parts: Any) -> str:
+    """
+    Builds a stable cache key from the given parts.
+
+    The parts are serialized to json with sorted keys (falling back to `str` for
+    non-serializable values) and hashed with sha256.
+    """
+    serialized = json.dumps(parts, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+
+
+class CacheStats:
+    """Hit and miss counters for a cache"""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def record(self, hits: int, misses: int):
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def to_dict(self) -> Dict[str, float]:
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hit_rate}
+
+    def __repr__(self) -> str:
+        return f"CacheStats(hits={self.hits}, misses={self.misses}, hit_rate={self.hit_rate:.2%})"
+
+
+class SqliteCache:
+    """
+    Persistent key-value cache backed by a SQLite file.
+
+    Values are pickled. Entries are grouped by namespace so a single file can hold the
+    caches of several components. The database runs in WAL mode, so several processes
+    (e.g. the experiments of a sweep) can share the same cache file.
+
+    When `path` is None, the cache lives in memory for the lifetime of the object.
+    """
+
+    def __init__(self, path: Optional[str] = None, namespace: str = "default", timeout: float = 30.0):
+        self.path = path
+        self.namespace = namespace
+        self.stats = CacheStats()
+        self._lock = threading.Lock()
+
+        if path and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        self._connection = sqlite3.connect(path or ":memory:", timeout=timeout, check_same_thread=False)
+        if path:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "namespace TEXT NOT NULL, key TEXT NOT NULL, value BLOB NOT NULL, created_at REAL NOT NULL, "
+            "PRIMARY KEY (namespace, key))"
+        )
+        self._connection.commit()
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        """Returns a dictionary with the cached values of the keys that are present"""
+        keys = list(dict.fromkeys(keys))
+        found = {}
+
+        # Stay below SQLite's limit on the number of query parameters
+        chunk_size = 500
+        with self._lock:
+            for start in range(0, len(keys), chunk_size):
+                chunk = keys[start : start + chunk_size]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._connection.execute(
+                    f"SELECT key, value FROM cache WHERE namespace = ? AND key IN ({placeholders})",
+                    [self.namespace, *chunk],
+                ).fetchall()
+                for key, value in rows:
+                    found[key] = pickle.loads(value)
+
+        self.stats.record(hits=len(found), misses=len(keys) - len(found))
+        return found
+
+    def set_many(self, items: Dict[str, Any]):
+        """Stores the given values, replacing any existing entries"""
+        if not items:
+            return
+
+        now = time.time()
+        rows = [
+            (self.namespace, key, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), now)
+            for key, value in items.items()
+        ]
+        with self._lock:
+            with self._connection:
+                self._connection.executemany(
+                    "INSERT OR REPLACE INTO cache (namespace, key, value, created_at) VALUES (?, ?, ?, ?)", rows
+                )
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self.get_many([key]).get(key, default)
+
+    def set(self, key: str, value: Any):
+        self.set_many({key: value})
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute(
+                "SELECT COUNT(*) FROM cache WHERE namespace = ?", (self.namespace,)
+            ).fetchone()[0]
+
+    def clear(self):
+        """Removes all entries of this namespace"""
+        with self._lock:
+            with self._connection:
+                self._connection.execute("DELETE FROM cache WHERE namespace = ?", (self.namespace,))
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def __getstate__(self):
+        # Connections can not be pickled, the cache is reopened when unpickled (e.g. in a worker process)
+        return {"path": self.path, "namespace": self.namespace}
+
+    def __setstate__(self, state):
+        self.__init__(state["path"], state["namespace"])
@@ -0,0 +1,114 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+"""
+Per record completion markers to resume interrupted experiment runs.
+
+The checkpoint is an append-only file with the key of every record written to the outputs,
+one per line, flushed to disk as the records are written. When the run is restarted with the
+same checkpoint, the readers skip the records it holds and the writers append to the same
+outputs, so an interrupted run only processes (and pays the model calls of) the remaining records.
+
+The key of a record is the hash of its request, records with identical requests are counted,
+so a dataset with duplicated requests resumes with the right number of each. A checkpoint counts
+the records of a single output: the readers may share it with the writer, but each writer needs its own.
+"""
+
+import os
+import threading
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional
+
+from utilities.cache import make_key
+
+
+def request_key(request: Dict[str, Any]) -> str:
+    """Key of a record, the hash of its request (components do not modify the request)"""
+    return make_key(request)
+
+
+def record_key(data_model) -> str:
+    return request_key(data_model.to_dict()["request"])
+
+
+class Checkpoint:
+    """
+    Args:
+        - path: The path to the checkpoint file, created if it does not exist
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.completed: Counter = Counter()
+        # The output of the writer marking the records, see `claim`
+        self.output_path: Optional[str] = None
+        self._lock = threading.Lock()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                lines = f.read().split("\n")
+            # The last line is only complete when it ends with a newline, a crash may have cut it
+            self.completed.update(line for line in lines[:-1] if line)
+            if lines[-1]:
+                with open(path, "r+", encoding="utf-8") as f:
+                    f.truncate(sum(len(line) + 1 for line in lines[:-1]))
+
+        self._file = open(path, "a", encoding="utf-8")
+
+    def __len__(self) -> int:
+        return sum(self.completed.values())
+
+    def claim(self, output_path: str):
+        """Registers the writer of the output as the one marking the records, raises when another writer did"""
+        output_path = os.path.abspath(output_path)
+        with self._lock:
+            if self.output_path not in (None, output_path):
+                raise ValueError(
+                    f"The checkpoint {self.path} already counts the records of {self.output_path}, "
+                    "each writer needs its own checkpoint_path"
+                )
+            self.output_path = output_path
+
+    def mark(self, keys: Iterable[str]):
+        """Records the keys as completed, they are on disk when this returns"""
+        keys = list(keys)
+        if not keys:
+            return
+        with self._lock:
+            self._file.write("".join(f"{key}\n" for key in keys))
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self.completed.update(keys)
+
+    def skip_completed(self, data_models: List) -> List:
+        """Returns the data models that are not completed yet, in order"""
+        with self._lock:
+            remaining = Counter(self.completed)
+        pending = []
+        for data_model in data_models:
+            key = record_key(data_model)
+            if remaining[key] > 0:
+                remaining[key] -= 1
+            else:
+                pending.append(data_model)
+        return pending
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+_checkpoints: Dict[str, Checkpoint] = {}
+_checkpoints_lock = threading.Lock()
+
+
+def get_checkpoint(path: str) -> Checkpoint:
+    """Returns the checkpoint of this process for the path, shared by the reader and the writers"""
+    key = os.path.abspath(path)
+    with _checkpoints_lock:
+        if key not in _checkpoints:
+            _checkpoints[key] = Checkpoint(path)
+        return _checkpoints[key]
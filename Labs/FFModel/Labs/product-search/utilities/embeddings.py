@@ -0,0 +1,150 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from utilities.cache import SqliteCache, make_key
+from utilities.lazy_import import lazy_import
+from utilities.retry import async_retry_call, retry_call
+
+np = lazy_import("numpy")
+
+
+def _embedding_request_kwargs(model: str) -> Dict[str, str]:
+    """Azure OpenAI addresses models by deployment (engine), OpenAI by model name"""
+    import openai
+
+    if openai.api_type in ("azure", "azure_ad", "azuread"):
+        return {"engine": model}
+    return {"model": model}
+
+
+def get_embeddings(texts: List[str], model: str, retry_parameters: Any = None) -> List[List[float]]:
+    """
+    Calls the OpenAI embedding endpoint once for a list of texts.
+
+    Returns the embeddings in the same order as the texts.
+    OpenAI needs to be initialized (see `ffmodel.utils.openai.initialize_openai`) before calling.
+    """
+    import openai
+
+    response = retry_call(
+        openai.Embedding.create,
+        retry_parameters,
+        input=texts,
+        **_embedding_request_kwargs(model),
+    )
+
+    data = sorted(response["data"], key=lambda item: item["index"])
+    return [item["embedding"] for item in data]
+
+
+async def get_embeddings_async(texts: List[str], model: str, retry_parameters: Any = None) -> List[List[float]]:
+    """Async version of `get_embeddings`"""
+    import openai
+
+    response = await async_retry_call(
+        openai.Embedding.acreate,
+        retry_parameters,
+        input=texts,
+        **_embedding_request_kwargs(model),
+    )
+
+    data = sorted(response["data"], key=lambda item: item["index"])
+    return [item["embedding"] for item in data]
+
+
+async def get_embedding_async(prompt: str, model: str, retry_parameters: Any = None) -> List[float]:
+    """Async counterpart of `ffmodel.utils.openai.get_embedding`, embeds a single text"""
+    return (await get_embeddings_async([prompt], model, retry_parameters))[0]
+
+
+class EmbeddingCache:
+    """
+    Batched and cached embedding lookups.
+
+    Embeddings are keyed by embedding model and text and stored in a `SqliteCache`, so when
+    `cache_path` is given they persist across runs (e.g. the expected outputs of every
+    experiment in a sweep are only embedded once). Texts that are not in the cache are
+    embedded with one call per `batch_size` texts.
+
+    Args:
+        - model: The embedding model (deployment) to use
+        - cache_path: Path to the SQLite cache file, the cache is kept in memory when None
+        - batch_size: Maximum number of texts per embedding call
+        - retry_parameters: ffmodel RetryParameters for the embedding calls
+        - embed_function: Function called with (texts, model, retry_parameters) to embed the missing texts
+        - embed_async_function: Coroutine function with the same arguments, used by `get_embeddings_async`
+    """
+
+    def __init__(
+        self,
+        model: str,
+        cache_path: Optional[str] = None,
+        batch_size: int = 16,
+        retry_parameters: Any = None,
+        embed_function: Callable[[List[str], str, Any], List[List[float]]] = get_embeddings,
+        embed_async_function: Callable[[List[str], str, Any], Awaitable[List[List[float]]]] = get_embeddings_async,
+    ):
+        if batch_size < 1:
+            raise ValueError(f"batch_size must be at least 1, got {batch_size}")
+
+        self.model = model
+        self.batch_size = batch_size
+        self.retry_parameters = retry_parameters
+        self.embed_function = embed_function
+        self.embed_async_function = embed_async_function
+        self.cache = SqliteCache(cache_path, namespace="embeddings")
+
+    def _key(self, text: str) -> str:
+        return make_key(self.model, text)
+
+    def get_embeddings(self, texts: List[str]) -> Dict[str, "np.ndarray"]:
+        """Returns a dictionary from each distinct text to its embedding"""
+        embeddings, missing = self._lookup(texts)
+        for batch in self._batches(missing):
+            self._store(embeddings, batch, self.embed_function(batch, self.model, self.retry_parameters))
+        return embeddings
+
+    async def get_embeddings_async(self, texts: List[str]) -> Dict[str, "np.ndarray"]:
+        """Async version of `get_embeddings`, the batches of missing texts are embedded concurrently"""
+        embeddings, missing = self._lookup(texts)
+        batches = self._batches(missing)
+        results = await asyncio.gather(
+            *(self.embed_async_function(batch, self.model, self.retry_parameters) for batch in batches)
+        )
+        for batch, batch_embeddings in zip(batches, results):
+            self._store(embeddings, batch, batch_embeddings)
+        return embeddings
+
+    def _lookup(self, texts: List[str]):
+        """Returns the cached embeddings of the distinct texts, and the texts missing from the cache"""
+        unique_texts = list(dict.fromkeys(texts))
+        keys = {text: self._key(text) for text in unique_texts}
+
+        cached = self.cache.get_many(keys.values())
+        embeddings = {text: cached[key] for text, key in keys.items() if key in cached}
+        return embeddings, [text for text in unique_texts if text not in embeddings]
+
+    def _batches(self, texts: List[str]) -> List[List[str]]:
+        return [texts[start : start + self.batch_size] for start in range(0, len(texts), self.batch_size)]
+
+    def _store(self, embeddings: Dict[str, "np.ndarray"], batch: List[str], batch_embeddings: List[List[float]]):
+        new_entries = {}
+        for text, embedding in zip(batch, batch_embeddings):
+            embedding = np.asarray(embedding, dtype=np.float64)
+            embeddings[text] = embedding
+            new_entries[self._key(text)] = embedding
+        self.cache.set_many(new_entries)
+
+    def get_matrix(self, texts: List[str], normalize: bool = True) -> "np.ndarray":
+        """Returns the embeddings of the texts as rows of a matrix, optionally L2 normalized"""
+        embeddings = self.get_embeddings(texts)
+        if not texts:
+            return np.zeros((0, 0))
+
+        matrix = np.vstack([embeddings[text] for text in texts])
+        if normalize:
+            matrix = matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+        return matrix
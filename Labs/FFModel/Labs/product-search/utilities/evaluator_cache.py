@@ -0,0 +1,205 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+"""
+Content addressed cache for evaluator results.
+
+Evaluators decorated with `cache_results` accept an optional `result_cache` arg with the path to a
+SQLite file. The metrics of a record are then keyed by:
+    - the evaluator module and a hash of its source file, so editing an evaluator invalidates its entries
+    - the evaluator args (as configured, before `_post_init` consumes them)
+    - the fingerprint (path, size, modification time) of its supporting data files
+    - the user nl, the expected outputs and the completions of the record
+
+On a hit the cached metrics are written to `experiment_metrics` and the evaluator is not executed,
+so rerunning the evaluators of a sweep only pays for the genuinely new completions. The executors log
+the hits and misses of each evaluator when the run finishes.
+"""
+
+import contextvars
+import copy
+import functools
+import hashlib
+import inspect
+import os
+from typing import Any, Dict, Iterable, List, Optional
+
+from utilities.cache import SqliteCache, make_key
+
+RESULT_CACHE_ARG = "result_cache"
+
+# Args that only change how an evaluator runs, not the metrics it computes
+DEFAULT_IGNORED_ARGS = ("workers", "max_concurrency", "batch_size", "cache_path", "retry_params")
+
+# Set while a cached call is running, so a nested cached call (e.g. `execute` looping over
+# `execute_batch` or the other way around) goes straight to the evaluator
+_in_cached_call = contextvars.ContextVar("_in_cached_call", default=False)
+
+
+@functools.lru_cache(maxsize=None)
+def _module_fingerprint(component_class: type) -> str:
+    source_file = inspect.getsourcefile(component_class)
+    digest = hashlib.sha256()
+    if source_file and os.path.isfile(source_file):
+        with open(source_file, "rb") as f:
+            digest.update(f.read())
+    return f"{component_class.__module__}:{digest.hexdigest()}"
+
+
+def _supporting_data_fingerprint(supporting_data: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    fingerprint = {}
+    for name, data_config in (supporting_data or {}).items():
+        file_path = getattr(data_config, "file_path", None)
+        if file_path and os.path.exists(file_path):
+            stat = os.stat(file_path)
+            fingerprint[name] = [file_path, stat.st_size, stat.st_mtime_ns]
+        else:
+            fingerprint[name] = file_path
+    return fingerprint
+
+
+class EvaluatorResultCache:
+    """
+    Result cache of a single evaluator instance, see the module docstring.
+
+    Args:
+        - component: The evaluator, `args` and `supporting_data` are read from it
+        - path: Path to the SQLite cache file
+        - args: Snapshot of the evaluator args to key the results with
+    """
+
+    def __init__(self, component: Any, path: str, args: Dict[str, Any]):
+        self.component_id = component.get_id()
+        self.cache = SqliteCache(path, namespace="evaluator_results")
+        self._base_key = make_key(
+            _module_fingerprint(type(component)),
+            args,
+            _supporting_data_fingerprint(component.supporting_data),
+        )
+
+    @property
+    def stats(self):
+        return self.cache.stats
+
+    def key(self, data_model: Any) -> str:
+        return make_key(
+            self._base_key,
+            data_model.request.user_nl,
+            data_model.request.expected_output,
+            data_model.model_output.completions,
+        )
+
+    def lookup(self, data_models: Iterable[Any]) -> List[Optional[Dict[str, Any]]]:
+        """Returns the cached metrics of each data model, None for the misses"""
+        keys = [self.key(data_model) for data_model in data_models]
+        cached = self.cache.get_many(keys)
+        return [cached.get(key) for key in keys]
+
+    def store(self, data_models: Iterable[Any]):
+        """Stores the metrics the evaluator wrote to the given data models"""
+        self.cache.set_many(
+            {
+                self.key(data_model): data_model.experiment_metrics[self.component_id]
+                for data_model in data_models
+                if self.component_id in data_model.experiment_metrics
+            }
+        )
+
+
+def cache_results(component_class: type = None, *, ignored_args: Iterable[str] = DEFAULT_IGNORED_ARGS):
+    """
+    Class decorator that adds the result cache to an evaluator component.
+
+    The evaluator gets an optional `result_cache` arg, caching is disabled when it is not set.
+    Args listed in `ignored_args` are not part of the cache key.
+    Can be used as `@cache_results` or `@cache_results(ignored_args=[...])`.
+    """
+    if component_class is None:
+        return functools.partial(cache_results, ignored_args=ignored_args)
+
+    ignored_args = set(ignored_args)
+    original_post_init = component_class._post_init
+    original_execute = component_class.execute
+    original_execute_batch = component_class.execute_batch
+
+    @functools.wraps(original_post_init)
+    def _post_init(self):
+        path = self.args.pop(RESULT_CACHE_ARG, None)
+        # Snapshot before `_post_init`, some evaluators pop their args while consuming them
+        args = {name: copy.deepcopy(value) for name, value in self.args.items() if name not in ignored_args}
+        original_post_init(self)
+        self.result_cache = EvaluatorResultCache(self, path, args) if path else None
+
+    def _apply_cached(self, data_models):
+        """Writes the cached metrics to the data models, returns the misses"""
+        cached = self.result_cache.lookup(data_models)
+        misses = []
+        for data_model, metrics in zip(data_models, cached):
+            if metrics is None:
+                misses.append(data_model)
+            else:
+                data_model.experiment_metrics[self.get_id()] = copy.deepcopy(metrics)
+        return misses
+
+    def _log_result_cache(self, records: int, misses: int):
+        # Runs on every call, the executors log the stats of each evaluator once the run finishes
+        self.logger.debug(f"Result cache: {records - misses} of {records} records reused, {self.result_cache.stats}")
+
+    def _run_cached(self, data_models, run):
+        misses = self._apply_cached(data_models)
+        if misses:
+            token = _in_cached_call.set(True)
+            try:
+                run(misses)
+            finally:
+                _in_cached_call.reset(token)
+            self.result_cache.store(misses)
+
+        self._log_result_cache(len(data_models), len(misses))
+
+    @functools.wraps(original_execute)
+    def execute(self, data_model):
+        if self.result_cache is None or _in_cached_call.get():
+            return original_execute(self, data_model)
+
+        self._run_cached([data_model], lambda misses: original_execute(self, misses[0]))
+        return data_model
+
+    @functools.wraps(original_execute_batch)
+    def execute_batch(self, data_models):
+        if self.result_cache is None or _in_cached_call.get():
+            return original_execute_batch(self, data_models)
+
+        self._run_cached(data_models, lambda misses: original_execute_batch(self, misses))
+        return data_models
+
+    component_class._post_init = _post_init
+    component_class._apply_cached = _apply_cached
+    component_class._log_result_cache = _log_result_cache
+    component_class._run_cached = _run_cached
+    component_class.execute = execute
+    component_class.execute_batch = execute_batch
+
+    original_execute_async = getattr(component_class, "execute_async", None)
+    if original_execute_async is not None:
+
+        @functools.wraps(original_execute_async)
+        async def execute_async(self, data_model):
+            if self.result_cache is None or _in_cached_call.get():
+                return await original_execute_async(self, data_model)
+
+            misses = self._apply_cached([data_model])
+            if misses:
+                token = _in_cached_call.set(True)
+                try:
+                    await original_execute_async(self, data_model)
+                finally:
+                    _in_cached_call.reset(token)
+                self.result_cache.store(misses)
+
+            self._log_result_cache(1, len(misses))
+            return data_model
+
+        component_class.execute_async = execute_async
+
+    return component_class
@@ -0,0 +1,472 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+"""
+Parallel executor for experiment runs.
+
+Runs the data models of an experiment through the component chain of a solution config
+(pre-processors -> stitcher -> model caller -> post-processor -> evaluators) independently of
+each other, instead of one component at a time over all the records. Each record runs on a
+thread of a thread pool, which suits the IO-bound components (model callers, embeddings, LLM
+judges). The consecutive components listed as CPU-bound run in a process pool instead, so they
+use every core instead of contending for the GIL.
+
+The results are handed to the writers in the order of the dataset as soon as all the previous
+records are done, so writers with a checkpoint (see `utilities/checkpoint.py`) make the run
+resumable. A component raising for a record sets the error of the data model and skips the
+rest of the chain for that record, the other records are not affected.
+
+The executor is configured in the `experimentation` section of the solution config:
+
+    experimentation:
+      executor:
+        threads: 16            # records in flight, defaults to 8
+        processes: 4           # size of the process pool, defaults to 0 (no process pool)
+        cpu_bound:             # components run in the process pool
+          - components.evaluators.rouge
+          - components.evaluators.bleu
+
+With `instrumentation` enabled in the experimentation section, the components are instrumented and
+the report ends with a table of their timings and OpenAI calls, see `utilities/instrumentation.py`.
+With `profiling`, the selected components are profiled, see `utilities/profiling.py`.
+
+The relative paths of the solution config are resolved like the notebooks of the examples do, relative to
+the directory of the solution config (or `--base-dir`): `project_root` is added to the import path, so the
+`components.*` modules import from anywhere, and the file paths of the data configs are made absolute. The
+writers write relative to the current directory.
+
+Usage, from the project root:
+    python -m utilities.executor examples/nl2python/nl2python_solution.yaml --threads 16
+    python -m utilities.executor examples/nl2sql/solution_configs/nl2sql_config.yaml --base-dir examples/nl2sql
+"""
+
+import argparse
+import importlib
+import logging
+import multiprocessing
+import multiprocessing.util
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field, fields
+from typing import Any, Dict, List, Optional, Tuple
+
+import yaml
+
+from ffmodel.core.solution_config import DataConfig
+from ffmodel.data_models.base import ExperimentDataModel
+from utilities.instrumentation import (
+    ComponentSummary,
+    InstrumentationConfig,
+    InstrumentationStats,
+    format_summary,
+    instrument,
+)
+from utilities.profiling import Profiler, ProfilingConfig, merge_profiles
+
+logger = logging.getLogger(__name__)
+
+EXECUTOR_CONFIG_KEY = "executor"
+
+
+EXECUTOR_MODES = ("records", "pipeline", "async")
+
+
+@dataclass
+class ExecutorConfig:
+    threads: int = 8
+    processes: int = 0
+    cpu_bound: List[str] = field(default_factory=list)
+    # "pipeline" runs the component groups as stages connected by bounded queues, see `utilities/pipeline.py`
+    mode: str = "records"
+    queue_size: int = 64
+    stages: Dict[str, Dict[str, int]] = field(default_factory=dict)
+    # "async" awaits the `execute_async` of the components on an event loop, see `utilities/async_runner.py`
+    concurrency: int = 64
+    concurrent_groups: List[str] = field(default_factory=lambda: ["evaluators"])
+
+    @classmethod
+    def from_solution_config(cls, solution_config: Dict[str, Any]) -> "ExecutorConfig":
+        section = (solution_config.get("experimentation") or {}).get(EXECUTOR_CONFIG_KEY) or {}
+        unknown = set(section) - {config_field.name for config_field in fields(cls)}
+        if unknown:
+            raise ValueError(f"Unknown executor configs: {', '.join(sorted(unknown))}")
+        config = cls(**section)
+        if config.mode not in EXECUTOR_MODES:
+            raise ValueError(f"Invalid executor mode: {config.mode}, must be one of {EXECUTOR_MODES}")
+        return config
+
+
+def load_solution_config(path: str, base_dir: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Loads the solution config and resolves its relative paths against `base_dir`, the directory of the
+    solution config by default: the `project_root` is added to the import path and the file paths of the
+    data configs (the experiment data and the supporting data of the components) are made absolute.
+    """
+    with open(path, encoding="utf-8") as f:
+        solution_config = yaml.safe_load(f)
+
+    base_dir = os.path.abspath(base_dir if base_dir is not None else os.path.dirname(path))
+    project_root = os.path.normpath(os.path.join(base_dir, solution_config.get("project_root") or "."))
+    if project_root not in sys.path:
+        sys.path.insert(0, project_root)
+
+    experimentation = solution_config.get("experimentation") or {}
+    data_configs = [experimentation.get("data") or {}]
+    for component_config in solution_config.get("components") or []:
+        data_configs.extend((component_config.get("supporting_data") or {}).values())
+    for data_config in data_configs:
+        if data_config.get("file_path"):
+            data_config["file_path"] = os.path.normpath(os.path.join(base_dir, data_config["file_path"]))
+    return solution_config
+
+
+def create_component(component_config: Dict[str, Any], class_name: str, solution_id: str, **kwargs) -> Any:
+    """Instantiates the `Component`, `Reader` or `Writer` class of the module named in the component config"""
+    module = importlib.import_module(component_config["name"])
+    supporting_data = {
+        name: DataConfig(**data_config) for name, data_config in (component_config.get("supporting_data") or {}).items()
+    }
+    return getattr(module, class_name)(
+        args=component_config.get("args") or {}, supporting_data=supporting_data, solution_id=solution_id, **kwargs
+    )
+
+
+def _set_error(data_model: Any, component: Any, error: Exception):
+    """Sets the error of the data model, `component` is the component raising or the name of the stage"""
+    data_model.error = {
+        "component": component if isinstance(component, str) else component.get_id(),
+        "type": type(error).__name__,
+        "message": str(error),
+        "traceback": "".join(traceback.format_exception(type(error), error, error.__traceback__)),
+    }
+
+
+def run_chain(components: List[Any], data_model: Any) -> Tuple[Any, bool]:
+    """Runs the data model through the components, stops at the first component raising"""
+    for component in components:
+        try:
+            data_model = component.execute(data_model)
+        except Exception as e:
+            _set_error(data_model, component, e)
+            return data_model, False
+    return data_model, True
+
+
+def run_chain_batch(components: List[Any], data_models: List[Any]) -> List[Tuple[Any, bool]]:
+    """
+    Runs the data models through the components. The components declaring `batch_retry_safe` (the evaluators
+    batching their work, e.g. embeddings, LLM judges) get the whole batch with `execute_batch`: they assign
+    their outputs instead of adding to them, so when the batch raises its records are run again one by one,
+    in place, to find the failing ones, and the other records go on. The other components run record by
+    record: running again a record a model caller already added completions to would add them twice.
+    """
+    results = [(data_model, True) for data_model in data_models]
+    for component in components:
+        pending = [index for index, (_, success) in enumerate(results) if success]
+        if not pending:
+            break
+        if getattr(component, "batch_retry_safe", False):
+            try:
+                outputs = component.execute_batch([results[index][0] for index in pending])
+            except Exception:
+                outputs = None
+            if outputs is not None:
+                for index, data_model in zip(pending, outputs):
+                    results[index] = (data_model, True)
+                continue
+        for index in pending:
+            results[index] = run_chain([component], results[index][0])
+    return results
+
+
+def _wrap_component(
+    component: Any, instrumentation: Optional[InstrumentationConfig], profiler: Optional[Profiler]
+) -> Any:
+    """Adds the profiler hooks and the instrumentation to the component, when enabled"""
+    # The profiler wraps first, so the profiles do not include the instrumentation
+    if profiler is not None:
+        profiler.wrap(component)
+    if instrumentation is not None and instrumentation.enabled:
+        instrument(component, instrumentation)
+    return component
+
+
+# Components of the CPU-bound segments, instantiated once per worker process
+_process_segments: Dict[int, List[Any]] = {}
+
+
+def _init_process(
+    segment_configs: Dict[int, List[Dict[str, Any]]],
+    solution_id: str,
+    instrumentation: Optional[InstrumentationConfig] = None,
+    profiling: Optional[ProfilingConfig] = None,
+):
+    profiler = None
+    if profiling is not None:
+        profiler = Profiler(profiling)
+        # Runs when the worker exits, at the shutdown of the pool
+        multiprocessing.util.Finalize(None, profiler.flush, exitpriority=10)
+    for index, component_configs in segment_configs.items():
+        _process_segments[index] = [
+            _wrap_component(create_component(config, "Component", solution_id), instrumentation, profiler)
+            for config in component_configs
+        ]
+
+
+def _run_process_segment(index: int, data_model: Any) -> Tuple[Any, bool]:
+    return run_chain(_process_segments[index], data_model)
+
+
+def _run_process_batch(index: int, data_models: List[Any]) -> List[Tuple[Any, bool]]:
+    return run_chain_batch(_process_segments[index], data_models)
+
+
+@dataclass
+class _Segment:
+    """Consecutive components of the chain running on the same kind of pool"""
+
+    name: str
+    cpu_bound: bool
+    component_configs: List[Dict[str, Any]]
+    components: List[Any] = field(default_factory=list)
+
+
+@dataclass
+class ExecutionReport:
+    records: int = 0
+    failures: List[Tuple[int, Dict[str, Any]]] = field(default_factory=list)
+    wall_time: float = 0.0
+    # Statistics of each stage with the stage pipeline, see `utilities/pipeline.py`
+    stages: List[Any] = field(default_factory=list)
+    # Timings of each component when instrumented, see `utilities/instrumentation.py`
+    components: List[ComponentSummary] = field(default_factory=list)
+    # Paths of the profiles, see `utilities/profiling.py`
+    profiles: List[str] = field(default_factory=list)
+
+    def __str__(self) -> str:
+        throughput = self.records / self.wall_time if self.wall_time else 0.0
+        summary = (
+            f"{self.records} records in {self.wall_time:.1f}s ({throughput:.1f} records/s), "
+            f"{len(self.failures)} failed"
+        )
+        lines = [summary]
+        if self.stages:
+            bottleneck = max(self.stages, key=lambda stage: stage.utilization)
+            lines.extend(f"  {stage}{'  <- bottleneck' if stage is bottleneck else ''}" for stage in self.stages)
+        if self.components:
+            lines.append(format_summary(self.components))
+        if self.profiles:
+            lines.append(f"Profiles: {', '.join(self.profiles)}")
+        return "\n".join(lines)
+
+
+class _OrderedOutput:
+    """Hands the records to the writers in the dataset order, as soon as all the previous ones are done"""
+
+    def __init__(self, writers: List[Any], count: int):
+        self.writers = writers
+        self.results: List[Any] = [None] * count
+        self.next_index = 0
+
+    def add(self, index: int, data_model: Any):
+        self.results[index] = data_model
+        while self.next_index < len(self.results) and self.results[self.next_index] is not None:
+            for writer in self.writers:
+                writer.execute(self.results[self.next_index])
+            self.next_index += 1
+
+
+class PipelineExecutor:
+    """
+    Args:
+        - solution_config: The solution config, as loaded by `load_solution_config`
+        - config: The executor config, defaults to the `executor` entry of the experimentation section
+    """
+
+    def __init__(self, solution_config: Dict[str, Any], config: Optional[ExecutorConfig] = None):
+        self.solution_config = solution_config
+        self.config = config or ExecutorConfig.from_solution_config(solution_config)
+        self.solution_id = solution_config.get("id", "")
+        self.report = ExecutionReport()
+        self.instrumentation = InstrumentationConfig.from_solution_config(solution_config)
+        self.stats: Optional[InstrumentationStats] = None
+        self.profiling = ProfilingConfig.from_solution_config(solution_config)
+        self.profiler = Profiler(self.profiling) if self.profiling is not None else None
+
+        if self.config.threads < 1:
+            raise ValueError(f"threads must be at least 1, got {self.config.threads}")
+        if self.config.cpu_bound and self.config.processes < 1:
+            raise ValueError("cpu_bound components need a process pool, set processes to at least 1")
+
+        self.segments: List[_Segment] = []
+        for component_config in solution_config.get("components") or []:
+            name = self._segment_name(component_config)
+            cpu_bound = component_config["name"] in self.config.cpu_bound
+            if not self.segments or (self.segments[-1].name, self.segments[-1].cpu_bound) != (name, cpu_bound):
+                self.segments.append(_Segment(name, cpu_bound, []))
+            self.segments[-1].component_configs.append(component_config)
+
+        for segment in self.segments:
+            if not segment.cpu_bound:
+                segment.components = [
+                    _wrap_component(
+                        create_component(config, "Component", self.solution_id), self.instrumentation, self.profiler
+                    )
+                    for config in segment.component_configs
+                ]
+
+        experimentation = solution_config.get("experimentation") or {}
+        # The solution config template names the writers `writer`, the examples `writers`
+        writer_configs = experimentation.get("writers") or experimentation.get("writer") or []
+        self.writers = [create_component(config, "Writer", self.solution_id) for config in writer_configs]
+        self.reader_config = experimentation.get("reader")
+        self.data_config = experimentation.get("data")
+
+    def _segment_name(self, component_config: Dict[str, Any]) -> str:
+        """Consecutive components with the same segment name run on the same pool"""
+        return "chain"
+
+    def read(self) -> List[ExperimentDataModel]:
+        """Loads the data models with the reader of the experimentation section"""
+        if self.reader_config is None or self.data_config is None:
+            raise ValueError("The experimentation section needs a reader and a data config")
+        reader = create_component(
+            self.reader_config,
+            "Reader",
+            self.solution_id,
+            data_config=DataConfig(**self.data_config),
+            data_model_type=ExperimentDataModel,
+        )
+        return reader.execute_batch()
+
+    def run(self, data_models: Optional[List[ExperimentDataModel]] = None) -> List[ExperimentDataModel]:
+        """Runs the data models (read with the reader when not given) through the chain, returns them in order"""
+        if data_models is None:
+            data_models = self.read()
+
+        start = self._start_run(data_models)
+        output = _OrderedOutput(self.writers, len(data_models))
+
+        process_pool = self._start_process_pool()
+        try:
+            with ThreadPoolExecutor(max_workers=self.config.threads) as thread_pool:
+                futures = {
+                    thread_pool.submit(self._run_record, data_model, process_pool): index
+                    for index, data_model in enumerate(data_models)
+                }
+                for future in as_completed(futures):
+                    self._collect(output, futures[future], *future.result())
+        finally:
+            if process_pool is not None:
+                process_pool.shutdown()
+
+        self._finish(start)
+        return output.results
+
+    def _start_run(self, data_models: List[ExperimentDataModel]) -> float:
+        self.report = ExecutionReport(records=len(data_models))
+        self.stats = InstrumentationStats() if self.instrumentation.enabled else None
+        return time.perf_counter()
+
+    def _collect(self, output: "_OrderedOutput", index: int, data_model: Any, success: bool):
+        if not success:
+            self.report.failures.append((index, data_model.error))
+        if self.stats is not None:
+            self.stats.add(data_model.experiment_metrics)
+        output.add(index, data_model)
+
+    def _finish(self, start: float):
+        for writer in self.writers:
+            writer.register_experiment_results()
+
+        self.report.failures.sort(key=lambda failure: failure[0])
+        self.report.wall_time = time.perf_counter() - start
+        if self.stats is not None:
+            self.report.components = self.stats.summary()
+        if self.profiler is not None:
+            # The workers of the process pool wrote their profiles when the pool shut down
+            self.profiler.flush()
+            self.report.profiles = merge_profiles(self.profiling.output_dir, self.profiling.top)
+        logger.info(f"Experiment executed: {self.report}")
+        for segment in self.segments:
+            for component in segment.components:
+                result_cache = getattr(component, "result_cache", None)
+                if result_cache is not None:
+                    logger.info(f"Result cache of {component.get_id()}: {result_cache.stats}")
+        for index, error in self.report.failures[:10]:
+            logger.warning(f"Record {index} failed in {error['component']}: {error['type']}: {error['message']}")
+
+    def _start_process_pool(self) -> Optional[ProcessPoolExecutor]:
+        segment_configs = {
+            index: segment.component_configs for index, segment in enumerate(self.segments) if segment.cpu_bound
+        }
+        if not segment_configs:
+            return None
+        # Spawned rather than forked, the parent runs threads by the time the workers start
+        return ProcessPoolExecutor(
+            max_workers=self.config.processes,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_process,
+            initargs=(segment_configs, self.solution_id, self.instrumentation, self.profiling),
+        )
+
+    def _run_record(self, data_model: Any, process_pool: Optional[ProcessPoolExecutor]) -> Tuple[Any, bool]:
+        for index, segment in enumerate(self.segments):
+            if segment.cpu_bound:
+                data_model, success = process_pool.submit(_run_process_segment, index, data_model).result()
+            else:
+                data_model, success = run_chain(segment.components, data_model)
+            if not success:
+                return data_model, False
+        return data_model, True
+
+
+def create_executor(solution_config: Dict[str, Any], config: Optional[ExecutorConfig] = None) -> PipelineExecutor:
+    """Creates the executor of the mode of the executor config"""
+    config = config or ExecutorConfig.from_solution_config(solution_config)
+    if config.mode == "pipeline":
+        from utilities.pipeline import StagePipeline
+
+        return StagePipeline(solution_config, config)
+    if config.mode == "async":
+        from utilities.async_runner import AsyncExecutor
+
+        return AsyncExecutor(solution_config, config)
+    return PipelineExecutor(solution_config, config)
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Runs an experiment with records processed in parallel")
+    parser.add_argument("solution_config", help="Path to the solution config")
+    parser.add_argument("--environment-config", help="Path to the environment config, e.g. .ffmodel")
+    parser.add_argument(
+        "--base-dir", help="Directory the relative paths of the config are relative to, defaults to its directory"
+    )
+    parser.add_argument("--threads", type=int, help="Overrides the number of records in flight")
+    parser.add_argument("--processes", type=int, help="Overrides the size of the process pool")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    if args.environment_config:
+        from ffmodel.core.environment_config import EnvironmentConfigs
+
+        EnvironmentConfigs.initialize(args.environment_config)
+
+    solution_config = load_solution_config(args.solution_config, args.base_dir)
+    config = ExecutorConfig.from_solution_config(solution_config)
+    if args.threads is not None:
+        config.threads = args.threads
+    if args.processes is not None:
+        config.processes = args.processes
+
+    executor = create_executor(solution_config, config)
+    executor.run()
+    print(executor.report)
+    return 1 if executor.report.failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
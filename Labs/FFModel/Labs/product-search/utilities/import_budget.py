@@ -0,0 +1,113 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+"""
+Import time budget check for the component modules.
+
+Each module is imported in a fresh interpreter with `python -X importtime`, so the measurement
+matches what an inference container or a sweep worker pays at startup. The check fails when a
+module's cumulative import time exceeds the budget, and lists the slowest imports it pulled in.
+
+Usage, from the project root:
+    python -m utilities.import_budget                       # all modules under components/
+    python -m utilities.import_budget components.evaluators.bleu --budget 0.3
+"""
+
+import argparse
+import os
+import pkgutil
+import re
+import subprocess
+import sys
+from dataclasses import dataclass, field
+from typing import List, Tuple
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_BUDGET_SECONDS = 0.5
+
+_IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)\s*$")
+
+
+@dataclass
+class ImportReport:
+    module: str
+    cumulative_seconds: float
+    slowest_imports: List[Tuple[str, float]] = field(default_factory=list)
+    error: str = None
+
+
+def discover_component_modules(package: str = "components") -> List[str]:
+    """Lists the component modules under the given package, skipping the templates"""
+    package_path = os.path.join(PROJECT_ROOT, *package.split("."))
+    modules = []
+    for module_info in pkgutil.walk_packages([package_path], prefix=f"{package}."):
+        if module_info.ispkg or module_info.name.endswith("_template"):
+            continue
+        modules.append(module_info.name)
+    return sorted(modules)
+
+
+def measure_import(module: str, top: int = 5) -> ImportReport:
+    """Imports the module in a fresh interpreter and parses the `-X importtime` output"""
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=PROJECT_ROOT,
+        capture_output=True,
+        text=True,
+    )
+
+    cumulative = {}
+    self_times = []
+    for line in process.stderr.splitlines():
+        match = _IMPORTTIME_LINE.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, _, name = match.groups()
+        # Only top level entries of the report include everything they imported
+        cumulative[name] = max(cumulative.get(name, 0), int(cumulative_us))
+        self_times.append((name, int(self_us) / 1e6))
+
+    report = ImportReport(module=module, cumulative_seconds=cumulative.get(module, 0) / 1e6)
+    report.slowest_imports = sorted(self_times, key=lambda item: item[1], reverse=True)[:top]
+    if process.returncode != 0:
+        report.error = process.stderr.strip().splitlines()[-1] if process.stderr.strip() else "import failed"
+
+    return report
+
+
+def check_budget(modules: List[str], budget: float = DEFAULT_BUDGET_SECONDS) -> List[ImportReport]:
+    """Measures every module and prints a report, returns the reports that failed"""
+    failures = []
+    for module in modules:
+        report = measure_import(module)
+        over_budget = report.error is not None or report.cumulative_seconds > budget
+        status = "FAIL" if over_budget else "ok"
+        print(f"{status:4} {report.cumulative_seconds:7.3f}s  {module}")
+        if report.error:
+            print(f"       error: {report.error}")
+        if over_budget:
+            for name, seconds in report.slowest_imports:
+                print(f"       {seconds:7.3f}s  {name}")
+            failures.append(report)
+
+    return failures
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Checks the import time of component modules against a budget")
+    parser.add_argument("modules", nargs="*", help="Modules to check, defaults to every module under components/")
+    parser.add_argument(
+        "--budget", type=float, default=DEFAULT_BUDGET_SECONDS, help="Maximum import time per module, in seconds"
+    )
+    args = parser.parse_args(argv)
+
+    modules = args.modules or discover_component_modules()
+    failures = check_budget(modules, args.budget)
+    print(f"{len(modules) - len(failures)} of {len(modules)} modules within the {args.budget}s budget")
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
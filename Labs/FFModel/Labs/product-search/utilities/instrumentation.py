@@ -0,0 +1,355 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+"""
+Per component instrumentation of experiment runs.
+
+The executors wrap the `execute`, `execute_batch` and `execute_async` of every component instance
+and measure, for each record:
+    - wall_ms: the wall time of the component
+    - cpu_ms: the CPU time of the thread running it (not measured for `execute_async`, the event
+      loop interleaves the records)
+    - calls, call_ms, tokens: the OpenAI calls made by the component, their total latency and the
+      tokens of their usage, retries included. The calls are attributed through a context variable,
+      so the calls of the threads and tasks started by the component count when they copy the context
+      (like the LLM judges do)
+    - peak_kb: the peak of the memory traced by tracemalloc above the memory at the start, when
+      enabled. tracemalloc traces the whole process, run with `threads: 1` for exact peaks
+
+A batch is measured once and split evenly over its records. The measurements are written to the
+`experiment_metrics` of the record under the reserved `_instrumentation` key, by component id,
+logged at debug level, and summarized per component at the end of the run (p50/p95/p99 of the wall
+time, the CPU time and the call latency), in the log and in the execution report.
+
+Configured in the experimentation section of the solution config:
+
+    experimentation:
+      instrumentation:
+        enabled: true
+        tracemalloc: false     # traces the memory peaks, slows the run down noticeably
+        openai_calls: true     # counts the OpenAI calls
+
+Metric keys starting with `_` are reserved: the result analysis utilities and the parquet and
+SQLite writers skip them, the jsonl writer keeps the whole data model.
+"""
+
+import contextvars
+import functools
+import inspect
+import logging
+import math
+import threading
+import time
+import tracemalloc
+from collections import defaultdict
+from dataclasses import dataclass, fields
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+INSTRUMENTATION_CONFIG_KEY = "instrumentation"
+INSTRUMENTATION_METRICS_KEY = "_instrumentation"
+
+PERCENTILES = (50, 95, 99)
+
+# OpenAI resources and methods counted as external calls
+_OPENAI_METHODS = {
+    "Completion": ("create", "acreate"),
+    "ChatCompletion": ("create", "acreate"),
+    "Embedding": ("create", "acreate"),
+}
+
+
+@dataclass
+class InstrumentationConfig:
+    enabled: bool = False
+    tracemalloc: bool = False
+    openai_calls: bool = True
+
+    @classmethod
+    def from_solution_config(cls, solution_config: Dict[str, Any]) -> "InstrumentationConfig":
+        section = (solution_config.get("experimentation") or {}).get(INSTRUMENTATION_CONFIG_KEY) or {}
+        unknown = set(section) - {config_field.name for config_field in fields(cls)}
+        if unknown:
+            raise ValueError(f"Unknown instrumentation configs: {', '.join(sorted(unknown))}")
+        return cls(**section)
+
+
+class _Measurement:
+    """Measurement of one component execution, the external calls are added from any thread"""
+
+    def __init__(self):
+        self.wall_ms = 0.0
+        self.cpu_ms: Optional[float] = None
+        self.peak_kb: Optional[float] = None
+        self.calls = 0
+        self.call_ms = 0.0
+        self.tokens = 0
+        self._lock = threading.Lock()
+
+    def add_call(self, latency: float, tokens: int):
+        with self._lock:
+            self.calls += 1
+            self.call_ms += latency * 1000
+            self.tokens += tokens
+
+    def to_dict(self, share: int = 1) -> Dict[str, Any]:
+        measurement = {
+            "wall_ms": self.wall_ms / share,
+            "cpu_ms": None if self.cpu_ms is None else self.cpu_ms / share,
+            "calls": self.calls / share,
+            "call_ms": self.call_ms / share,
+            "tokens": self.tokens / share,
+        }
+        if self.peak_kb is not None:
+            measurement["peak_kb"] = self.peak_kb
+        return measurement
+
+
+# The measurement of the component running in the current context
+_current = contextvars.ContextVar("_current_measurement", default=None)
+# Id of the instrumented component running in the current context, so nested calls of the same
+# component (e.g. `execute_batch` looping over `execute`) are measured once
+_running = contextvars.ContextVar("_running_component", default=None)
+
+
+def record_external_call(latency: float, tokens: int = 0):
+    """Attributes an external call to the component running in the current context, if any"""
+    measurement = _current.get()
+    if measurement is not None:
+        measurement.add_call(latency, tokens)
+
+
+def _usage_tokens(response: Any) -> int:
+    usage = response.get("usage") if isinstance(response, dict) else getattr(response, "usage", None)
+    if not usage:
+        return 0
+    return int(usage.get("total_tokens", 0) if isinstance(usage, dict) else getattr(usage, "total_tokens", 0))
+
+
+def _timed_call(function: Callable) -> Callable:
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if _current.get() is None:
+            return function(*args, **kwargs)
+        start = time.perf_counter()
+        response = None
+        try:
+            response = function(*args, **kwargs)
+            return response
+        finally:
+            record_external_call(time.perf_counter() - start, _usage_tokens(response))
+
+    return wrapper
+
+
+def _timed_async_call(function: Callable) -> Callable:
+    @functools.wraps(function)
+    async def wrapper(*args, **kwargs):
+        if _current.get() is None:
+            return await function(*args, **kwargs)
+        start = time.perf_counter()
+        response = None
+        try:
+            response = await function(*args, **kwargs)
+            return response
+        finally:
+            record_external_call(time.perf_counter() - start, _usage_tokens(response))
+
+    return wrapper
+
+
+_openai_patched = False
+_patch_lock = threading.Lock()
+
+
+def count_openai_calls():
+    """Wraps the create and acreate methods of the OpenAI resources to attribute their calls, once per process"""
+    global _openai_patched
+    with _patch_lock:
+        if _openai_patched:
+            return
+        _openai_patched = True
+        try:
+            import openai
+        except ImportError:
+            logger.warning("The openai package is not installed, the OpenAI calls are not counted")
+            return
+
+        for resource_name, methods in _OPENAI_METHODS.items():
+            resource = getattr(openai, resource_name, None)
+            for method in methods:
+                function = getattr(resource, method, None)
+                if function is None:
+                    continue
+                wrap = _timed_async_call if method == "acreate" else _timed_call
+                # Bound classmethods, the wrappers are set as plain functions of the class
+                setattr(resource, method, wrap(function))
+
+
+class _Probe:
+    """Measures the wall time, CPU time and memory peak of a component execution"""
+
+    def __init__(self, measure_cpu: bool, trace_memory: bool):
+        self.measurement = _Measurement()
+        self.measure_cpu = measure_cpu
+        self.trace_memory = trace_memory and tracemalloc.is_tracing()
+
+    def __enter__(self) -> _Measurement:
+        self._token = _current.set(self.measurement)
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+            self._memory = tracemalloc.get_traced_memory()[0]
+        self._cpu = time.thread_time() if self.measure_cpu else None
+        self._wall = time.perf_counter()
+        return self.measurement
+
+    def __exit__(self, *exc_info):
+        self.measurement.wall_ms = (time.perf_counter() - self._wall) * 1000
+        if self._cpu is not None:
+            self.measurement.cpu_ms = (time.thread_time() - self._cpu) * 1000
+        if self.trace_memory:
+            self.measurement.peak_kb = max(0, tracemalloc.get_traced_memory()[1] - self._memory) / 1024
+        _current.reset(self._token)
+
+
+def _write(data_models: List[Any], component_id: str, measurement: _Measurement):
+    values = measurement.to_dict(share=max(1, len(data_models)))
+    for data_model in data_models:
+        metrics = getattr(data_model, "experiment_metrics", None)
+        if metrics is None:
+            continue
+        # setdefault is atomic, the evaluators of a record may run concurrently
+        metrics.setdefault(INSTRUMENTATION_METRICS_KEY, {})[component_id] = values
+    logger.debug(f"{component_id}: {values} for {len(data_models)} records")
+
+
+def instrument(component: Any, config: InstrumentationConfig) -> Any:
+    """Wraps the execute methods of the component instance, returns the component"""
+    if config.openai_calls:
+        count_openai_calls()
+    if config.tracemalloc and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+    component_id = component.get_id()
+
+    def measured(function: Callable, batch: bool) -> Callable:
+        @functools.wraps(function)
+        def wrapper(data):
+            if _running.get() == component_id:
+                return function(data)
+            token = _running.set(component_id)
+            probe = _Probe(measure_cpu=True, trace_memory=config.tracemalloc)
+            result = None
+            try:
+                with probe:
+                    result = function(data)
+                return result
+            finally:
+                _running.reset(token)
+                outputs = result if result is not None else data
+                _write(list(outputs) if batch else [outputs], component_id, probe.measurement)
+
+        return wrapper
+
+    def measured_async(function: Callable) -> Callable:
+        @functools.wraps(function)
+        async def wrapper(data_model):
+            if _running.get() == component_id:
+                return await function(data_model)
+            token = _running.set(component_id)
+            probe = _Probe(measure_cpu=False, trace_memory=config.tracemalloc)
+            result = None
+            try:
+                with probe:
+                    result = await function(data_model)
+                return result
+            finally:
+                _running.reset(token)
+                _write([result if result is not None else data_model], component_id, probe.measurement)
+
+        return wrapper
+
+    component.execute = measured(component.execute, batch=False)
+    if hasattr(component, "execute_batch"):
+        component.execute_batch = measured(component.execute_batch, batch=True)
+    if inspect.iscoroutinefunction(getattr(component, "execute_async", None)):
+        component.execute_async = measured_async(component.execute_async)
+    return component
+
+
+def _percentile(sorted_values: List[float], percentile: float) -> float:
+    """Nearest rank percentile of sorted values"""
+    rank = max(1, math.ceil(percentile / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+@dataclass
+class ComponentSummary:
+    component: str
+    records: int
+    # p50/p95/p99 in milliseconds, None when not measured
+    wall_ms: List[float]
+    cpu_ms: Optional[List[float]]
+    call_ms: Optional[List[float]]
+    calls: float
+    tokens: float
+    peak_kb: Optional[float]
+
+    def __str__(self) -> str:
+        def percentiles(values: Optional[List[float]]) -> str:
+            return "-" if values is None else "/".join(f"{value:.1f}" for value in values)
+
+        peak = "-" if self.peak_kb is None else f"{self.peak_kb:.0f}"
+        return (
+            f"{self.component:<56} {self.records:>7} {percentiles(self.wall_ms):>22} {percentiles(self.cpu_ms):>22} "
+            f"{self.calls:>7.0f} {percentiles(self.call_ms):>22} {self.tokens:>9.0f} {peak:>9}"
+        )
+
+
+SUMMARY_HEADER = (
+    f"{'component':<56} {'records':>7} {'wall p50/p95/p99 ms':>22} {'cpu p50/p95/p99 ms':>22} "
+    f"{'calls':>7} {'call p50/p95/p99 ms':>22} {'tokens':>9} {'peak kb':>9}"
+)
+
+
+class InstrumentationStats:
+    """Collects the measurements of the records of a run, in the order the components first ran"""
+
+    def __init__(self):
+        self.values: Dict[str, Dict[str, List[float]]] = defaultdict(lambda: defaultdict(list))
+
+    def add(self, experiment_metrics: Optional[Dict[str, Any]]):
+        for component_id, measurement in ((experiment_metrics or {}).get(INSTRUMENTATION_METRICS_KEY) or {}).items():
+            values = self.values[component_id]
+            for name, value in measurement.items():
+                if value is not None:
+                    values[name].append(value)
+
+    def summary(self) -> List[ComponentSummary]:
+        def percentiles(values: List[float], only_positive: bool = False) -> Optional[List[float]]:
+            values = sorted(value for value in values if value > 0 or not only_positive)
+            if not values:
+                return None
+            return [_percentile(values, percentile) for percentile in PERCENTILES]
+
+        summaries = []
+        for component_id, values in self.values.items():
+            summaries.append(
+                ComponentSummary(
+                    component=component_id,
+                    records=len(values["wall_ms"]),
+                    wall_ms=percentiles(values["wall_ms"]),
+                    cpu_ms=percentiles(values["cpu_ms"]),
+                    # Latency of the records making calls
+                    call_ms=percentiles(values["call_ms"], only_positive=True),
+                    calls=sum(values["calls"]),
+                    tokens=sum(values["tokens"]),
+                    peak_kb=max(values["peak_kb"]) if values["peak_kb"] else None,
+                )
+            )
+        return summaries
+
+
+def format_summary(summaries: List[ComponentSummary]) -> str:
+    return "\n".join([SUMMARY_HEADER, *(str(summary) for summary in summaries)])
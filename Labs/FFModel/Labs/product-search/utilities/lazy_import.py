@@ -0,0 +1,49 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+import importlib
+import threading
+from types import ModuleType
+
+
+class LazyModule:
+    """
+    Stand-in for a module that is only imported on first attribute access.
+
+    Component modules use it for heavy dependencies (nltk, rouge_score, sqlglot, numpy, ...)
+    so that importing a component, or a solution that does not use it, stays cheap:
+
+        np = lazy_import("numpy")
+        ...
+        np.dot(a, b)  # numpy is imported here
+    """
+
+    def __init__(self, name: str):
+        self.__dict__["_name"] = name
+        self.__dict__["_module"] = None
+        self.__dict__["_lock"] = threading.Lock()
+
+    def _load(self) -> ModuleType:
+        module = self.__dict__["_module"]
+        if module is None:
+            with self.__dict__["_lock"]:
+                module = self.__dict__["_module"]
+                if module is None:
+                    module = importlib.import_module(self.__dict__["_name"])
+                    self.__dict__["_module"] = module
+        return module
+
+    def __getattr__(self, attribute: str):
+        return getattr(self._load(), attribute)
+
+    def __setattr__(self, attribute: str, value):
+        setattr(self._load(), attribute, value)
+
+    def __repr__(self) -> str:
+        state = "loaded" if self.__dict__["_module"] is not None else "not loaded"
+        return f"<lazy module '{self.__dict__['_name']}' ({state})>"
+
+
+def lazy_import(name: str) -> LazyModule:
+    """Returns a lazily imported module, see `LazyModule`"""
+    return LazyModule(name)
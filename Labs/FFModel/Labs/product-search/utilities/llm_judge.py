@@ -0,0 +1,156 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+import asyncio
+import contextvars
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from utilities.cache import SqliteCache, make_key
+
+# (user prompt, expected output, completion)
+JudgeTask = Tuple[str, str, str]
+# (score, explanation)
+Verdict = Tuple[float, str]
+
+
+class JudgeRunner:
+    """
+    Runs LLM-as-judge scoring calls concurrently and caches the verdicts.
+
+    Verdicts are keyed by a hash of the instruction template, the filtered OpenAI kwargs and the
+    (prompt, expected output, completion) strings, so identical tuples are only scored once per call
+    and, when `cache_path` is given, only once across reruns of the experiments.
+
+    Args:
+        - score_function: Function called with (prompt, expected_output, completion) returning (score, explanation)
+        - instructions: The instruction template, its contents are part of the cache key
+        - model_kwargs: The OpenAI kwargs used for the calls, they are part of the cache key
+        - max_concurrency: Maximum number of scoring calls in flight
+        - cache_path: Path to the SQLite verdict cache, verdicts are cached in memory when None
+        - namespace: Cache namespace, so several judges can share a cache file
+        - async_score_function: Coroutine function with the arguments of `score_function`, used by `score_async`
+    """
+
+    def __init__(
+        self,
+        score_function: Callable[[str, str, str], Verdict],
+        instructions: str,
+        model_kwargs: Dict[str, Any],
+        max_concurrency: int = 1,
+        cache_path: Optional[str] = None,
+        namespace: str = "llm_judge",
+        async_score_function: Optional[Callable[[str, str, str], Awaitable[Verdict]]] = None,
+    ):
+        if max_concurrency < 1:
+            raise ValueError(f"max_concurrency must be at least 1, got {max_concurrency}")
+
+        self.score_function = score_function
+        self.async_score_function = async_score_function
+        self.instructions_hash = hashlib.sha256(instructions.encode("utf-8")).hexdigest()
+        self.model_kwargs = model_kwargs
+        self.max_concurrency = max_concurrency
+        self.cache = SqliteCache(cache_path, namespace=namespace)
+        self._executor = None
+        # Bounds the calls in flight across all the `score_async` calls of the event loop
+        self._semaphore: Optional[Tuple[Any, asyncio.Semaphore]] = None
+
+    def _key(self, task: JudgeTask) -> str:
+        return make_key(self.instructions_hash, self.model_kwargs, *task)
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="llm_judge")
+        return self._executor
+
+    def _lookup(self, tasks: List[JudgeTask]):
+        """Returns the keys of the tasks, their cached verdicts, and the distinct uncached tasks by key"""
+        keys = [self._key(task) for task in tasks]
+        verdicts = self.cache.get_many(keys)
+
+        # Identical tuples within the call are only scored once
+        pending = {}
+        for key, task in zip(keys, tasks):
+            if key not in verdicts and key not in pending:
+                pending[key] = task
+        return keys, verdicts, pending
+
+    def score(self, tasks: List[JudgeTask]) -> List[Verdict]:
+        """Returns the verdict for each task, in order, only calling the model for uncached tuples"""
+        keys, verdicts, pending = self._lookup(tasks)
+
+        if pending:
+            if self.max_concurrency == 1 or len(pending) == 1:
+                new_verdicts = {}
+                for key, task in pending.items():
+                    try:
+                        new_verdicts[key] = tuple(self.score_function(*task))
+                    except Exception:
+                        # Keep the verdicts that were paid for, the failed call stops the others
+                        self.cache.set_many(new_verdicts)
+                        raise
+            else:
+                # The pool size bounds the number of calls in flight, the calls run in the context of the
+                # caller so they are attributed to its component when instrumented
+                executor = self._get_executor()
+                futures = {
+                    key: executor.submit(contextvars.copy_context().run, self.score_function, *task)
+                    for key, task in pending.items()
+                }
+
+                new_verdicts = {}
+                error = None
+                for key, future in futures.items():
+                    try:
+                        new_verdicts[key] = tuple(future.result())
+                    except Exception as e:
+                        error = error or e
+
+                # Keep the verdicts that were paid for, even if another call failed
+                if error is not None:
+                    self.cache.set_many(new_verdicts)
+                    raise error
+
+            self.cache.set_many(new_verdicts)
+            verdicts.update(new_verdicts)
+
+        return [verdicts[key] for key in keys]
+
+    async def score_async(self, tasks: List[JudgeTask]) -> List[Verdict]:
+        """Async version of `score`, up to `max_concurrency` calls are in flight on the event loop"""
+        if self.async_score_function is None:
+            raise ValueError("score_async needs an async_score_function")
+
+        keys, verdicts, pending = self._lookup(tasks)
+        if pending:
+            semaphore = self._get_semaphore()
+
+            async def score_task(task: JudgeTask) -> Verdict:
+                async with semaphore:
+                    return tuple(await self.async_score_function(*task))
+
+            results = await asyncio.gather(*(score_task(task) for task in pending.values()), return_exceptions=True)
+
+            # Keep the verdicts that were paid for, even if another call failed
+            errors = [result for result in results if isinstance(result, BaseException)]
+            new_verdicts = {
+                key: result for key, result in zip(pending, results) if not isinstance(result, BaseException)
+            }
+            self.cache.set_many(new_verdicts)
+            if errors:
+                raise errors[0]
+            verdicts.update(new_verdicts)
+
+        return [verdicts[key] for key in keys]
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._semaphore[0] is not loop:
+            self._semaphore = (loop, asyncio.Semaphore(self.max_concurrency))
+        return self._semaphore[1]
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
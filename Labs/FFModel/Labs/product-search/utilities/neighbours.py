@@ -0,0 +1,213 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+"""
+Precomputed nearest neighbours of the evaluation prompts in an embedding bank.
+
+The few shot and dynamic context pre-processors embed the prompt of every record and rank the
+whole bank by cosine similarity, and a sweep over their `count` and `reverse` repeats this for the
+same prompts and the same bank in every run. The neighbour table holds the top `k` bank items of
+every prompt of an evaluation set, computed once offline. When the component finds the table of its
+bank, a record with a prompt in the table and `count <= k` is a lookup: no embedding call and no
+similarity computation.
+
+Tables are stored in a directory, one file per bank named after the bank hash (the hash of the
+embedding model and the embeddings of the bank), so a table is never used with another bank or a
+bank regenerated since. The components take the directory as the `neighbour_tables` supporting data.
+
+Usage, from the project root:
+    python -m utilities.neighbours data/few_shots/bank.pkl data/eval.jsonl data/neighbours/ --k 20 \\
+        --cached-embeddings data/eval_embeddings.pkl --environment-config .ffmodel
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import pickle
+import sys
+from typing import Any, Dict, List, Optional
+
+from utilities.lazy_import import lazy_import
+
+np = lazy_import("numpy")
+
+logger = logging.getLogger(__name__)
+
+TABLE_EXTENSION = ".pkl"
+
+# Query rows ranked per matrix product when computing a table
+_QUERY_BATCH_SIZE = 1024
+
+
+def bank_hash(embedding_model: str, items: List[Dict[str, Any]]) -> str:
+    """Hash of a bank, from its embedding model and the embeddings of its items in order"""
+    digest = hashlib.sha256(embedding_model.encode("utf-8"))
+    digest.update(np.asarray([item["embedding"] for item in items], dtype=np.float64).tobytes())
+    return digest.hexdigest()
+
+
+def table_path(directory: str, hash_: str) -> str:
+    return os.path.join(directory, f"{hash_}{TABLE_EXTENSION}")
+
+
+class NeighbourTable:
+    """
+    The top `k` bank items of each prompt, closest first.
+
+    Args:
+        - user_nls: The prompts
+        - ids: The bank indices of the neighbours of each prompt, shape (prompts, k)
+        - scores: The cosine similarities of the neighbours, shape (prompts, k)
+        - metadata: The bank hash, embedding model, k and bank size
+    """
+
+    def __init__(self, user_nls: List[str], ids: "np.ndarray", scores: "np.ndarray", metadata: Dict[str, Any]):
+        self.rows = {user_nl: row for row, user_nl in enumerate(user_nls)}
+        self.ids = ids
+        self.scores = scores
+        self.metadata = metadata
+        self.k = metadata["k"]
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def lookup(self, user_nl: str, count: int) -> Optional[List[int]]:
+        """The bank indices of the `count` closest items, None when the table can not answer"""
+        row = self.rows.get(user_nl)
+        if row is None or count > self.k:
+            return None
+        return self.ids[row, :count].tolist()
+
+    def save(self, directory: str) -> str:
+        os.makedirs(directory, exist_ok=True)
+        path = table_path(directory, self.metadata["bank_hash"])
+        table = {"metadata": self.metadata, "user_nl": list(self.rows), "ids": self.ids, "scores": self.scores}
+        with open(path, "wb") as f:
+            pickle.dump(table, f)
+        return path
+
+    @classmethod
+    def load(cls, path: str) -> "NeighbourTable":
+        with open(path, "rb") as f:
+            table = pickle.load(f)
+        return cls(table["user_nl"], table["ids"], table["scores"], table["metadata"])
+
+
+def load_neighbour_table(directory: Optional[str], hash_: str) -> Optional[NeighbourTable]:
+    """Loads the table of the bank from the directory, None when there is none"""
+    if not directory:
+        return None
+    path = table_path(directory, hash_)
+    if not os.path.exists(path):
+        logger.warning(f"No neighbour table for bank {hash_[:12]} in {directory}, the neighbours are computed")
+        return None
+    table = NeighbourTable.load(path)
+    logger.info(f"Loaded the neighbour table of bank {hash_[:12]}: {len(table)} prompts, k={table.k}")
+    return table
+
+
+def _normalize(matrix: "np.ndarray") -> "np.ndarray":
+    return matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+
+
+def compute_neighbour_table(
+    bank: Dict[str, Any], user_nls: List[str], query_embeddings: "np.ndarray", k: int
+) -> NeighbourTable:
+    """
+    Ranks the bank items for each prompt by cosine similarity, like the components do.
+
+    Args:
+        - bank: The bank as stored in the few shot or context pickle file, with metadata and data
+        - user_nls: The prompts
+        - query_embeddings: The embeddings of the prompts, one row per prompt
+        - k: Number of neighbours to keep per prompt, capped to the bank size
+    """
+    embedding_model = bank["metadata"]["embedding_model"]
+    items = bank["data"]
+    k = min(k, len(items))
+    bank_matrix = _normalize(np.asarray([item["embedding"] for item in items], dtype=np.float64))
+    queries = _normalize(np.asarray(query_embeddings, dtype=np.float64))
+
+    ids = np.empty((len(user_nls), k), dtype=np.int32)
+    scores = np.empty((len(user_nls), k), dtype=np.float32)
+    for start in range(0, len(user_nls), _QUERY_BATCH_SIZE):
+        similarities = queries[start : start + _QUERY_BATCH_SIZE] @ bank_matrix.T
+        # Stable sort, ties keep the bank order like the sort of the components
+        order = np.argsort(-similarities, axis=1, kind="stable")[:, :k]
+        ids[start : start + len(order)] = order
+        scores[start : start + len(order)] = np.take_along_axis(similarities, order, axis=1)
+
+    metadata = {
+        "bank_hash": bank_hash(embedding_model, items),
+        "embedding_model": embedding_model,
+        "k": k,
+        "bank_size": len(items),
+    }
+    return NeighbourTable(user_nls, ids, scores, metadata)
+
+
+def _read_user_nls(eval_file: str) -> List[str]:
+    """The distinct prompts of an evaluation set in the experiment jsonl format (nl_prompt or user_nl)"""
+    user_nls = []
+    with open(eval_file, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                data_point = json.loads(line)
+                user_nls.append(data_point["nl_prompt"] if "nl_prompt" in data_point else data_point["user_nl"])
+    return list(dict.fromkeys(user_nls))
+
+
+def _embed_user_nls(
+    user_nls: List[str], embedding_model: str, cached_embeddings: Optional[str], embedding_cache: Optional[str]
+) -> "np.ndarray":
+    embeddings = {}
+    if cached_embeddings:
+        # Same format as the cached_embeddings supporting data of the components
+        with open(cached_embeddings, "rb") as f:
+            embeddings = {data["user_nl"]: data["embedding"] for data in pickle.load(f)["data"]}
+
+    missing = [user_nl for user_nl in user_nls if user_nl not in embeddings]
+    if missing:
+        from ffmodel.utils.openai import OpenAIConfig, initialize_openai
+        from utilities.embeddings import EmbeddingCache
+
+        logger.info(f"Embedding {len(missing)} prompts missing from the cached embeddings")
+        initialize_openai(OpenAIConfig())
+        embeddings.update(EmbeddingCache(embedding_model, cache_path=embedding_cache).get_embeddings(missing))
+    return np.vstack([np.asarray(embeddings[user_nl], dtype=np.float64) for user_nl in user_nls])
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Precomputes the neighbours of the prompts of an evaluation set")
+    parser.add_argument("bank", help="Path to the few shot or context bank pickle file")
+    parser.add_argument("eval_file", help="Path to the evaluation set, jsonl with nl_prompt or user_nl")
+    parser.add_argument("output_dir", help="Directory of the neighbour tables")
+    parser.add_argument("--k", type=int, default=20, help="Neighbours kept per prompt, the largest count served")
+    parser.add_argument("--cached-embeddings", help="Pickle file with the embeddings of the prompts")
+    parser.add_argument("--embedding-cache", help="Path to the SQLite cache of the embeddings computed here")
+    parser.add_argument("--environment-config", help="Path to the environment config, e.g. .ffmodel")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    if args.environment_config:
+        from ffmodel.core.environment_config import EnvironmentConfigs
+
+        EnvironmentConfigs.initialize(args.environment_config)
+
+    with open(args.bank, "rb") as f:
+        bank = pickle.load(f)
+    user_nls = _read_user_nls(args.eval_file)
+    query_embeddings = _embed_user_nls(
+        user_nls, bank["metadata"]["embedding_model"], args.cached_embeddings, args.embedding_cache
+    )
+
+    table = compute_neighbour_table(bank, user_nls, query_embeddings, args.k)
+    path = table.save(args.output_dir)
+    print(f"Neighbour table of {len(table)} prompts (k={table.k}) saved to {path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
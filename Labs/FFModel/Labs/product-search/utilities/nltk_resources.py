@@ -0,0 +1,41 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+import os
+from typing import List
+
+# Directory at the project root where NLTK data can be bundled with the solution, e.g. with:
+#   python -m nltk.downloader -d nltk_data punkt punkt_tab
+BUNDLED_NLTK_DATA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "nltk_data")
+
+# The punkt sentence tokenizer used by `nltk.word_tokenize`. NLTK >= 3.8.2 ships it as `punkt_tab`.
+PUNKT_RESOURCES = ["tokenizers/punkt_tab/english/", "tokenizers/punkt"]
+
+
+def ensure_nltk_resource(resource_names: List[str]) -> str:
+    """
+    Makes sure one of the given NLTK resources can be found locally, without any network access.
+
+    Besides NLTK's default locations and the `NLTK_DATA` environment variable, the `nltk_data`
+    directory at the project root is searched.
+    Returns the name of the resource that was found, or raises a LookupError explaining how to
+    provide the data ahead of time (e.g. when building the inference container).
+    """
+    import nltk
+
+    if os.path.isdir(BUNDLED_NLTK_DATA) and BUNDLED_NLTK_DATA not in nltk.data.path:
+        nltk.data.path.append(BUNDLED_NLTK_DATA)
+
+    for resource_name in resource_names:
+        try:
+            nltk.data.find(resource_name)
+            return resource_name
+        except LookupError:
+            continue
+
+    packages = " ".join(name.strip("/").split("/")[1] for name in resource_names)
+    raise LookupError(
+        f"NLTK resource not found, tried: {resource_names}. Resources are not downloaded at runtime, "
+        f"provide them ahead of time with `python -m nltk.downloader -d {BUNDLED_NLTK_DATA} {packages}` "
+        "or point the NLTK_DATA environment variable at an existing nltk_data directory."
+    )
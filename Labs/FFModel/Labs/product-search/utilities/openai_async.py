@@ -0,0 +1,29 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+"""
+Native async calls to the OpenAI completion endpoints, for the `execute_async` of the components.
+
+They are the async counterparts of `generate_completion` and `generate_chat_completion` in
+`ffmodel.utils.openai`, built on the `acreate` methods of the openai package, so many calls can be
+in flight on one event loop without a thread each. OpenAI needs to be initialized (see
+`ffmodel.utils.openai.initialize_openai`) before calling, the sync and async calls share its settings.
+"""
+
+from typing import Any, Dict, List
+
+from utilities.retry import async_retry_call
+
+
+async def generate_completion_async(prompt: str, retry_parameters: Any = None, **kwargs) -> Any:
+    import openai
+
+    return await async_retry_call(openai.Completion.acreate, retry_parameters, prompt=prompt, **kwargs)
+
+
+async def generate_chat_completion_async(
+    messages: List[Dict[str, str]], retry_parameters: Any = None, **kwargs
+) -> Any:
+    import openai
+
+    return await async_retry_call(openai.ChatCompletion.acreate, retry_parameters, messages=messages, **kwargs)
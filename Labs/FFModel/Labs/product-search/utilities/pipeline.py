@@ -0,0 +1,293 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+"""
+Stage-pipelined execution of experiment runs.
+
+With the records executor (`utilities/executor.py`) a record holds its worker for the whole chain,
+so the CPU-bound components (embedding top-k, stitching, rouge, bleu) and the network-bound ones
+(embeddings, completions, LLM judges) compete for the same workers. Here each component group of the
+solution config (pre_processors, stitchers, model_callers, post_processors, evaluators) runs as its
+own stage with its own workers, and the stages are connected by bounded queues. A stage that can not
+keep up fills its input queue, which blocks the stage feeding it: the records in flight stay bounded
+by the queue sizes instead of piling up in memory, and the throughput approaches the one of the
+slowest stage, which the stage report points out.
+
+Configured in the executor section of the experimentation config:
+
+    experimentation:
+      executor:
+        mode: pipeline
+        threads: 4             # default workers per stage
+        queue_size: 64         # capacity of the queue in front of each stage
+        stages:                # per stage overrides, by component group
+          model_callers:
+            workers: 32
+          evaluators:
+            workers: 2
+            batch_size: 16     # records per execute_batch call, defaults to 1
+
+The `processes` and `cpu_bound` configs work as with the records executor, a stage of CPU-bound
+components hands its records to the process pool.
+"""
+
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from ffmodel.data_models.base import ExperimentDataModel
+from utilities.executor import (
+    PipelineExecutor,
+    _OrderedOutput,
+    _run_process_batch,
+    _Segment,
+    _set_error,
+    run_chain,
+    run_chain_batch,
+)
+
+logger = logging.getLogger(__name__)
+
+STAGE_CONFIGS = ("workers", "batch_size")
+
+# Seconds between two logs of the stage statistics while the pipeline runs
+REPORT_INTERVAL = 60.0
+
+# Marks the end of the records in a queue, each worker of the stage reading it gets one
+_DONE = None
+
+
+@dataclass
+class StageStats:
+    name: str
+    workers: int
+    processed: int
+    utilization: float
+    mean_queue_depth: float
+    max_queue_depth: int
+    seconds_per_record: float
+    blocked_seconds: float
+
+    def __str__(self) -> str:
+        return (
+            f"{self.name:<24} workers={self.workers:<3} processed={self.processed:<7} "
+            f"utilization={self.utilization:6.1%} "
+            f"queue depth={self.mean_queue_depth:5.1f} (max {self.max_queue_depth}) "
+            f"{self.seconds_per_record * 1000:8.1f} ms/record blocked={self.blocked_seconds:.1f}s"
+        )
+
+
+class _Stage:
+    def __init__(self, index: int, segment: _Segment, workers: int, batch_size: int, queue_size: int):
+        self.index = index
+        self.segment = segment
+        self.workers = workers
+        self.batch_size = batch_size
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.next_queue: Optional[queue.Queue] = None
+        self.next_workers = 1
+
+        self.lock = threading.Lock()
+        self.active_workers = workers
+        self.processed = 0
+        self.busy_seconds = 0.0
+        self.blocked_seconds = 0.0
+        self.depth_total = 0
+        self.depth_samples = 0
+        self.depth_max = 0
+
+    def stats(self, elapsed: float) -> StageStats:
+        with self.lock:
+            return StageStats(
+                name=f"{self.segment.name} (processes)" if self.segment.cpu_bound else self.segment.name,
+                workers=self.workers,
+                processed=self.processed,
+                utilization=self.busy_seconds / (self.workers * elapsed) if elapsed else 0.0,
+                mean_queue_depth=self.depth_total / self.depth_samples if self.depth_samples else 0.0,
+                max_queue_depth=self.depth_max,
+                seconds_per_record=self.busy_seconds / self.processed if self.processed else 0.0,
+                blocked_seconds=self.blocked_seconds,
+            )
+
+
+class StagePipeline(PipelineExecutor):
+    """
+    Args:
+        - solution_config: The solution config, as loaded by `utilities.executor.load_solution_config`
+        - config: The executor config, defaults to the `executor` entry of the experimentation section
+    """
+
+    def __init__(self, solution_config: Dict[str, Any], config=None):
+        super().__init__(solution_config, config)
+
+        unknown = set(self.config.stages) - {segment.name for segment in self.segments}
+        if unknown:
+            raise ValueError(f"Unknown stages in the executor config: {', '.join(sorted(unknown))}")
+
+        self.stages: List[_Stage] = []
+        for index, segment in enumerate(self.segments):
+            stage_config = self.config.stages.get(segment.name, {})
+            unknown = set(stage_config) - set(STAGE_CONFIGS)
+            if unknown:
+                raise ValueError(f"Unknown configs for stage {segment.name}: {', '.join(sorted(unknown))}")
+            self.stages.append(
+                _Stage(
+                    index,
+                    segment,
+                    workers=stage_config.get("workers", self.config.threads),
+                    batch_size=stage_config.get("batch_size", 1),
+                    queue_size=self.config.queue_size,
+                )
+            )
+
+        self.output_queue = queue.Queue(maxsize=self.config.queue_size)
+        for stage, next_stage in zip(self.stages, self.stages[1:]):
+            stage.next_queue = next_stage.queue
+            stage.next_workers = next_stage.workers
+        if self.stages:
+            self.stages[-1].next_queue = self.output_queue
+
+    def _segment_name(self, component_config: Dict[str, Any]) -> str:
+        """Stages are named after the component group, e.g. `model_callers` for `components.model_callers.openai`"""
+        parts = component_config["name"].split(".")
+        return parts[-2] if len(parts) > 2 else component_config["name"]
+
+    def stage_stats(self) -> List[StageStats]:
+        elapsed = time.perf_counter() - self._start
+        return [stage.stats(elapsed) for stage in self.stages]
+
+    def run(self, data_models: Optional[List[ExperimentDataModel]] = None) -> List[ExperimentDataModel]:
+        """Runs the data models (read with the reader when not given) through the stages, returns them in order"""
+        if data_models is None:
+            data_models = self.read()
+
+        self._start = self._start_run(data_models)
+        output = _OrderedOutput(self.writers, len(data_models))
+
+        process_pool = self._start_process_pool()
+        threads = [threading.Thread(target=self._feed, args=(data_models,), daemon=True)]
+        for stage in self.stages:
+            threads.extend(
+                threading.Thread(target=self._stage_worker, args=(stage, process_pool), daemon=True)
+                for _ in range(stage.workers)
+            )
+        try:
+            for thread in threads:
+                thread.start()
+
+            last_report = time.perf_counter()
+            while True:
+                try:
+                    item = self.output_queue.get(timeout=REPORT_INTERVAL)
+                except queue.Empty:
+                    item = ()
+                if time.perf_counter() - last_report >= REPORT_INTERVAL:
+                    logger.info("Stages:\n" + "\n".join(str(stats) for stats in self.stage_stats()))
+                    last_report = time.perf_counter()
+                if item is _DONE:
+                    break
+                if item:
+                    self._collect(output, *item)
+
+            for thread in threads:
+                thread.join()
+        finally:
+            if process_pool is not None:
+                process_pool.shutdown()
+
+        self.report.stages = self.stage_stats()
+        self._finish(self._start)
+        return output.results
+
+    def _feed(self, data_models: List[ExperimentDataModel]):
+        first_queue = self.stages[0].queue if self.stages else self.output_queue
+        for index, data_model in enumerate(data_models):
+            # Blocks while the first stage is behind
+            first_queue.put((index, data_model, True))
+        for _ in range(self.stages[0].workers if self.stages else 1):
+            first_queue.put(_DONE)
+
+    def _stage_worker(self, stage: _Stage, process_pool: Optional[ProcessPoolExecutor]):
+        try:
+            done = False
+            while not done:
+                depth = stage.queue.qsize()
+                item = stage.queue.get()
+                if item is _DONE:
+                    break
+                items = [item]
+                while len(items) < stage.batch_size:
+                    try:
+                        item = stage.queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is _DONE:
+                        done = True
+                        break
+                    items.append(item)
+
+                start = time.perf_counter()
+                try:
+                    results = self._run_stage(stage, items, process_pool)
+                except Exception as e:
+                    # e.g. a broken process pool: the records of the batch fail, the stage goes on
+                    logger.error(f"Stage {stage.segment.name} failed for {len(items)} records: {e}")
+                    results = self._fail_items(stage, items, e)
+                busy = time.perf_counter() - start
+
+                start = time.perf_counter()
+                for result in results:
+                    stage.next_queue.put(result)
+                blocked = time.perf_counter() - start
+
+                with stage.lock:
+                    stage.processed += len(items)
+                    stage.busy_seconds += busy
+                    stage.blocked_seconds += blocked
+                    stage.depth_total += depth
+                    stage.depth_samples += 1
+                    stage.depth_max = max(stage.depth_max, depth)
+        finally:
+            # The next stage waits for the end marker of every worker, even one that died
+            with stage.lock:
+                stage.active_workers -= 1
+                last = stage.active_workers == 0
+            if last:
+                for _ in range(stage.next_workers):
+                    stage.next_queue.put(_DONE)
+
+    def _fail_items(
+        self, stage: _Stage, items: List[Tuple[int, Any, bool]], error: Exception
+    ) -> List[Tuple[int, Any, bool]]:
+        """Sets the error of the records of the batch still succeeding, the failed ones keep their error"""
+        results = []
+        for index, data_model, success in items:
+            if success:
+                _set_error(data_model, stage.segment.name, error)
+            results.append((index, data_model, False))
+        return results
+
+    def _run_stage(
+        self, stage: _Stage, items: List[Tuple[int, Any, bool]], process_pool: Optional[ProcessPoolExecutor]
+    ) -> List[Tuple[int, Any, bool]]:
+        # Records that failed in a previous stage go through untouched
+        pending = [position for position, (_, _, success) in enumerate(items) if success]
+        data_models = [items[position][1] for position in pending]
+        if not data_models:
+            return items
+
+        if stage.segment.cpu_bound:
+            outputs = process_pool.submit(_run_process_batch, stage.index, data_models).result()
+        elif stage.batch_size > 1:
+            outputs = run_chain_batch(stage.segment.components, data_models)
+        else:
+            outputs = [run_chain(stage.segment.components, data_model) for data_model in data_models]
+
+        results = list(items)
+        for position, (data_model, success) in zip(pending, outputs):
+            results[position] = (items[position][0], data_model, success)
+        return results
@@ -0,0 +1,298 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+"""
+Profiler hooks for the components of experiment runs.
+
+The instrumentation (see `utilities/instrumentation.py`) tells which component is slow, the
+profiler tells why. Configured in the experimentation section of the solution config, the executors
+wrap the `execute` and `execute_batch` of the selected components and profile them on a fraction of
+the records:
+
+    experimentation:
+      profiling:
+        profiler: cprofile     # or sampling
+        components:            # component modules to profile, every component when empty
+          - components.pre_processors.few_shot_embedding
+          - components.evaluators.rouge
+        sample_rate: 0.1       # fraction of the records profiled, defaults to 1
+        interval: 0.005        # seconds between two samples of the sampling profiler
+        output_dir: outputs/profiles   # defaults to a `profiles` directory next to the writer outputs
+
+The records are selected by a hash of their prompt, so a profiled record is profiled in every
+selected component and in every run. Two profilers:
+    - cprofile: deterministic profile of every function call, written as `<component id>.pstats`
+      (`python -m pstats`, snakeviz, gprof2dot or flameprof read it). Costs up to a few times the
+      run time of the profiled code, the selected components only.
+    - sampling: a background thread samples the stack of the threads running a profiled component
+      every `interval` seconds, written as `<component id>.folded`, one collapsed stack and its
+      sample count per line (flamegraph.pl and speedscope read it). Costs about the same for any code,
+      but the sampler needs the GIL: pure Python calls much shorter than the switch interval (5ms)
+      are under-sampled, profile those with cprofile.
+
+The components running in the process pool are profiled in each worker, the profiles are merged at
+the end of the run. The `execute_async` of the components is not profiled, the event loop interleaves
+the records. Profiling is off unless the section is present: nothing is wrapped and the components
+run unchanged.
+"""
+
+import contextvars
+import cProfile
+import functools
+import glob
+import io
+import logging
+import os
+import pstats
+import sys
+import threading
+import zlib
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field, fields
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+PROFILING_CONFIG_KEY = "profiling"
+PROFILERS = ("cprofile", "sampling")
+
+# Writer args holding the path of the experiment results
+_WRITER_OUTPUT_ARGS = ("output_path", "database_path")
+
+# Set while a profiled call is running, so nested calls (e.g. `execute_batch` looping over `execute`)
+# are not profiled twice
+_profiling = contextvars.ContextVar("_profiling", default=False)
+
+
+@dataclass
+class ProfilingConfig:
+    enabled: bool = True
+    profiler: str = "cprofile"
+    components: List[str] = field(default_factory=list)
+    sample_rate: float = 1.0
+    interval: float = 0.005
+    output_dir: Optional[str] = None
+    # Functions logged per component at the end of the run, by cumulative time
+    top: int = 15
+
+    @classmethod
+    def from_solution_config(cls, solution_config: Dict[str, Any]) -> Optional["ProfilingConfig"]:
+        """The profiling config of the experimentation section, None when profiling is off"""
+        experimentation = solution_config.get("experimentation") or {}
+        section = experimentation.get(PROFILING_CONFIG_KEY)
+        if section is None:
+            return None
+        unknown = set(section) - {config_field.name for config_field in fields(cls)}
+        if unknown:
+            raise ValueError(f"Unknown profiling configs: {', '.join(sorted(unknown))}")
+        config = cls(**section)
+        if not config.enabled:
+            return None
+        if config.profiler not in PROFILERS:
+            raise ValueError(f"Invalid profiler: {config.profiler}, must be one of {PROFILERS}")
+        if not 0 < config.sample_rate <= 1:
+            raise ValueError(f"sample_rate must be in (0, 1], got {config.sample_rate}")
+        if config.output_dir is None:
+            config.output_dir = default_output_dir(experimentation)
+        return config
+
+
+def default_output_dir(experimentation: Dict[str, Any]) -> str:
+    """A `profiles` directory next to the output of the first writer with an output path"""
+    writer_configs = experimentation.get("writers") or experimentation.get("writer") or []
+    for writer_config in writer_configs:
+        args = writer_config.get("args") or {}
+        for name in _WRITER_OUTPUT_ARGS:
+            if args.get(name):
+                return os.path.join(os.path.dirname(args[name]), "profiles")
+    return "profiles"
+
+
+def _sampled_call(function: Callable, data: Any) -> Any:
+    """Root frame of the stacks of the sampling profiler"""
+    return function(data)
+
+
+def _frame_label(frame: Any) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class _Sampler(threading.Thread):
+    """Samples the stacks of the threads running a profiled component"""
+
+    def __init__(self, interval: float):
+        super().__init__(name="profiling-sampler", daemon=True)
+        self.interval = interval
+        # Thread id -> id of the profiled component it runs
+        self.active: Dict[int, str] = {}
+        self.counts: Dict[str, Counter] = defaultdict(Counter)
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frames = sys._current_frames()
+            for thread_id, component_id in list(self.active.items()):
+                frame = frames.get(thread_id)
+                stack = []
+                while frame is not None and frame.f_code is not _sampled_call.__code__:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                if stack:
+                    self.counts[component_id][";".join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+class Profiler:
+    """
+    Profiles the selected components of a process, `flush` writes the profiles of the process.
+
+    Args:
+        - config: The profiling config, with its output directory
+    """
+
+    def __init__(self, config: ProfilingConfig):
+        self.config = config
+        # (component id, thread id) -> profile, a cProfile profile only profiles the thread enabling it
+        self._profiles: Dict[tuple, cProfile.Profile] = {}
+        self._lock = threading.Lock()
+        self._sampler: Optional[_Sampler] = None
+        self._warned = False
+
+    def wrap(self, component: Any) -> Any:
+        """Wraps the execute methods of the component when it is selected, returns the component"""
+        if self.config.components and type(component).__module__ not in self.config.components:
+            return component
+
+        component_id = component.get_id()
+        component.execute = self._profiled(component_id, component.execute, batch=False)
+        if hasattr(component, "execute_batch"):
+            component.execute_batch = self._profiled(component_id, component.execute_batch, batch=True)
+        return component
+
+    def _selected(self, data_model: Any) -> bool:
+        if self.config.sample_rate >= 1:
+            return True
+        user_nl = getattr(getattr(data_model, "request", None), "user_nl", None) or ""
+        return zlib.crc32(str(user_nl).encode("utf-8")) / 2**32 < self.config.sample_rate
+
+    def _profiled(self, component_id: str, function: Callable, batch: bool) -> Callable:
+        run = self._run_cprofile if self.config.profiler == "cprofile" else self._run_sampled
+
+        @functools.wraps(function)
+        def wrapper(data):
+            selected = any(self._selected(data_model) for data_model in data) if batch else self._selected(data)
+            if not selected or _profiling.get():
+                return function(data)
+            token = _profiling.set(True)
+            try:
+                return run(component_id, function, data)
+            finally:
+                _profiling.reset(token)
+
+        return wrapper
+
+    def _run_cprofile(self, component_id: str, function: Callable, data: Any) -> Any:
+        key = (component_id, threading.get_ident())
+        with self._lock:
+            profile = self._profiles.get(key)
+            if profile is None:
+                profile = self._profiles[key] = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError as e:
+            # Python 3.12+ allows a single active profiler per process
+            if not self._warned:
+                self._warned = True
+                logger.warning(f"Skipping the profiling of concurrent calls: {e}")
+            return function(data)
+        try:
+            return function(data)
+        finally:
+            profile.disable()
+
+    def _run_sampled(self, component_id: str, function: Callable, data: Any) -> Any:
+        with self._lock:
+            # Started on the first profiled call, and again after a flush
+            if self._sampler is None:
+                self._sampler = _Sampler(self.config.interval)
+                self._sampler.start()
+            sampler = self._sampler
+        thread_id = threading.get_ident()
+        sampler.active[thread_id] = component_id
+        try:
+            return _sampled_call(function, data)
+        finally:
+            del sampler.active[thread_id]
+
+    def flush(self) -> List[str]:
+        """Writes the profiles of the process as parts named after the process id, returns their paths"""
+        os.makedirs(self.config.output_dir, exist_ok=True)
+        paths = []
+        with self._lock:
+            profiles, self._profiles = self._profiles, {}
+        by_component: Dict[str, List[cProfile.Profile]] = defaultdict(list)
+        for (component_id, _), profile in profiles.items():
+            by_component[component_id].append(profile)
+        for component_id, component_profiles in by_component.items():
+            stats = None
+            for profile in component_profiles:
+                try:
+                    stats = pstats.Stats(profile) if stats is None else stats.add(profile)
+                except TypeError:
+                    # Enabled on a thread that never ran a profiled call
+                    continue
+            if stats is not None:
+                path = os.path.join(self.config.output_dir, f"{component_id}.{os.getpid()}.pstats")
+                stats.dump_stats(path)
+                paths.append(path)
+
+        with self._lock:
+            sampler, self._sampler = self._sampler, None
+        if sampler is not None:
+            sampler.stop()
+            for component_id, counts in sampler.counts.items():
+                path = os.path.join(self.config.output_dir, f"{component_id}.{os.getpid()}.folded")
+                with open(path, "w", encoding="utf-8") as f:
+                    f.writelines(f"{stack} {count}\n" for stack, count in counts.items())
+                paths.append(path)
+        return paths
+
+
+def merge_profiles(output_dir: str, top: int = 15) -> List[str]:
+    """
+    Merges the parts written by the processes into one `<component id>.pstats` or `.folded` file per
+    component, logs the top functions of each profile and returns the paths of the merged files.
+    """
+    parts: Dict[str, List[str]] = defaultdict(list)
+    for path in glob.glob(os.path.join(output_dir, "*.*.pstats")) + glob.glob(os.path.join(output_dir, "*.*.folded")):
+        base, extension = os.path.splitext(path)
+        component_id, pid = os.path.splitext(base)
+        if pid[1:].isdigit():
+            parts[f"{component_id}{extension}"].append(path)
+
+    merged = []
+    for path, part_paths in sorted(parts.items()):
+        if path.endswith(".pstats"):
+            stats = pstats.Stats(*part_paths)
+            stats.dump_stats(path)
+            summary = io.StringIO()
+            pstats.Stats(path, stream=summary).sort_stats("cumulative").print_stats(top)
+            logger.info(f"Profile of {os.path.basename(path)[:-len('.pstats')]}:\n{summary.getvalue()}")
+        else:
+            counts: Counter = Counter()
+            for part_path in part_paths:
+                with open(part_path, encoding="utf-8") as f:
+                    for line in f:
+                        stack, _, count = line.rstrip("\n").rpartition(" ")
+                        counts[stack] += int(count)
+            with open(path, "w", encoding="utf-8") as f:
+                f.writelines(f"{stack} {count}\n" for stack, count in counts.most_common())
+            logger.info(f"{sum(counts.values())} samples of {os.path.basename(path)[:-len('.folded')]}")
+        for part_path in part_paths:
+            os.remove(part_path)
+        merged.append(path)
+    return merged
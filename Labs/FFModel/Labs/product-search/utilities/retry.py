@@ -0,0 +1,56 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+import asyncio
+import logging
+import time
+from typing import Any, Callable
+
+logger = logging.getLogger(__name__)
+
+
+def _retry_settings(retry_parameters: Any):
+    """Reads the settings from an ffmodel `RetryParameters` instance, falling back to a single try"""
+    tries = getattr(retry_parameters, "tries", 1) or 1
+    delay = getattr(retry_parameters, "delay", 0) or 0
+    backoff = getattr(retry_parameters, "backoff", 1) or 1
+    max_delay = getattr(retry_parameters, "max_delay", None)
+    return tries, delay, backoff, max_delay
+
+
+def retry_call(function: Callable, retry_parameters: Any, *args, **kwargs) -> Any:
+    """
+    Calls `function` with the given arguments, retrying on exceptions following the
+    tries, delay, backoff and max_delay of the retry parameters.
+    The exception of the last attempt is raised.
+    """
+    tries, delay, backoff, max_delay = _retry_settings(retry_parameters)
+
+    for attempt in range(1, tries + 1):
+        try:
+            return function(*args, **kwargs)
+        except Exception as e:
+            if attempt == tries:
+                raise
+            logger.warning(f"Attempt {attempt} of {tries} failed with {e!r}, retrying in {delay} seconds")
+            time.sleep(delay)
+            delay = delay * backoff
+            if max_delay:
+                delay = min(delay, max_delay)
+
+
+async def async_retry_call(function: Callable, retry_parameters: Any, *args, **kwargs) -> Any:
+    """Awaits the coroutine function with the given arguments, retrying like `retry_call` without blocking the loop"""
+    tries, delay, backoff, max_delay = _retry_settings(retry_parameters)
+
+    for attempt in range(1, tries + 1):
+        try:
+            return await function(*args, **kwargs)
+        except Exception as e:
+            if attempt == tries:
+                raise
+            logger.warning(f"Attempt {attempt} of {tries} failed with {e!r}, retrying in {delay} seconds")
+            await asyncio.sleep(delay)
+            delay = delay * backoff
+            if max_delay:
+                delay = min(delay, max_delay)
@@ -0,0 +1,250 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+"""
+Pool of pre-forked, resource limited Python worker processes to execute generated code.
+
+Starting an interpreter per snippet costs more than running most snippets, so the workers are
+started once and reused: every snippet runs in fresh globals of a warm worker, with the modules
+already imported by previous snippets (or preloaded) available right away. A worker that exceeds
+the time limit or dies is killed and replaced, and workers are recycled after a number of tasks
+so state leaking through imported modules stays bounded.
+
+The resource limits guard the evaluation against runaway code (memory, file sizes, core dumps),
+they are not a security boundary: only run code you would run on the host.
+"""
+
+import atexit
+import contextlib
+import io
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+try:
+    import resource
+except ImportError:  # Not available on Windows, the workers run without resource limits
+    resource = None
+
+# Largest file a snippet can write, in bytes
+_MAX_FILE_SIZE = 16 * 1024 * 1024
+
+
+@dataclass
+class ExecutionResult:
+    syntax_valid: bool
+    success: bool
+    wall_time: float
+    error: Optional[str] = None
+    timed_out: bool = False
+
+
+def _apply_limits(memory_limit_mb: Optional[int]):
+    if resource is None:
+        return
+    if memory_limit_mb:
+        limit = memory_limit_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    resource.setrlimit(resource.RLIMIT_FSIZE, (_MAX_FILE_SIZE, _MAX_FILE_SIZE))
+    resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+
+
+def _worker_main(connection, memory_limit_mb: Optional[int], preload_modules: Sequence[str]):
+    """Worker loop: receives (setup, code) pairs and sends back (success, error, wall time)"""
+    for module in preload_modules:
+        with contextlib.suppress(Exception):
+            __import__(module)
+    _apply_limits(memory_limit_mb)
+
+    devnull = open(os.devnull, "w")
+    while True:
+        try:
+            task = connection.recv()
+        except EOFError:
+            return
+        if task is None:
+            return
+
+        setup, code = task
+        namespace = {"__name__": "__main__", "__builtins__": __builtins__}
+        error = None
+        start = time.perf_counter()
+        try:
+            with contextlib.redirect_stdout(devnull), contextlib.redirect_stderr(io.StringIO()):
+                if setup:
+                    exec(compile(setup, "<setup>", "exec"), namespace)
+                exec(compile(code, "<completion>", "exec"), namespace)
+        # SystemExit and KeyboardInterrupt raised by the snippet count as failures as well
+        except BaseException as e:
+            error = f"{type(e).__name__}: {e}"
+        wall_time = time.perf_counter() - start
+
+        try:
+            connection.send((error is None, error, wall_time))
+        except Exception:
+            return
+
+
+class _Worker:
+    def __init__(self, context, memory_limit_mb: Optional[int], preload_modules: Sequence[str]):
+        self.connection, child_connection = context.Pipe()
+        self.process = context.Process(
+            target=_worker_main, args=(child_connection, memory_limit_mb, tuple(preload_modules)), daemon=True
+        )
+        self.process.start()
+        child_connection.close()
+        self.tasks = 0
+
+    def stop(self):
+        with contextlib.suppress(Exception):
+            self.connection.send(None)
+        self.process.join(timeout=1)
+        self.kill()
+
+    def kill(self):
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join()
+        self.connection.close()
+
+
+class SandboxPool:
+    """
+    Args:
+        - size: Number of worker processes
+        - timeout: Wall time limit per snippet in seconds, the worker is killed and replaced when exceeded
+        - memory_limit_mb: Address space limit of each worker in MB, None disables it
+        - max_tasks_per_worker: Snippets a worker runs before it is replaced, None to never recycle
+        - preload_modules: Modules imported by the workers before they run any snippet
+
+    Use `get_pool` to share the pools of a process between component instances.
+    """
+
+    def __init__(
+        self,
+        size: int = 4,
+        timeout: float = 5.0,
+        memory_limit_mb: Optional[int] = 2048,
+        max_tasks_per_worker: Optional[int] = 100,
+        preload_modules: Sequence[str] = (),
+    ):
+        if size < 1:
+            raise ValueError(f"size must be at least 1, got {size}")
+
+        self.size = size
+        self.timeout = timeout
+        self.memory_limit_mb = memory_limit_mb
+        self.max_tasks_per_worker = max_tasks_per_worker
+        self.preload_modules = list(preload_modules)
+
+        # Workers are replaced from the threads running the snippets, and forking a process with threads can
+        # deadlock the child on a lock held by another thread. They are forked from a fork server instead, a
+        # single threaded process with the preloaded modules already imported, or spawned where there is none
+        if "forkserver" in multiprocessing.get_all_start_methods():
+            self._context = multiprocessing.get_context("forkserver")
+            self._context.set_forkserver_preload(self.preload_modules)
+        else:
+            self._context = multiprocessing.get_context("spawn")
+        self._idle = queue.Queue()
+        self._workers: List[_Worker] = []
+        self._lock = threading.Lock()
+        self._closed = False
+        for _ in range(size):
+            self._idle.put(self._start_worker())
+
+    def _start_worker(self) -> _Worker:
+        worker = _Worker(self._context, self.memory_limit_mb, self.preload_modules)
+        with self._lock:
+            self._workers.append(worker)
+        return worker
+
+    def _replace_worker(self, worker: _Worker, kill: bool) -> _Worker:
+        worker.kill() if kill else worker.stop()
+        with self._lock:
+            self._workers.remove(worker)
+        return self._start_worker()
+
+    def run(self, code: str, setup: str = "") -> ExecutionResult:
+        """Runs the snippet after the setup code (e.g. import statements) in a warm worker"""
+        try:
+            compile(code, "<completion>", "exec")
+        except (SyntaxError, ValueError) as e:
+            return ExecutionResult(syntax_valid=False, success=False, wall_time=0.0, error=f"{type(e).__name__}: {e}")
+
+        if self._closed:
+            raise RuntimeError("The sandbox pool is closed")
+
+        worker = self._idle.get()
+        try:
+            worker.connection.send((setup, code))
+            if not worker.connection.poll(self.timeout):
+                worker = self._replace_worker(worker, kill=True)
+                return ExecutionResult(
+                    syntax_valid=True,
+                    success=False,
+                    wall_time=self.timeout,
+                    error=f"Timeout: exceeded the {self.timeout}s time limit",
+                    timed_out=True,
+                )
+            success, error, wall_time = worker.connection.recv()
+            # Counted before the worker is back in the idle queue, where the next snippet may take it right away
+            worker.tasks += 1
+        except (EOFError, OSError, BrokenPipeError):
+            # The snippet took the worker down (e.g. os._exit or running out of memory)
+            worker = self._replace_worker(worker, kill=True)
+            return ExecutionResult(syntax_valid=True, success=False, wall_time=0.0, error="The worker process died")
+        finally:
+            self._idle.put(worker)
+
+        if self.max_tasks_per_worker and worker.tasks >= self.max_tasks_per_worker:
+            self._recycle(worker)
+
+        return ExecutionResult(syntax_valid=True, success=success, wall_time=wall_time, error=error)
+
+    def _recycle(self, worker: _Worker):
+        # The worker is back in the idle queue, only replace it if it is still there
+        with self._idle.mutex:
+            if worker not in self._idle.queue:
+                return
+            self._idle.queue.remove(worker)
+        self._idle.put(self._replace_worker(worker, kill=False))
+
+    def map(self, tasks: Sequence[Tuple[str, str]]) -> List[ExecutionResult]:
+        """Runs (code, setup) tasks on all the workers at once, returns the results in order"""
+        if len(tasks) <= 1 or self.size == 1:
+            return [self.run(code, setup) for code, setup in tasks]
+        with ThreadPoolExecutor(max_workers=self.size) as executor:
+            return list(executor.map(lambda task: self.run(*task), tasks))
+
+    def close(self):
+        self._closed = True
+        with self._lock:
+            workers, self._workers = self._workers, []
+        for worker in workers:
+            worker.stop()
+
+
+_pools: Dict[tuple, SandboxPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(**kwargs) -> SandboxPool:
+    """Returns the pool of this process with the given `SandboxPool` arguments, starting it on first use"""
+    key = tuple(sorted((name, tuple(value) if isinstance(value, list) else value) for name, value in kwargs.items()))
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = SandboxPool(**kwargs)
+        return _pools[key]
+
+
+@atexit.register
+def _close_pools():
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
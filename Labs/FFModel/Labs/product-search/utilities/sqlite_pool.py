@@ -0,0 +1,96 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+import contextlib
+import hashlib
+import queue
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Tuple
+
+# Number of SQLite virtual machine instructions between two checks of the statement deadline
+_PROGRESS_INTERVAL = 1000
+
+
+class StatementTimeout(Exception):
+    """Raised when a statement runs longer than the pool's time limit"""
+
+
+class SqlitePool:
+    """
+    Pool of in-memory SQLite connections preloaded from a schema/seed script.
+
+    The script is executed once into a template database, every pooled connection is a copy of
+    it made with the SQLite backup API, so preloading costs are paid once per process.
+    Connections are read-only (`PRAGMA query_only`) so evaluated statements can not modify the
+    fixture, and statements are interrupted after `timeout` seconds.
+
+    Use `get_pool` to share the pools of a process between component instances.
+    """
+
+    def __init__(self, script: str, timeout: float = 1.0):
+        self.timeout = timeout
+        self._template = sqlite3.connect(":memory:", check_same_thread=False)
+        self._template.executescript(script)
+        self._template.commit()
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(":memory:", check_same_thread=False)
+        with self._lock:
+            self._template.backup(connection)
+        connection.execute("PRAGMA query_only = ON")
+        return connection
+
+    @contextlib.contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """Checks a connection out of the pool, opening a new one when all are in use"""
+        try:
+            connection = self._idle.get_nowait()
+        except queue.Empty:
+            connection = self._connect()
+
+        try:
+            yield connection
+        finally:
+            self._idle.put(connection)
+
+    def execute(self, sql: str) -> Tuple[List[str], List[Tuple[Any, ...]]]:
+        """
+        Runs a single statement and returns the column names and rows of its result.
+
+        Raises `StatementTimeout` when the statement runs longer than the time limit, and
+        `sqlite3.Error` for any other failure.
+        """
+        with self.connection() as connection:
+            deadline = time.monotonic() + self.timeout
+            connection.set_progress_handler(lambda: time.monotonic() > deadline, _PROGRESS_INTERVAL)
+            try:
+                cursor = connection.execute(sql)
+                rows = cursor.fetchall()
+                columns = [column[0] for column in cursor.description or []]
+            except sqlite3.OperationalError as e:
+                if str(e) == "interrupted":
+                    raise StatementTimeout(f"Statement exceeded the {self.timeout}s time limit") from e
+                raise
+            finally:
+                connection.set_progress_handler(None, 0)
+                if connection.in_transaction:
+                    connection.rollback()
+
+        return columns, rows
+
+
+_pools: Dict[Tuple[str, float], SqlitePool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(script: str, timeout: float = 1.0) -> SqlitePool:
+    """Returns the pool of this process for the given script and time limit, creating it on first use"""
+    key = (hashlib.sha256(script.encode("utf-8")).hexdigest(), timeout)
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = SqlitePool(script, timeout)
+        return _pools[key]
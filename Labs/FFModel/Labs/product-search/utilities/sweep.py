@@ -0,0 +1,334 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+"""
+Shared-prefix execution of hyperparameter sweeps.
+
+A sweep template (see `docs/guides/solution_config_template.md`) generates one solution config per
+combination of the swept options, and running them independently repeats the components they have
+in common: a 3x4 temperature/top_p sweep runs the same static context, few shot retrieval and
+session selection twelve times for each record.
+
+The sweep runner merges the generated configs into a tree. Each node is a component, keyed by the
+hash of its name, args and supporting data config, and the configs sharing the same leading
+components share the path to the node where they diverge. Each record runs every node once: the
+shared prefix is paid once per record and the data model is copied at the branching points, so the
+few shot retrieval of the sweep above runs once instead of twelve times.
+
+Every config keeps its own writers and gets the same outputs as when run on its own. The metrics of
+the shared components are keyed with the id of each config, as if the config ran them itself.
+
+The configs of a sweep must read the same data with the same reader. The records run on a thread
+pool sized by the `threads` of the executor config of the first config, see `utilities/executor.py`.
+
+Usage, from the project root:
+    python -m utilities.sweep path/to/generated/configs/ --threads 16 --base-dir examples/nl2python
+"""
+
+import argparse
+import copy
+import glob
+import logging
+import os
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from ffmodel.core.solution_config import DataConfig
+from ffmodel.data_models.base import ExperimentDataModel
+from utilities.cache import make_key
+from utilities.executor import (
+    ExecutionReport,
+    ExecutorConfig,
+    _OrderedOutput,
+    create_component,
+    load_solution_config,
+    run_chain,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def component_key(component_config: Dict[str, Any]) -> str:
+    """Key of a component in the sweep tree, components with the same key behave the same"""
+    return make_key(
+        component_config["name"], component_config.get("args") or {}, component_config.get("supporting_data") or {}
+    )
+
+
+def list_solution_configs(paths: List[str]) -> List[str]:
+    """Expands the directories in the paths to the yaml files they hold, in name order"""
+    config_paths = []
+    for path in paths:
+        if os.path.isdir(path):
+            config_paths.extend(
+                sorted(glob.glob(os.path.join(path, "*.yaml")) + glob.glob(os.path.join(path, "*.yml")))
+            )
+        else:
+            config_paths.append(path)
+    return config_paths
+
+
+@dataclass
+class _SweepConfig:
+    """A solution config of the sweep, the configs ending at a node of the tree"""
+
+    path: str
+    solution_id: str
+    writers: List[Any]
+    # Ids of the shared components on the path of the config that were created for another config
+    foreign_ids: List[str] = field(default_factory=list)
+    output: Optional[_OrderedOutput] = None
+    report: ExecutionReport = field(default_factory=ExecutionReport)
+    # Configs left out of an `execute` call, e.g. eliminated by `utilities/halving.py`, are not run
+    active: bool = True
+
+
+@dataclass
+class _SweepNode:
+    component_config: Optional[Dict[str, Any]]
+    # The component is created once, with the id of the first config reaching the node
+    solution_id: str
+    component: Any = None
+    children: Dict[str, "_SweepNode"] = field(default_factory=dict)
+    configs: List[_SweepConfig] = field(default_factory=list)
+    # Number of running configs with this node on their path, the executions each record saves is this minus one
+    active_configs: int = 0
+
+
+@dataclass
+class SweepReport:
+    configs: int = 0
+    records: int = 0
+    wall_time: float = 0.0
+    # Component executions per component module, run by the sweep and by the configs run independently
+    executions: Counter = field(default_factory=Counter)
+    independent_executions: Counter = field(default_factory=Counter)
+
+    def __str__(self) -> str:
+        executed = sum(self.executions.values())
+        independent = sum(self.independent_executions.values())
+        saved = 1 - executed / independent if independent else 0.0
+        lines = [
+            f"{self.configs} configs over {self.records} records in {self.wall_time:.1f}s, "
+            f"{executed} component executions instead of {independent} ({saved:.0%} saved)"
+        ]
+        for name, count in self.executions.items():
+            lines.append(f"  {name:<56} {count:>8} instead of {self.independent_executions[name]}")
+        return "\n".join(lines)
+
+
+class SweepRunner:
+    """
+    Args:
+        - solution_configs: The generated solution configs, as loaded by `load_solution_config`
+        - paths: The paths of the configs, to name them in the logs
+        - config: The executor config, defaults to the `executor` entry of the first config
+    """
+
+    def __init__(
+        self,
+        solution_configs: List[Dict[str, Any]],
+        paths: Optional[List[str]] = None,
+        config: Optional[ExecutorConfig] = None,
+    ):
+        if not solution_configs:
+            raise ValueError("The sweep has no solution configs")
+        paths = paths or [str(index) for index in range(len(solution_configs))]
+        self.solution_configs = solution_configs
+        self.config = config or ExecutorConfig.from_solution_config(solution_configs[0])
+        if self.config.threads < 1:
+            raise ValueError(f"threads must be at least 1, got {self.config.threads}")
+
+        experimentation = solution_configs[0].get("experimentation") or {}
+        self.reader_config = experimentation.get("reader")
+        self.data_config = experimentation.get("data")
+        for path, solution_config in zip(paths, solution_configs):
+            experimentation = solution_config.get("experimentation") or {}
+            if (experimentation.get("reader"), experimentation.get("data")) != (self.reader_config, self.data_config):
+                raise ValueError(f"The configs of a sweep must read the same data, {path} reads other data")
+
+        self.root = _SweepNode(None, "")
+        self.configs: List[_SweepConfig] = []
+        for path, solution_config in zip(paths, solution_configs):
+            self._add_config(path, solution_config)
+        self.report = SweepReport(configs=len(self.configs))
+
+    def _add_config(self, path: str, solution_config: Dict[str, Any]):
+        solution_id = solution_config.get("id", "")
+        experimentation = solution_config.get("experimentation") or {}
+        # The solution config template names the writers `writer`, the examples `writers`
+        writer_configs = experimentation.get("writers") or experimentation.get("writer") or []
+        sweep_config = _SweepConfig(
+            path, solution_id, [create_component(config, "Writer", solution_id) for config in writer_configs]
+        )
+
+        node = self.root
+        for component_config in solution_config.get("components") or []:
+            key = component_key(component_config)
+            if key not in node.children:
+                node.children[key] = _SweepNode(
+                    component_config,
+                    solution_id,
+                    component=create_component(component_config, "Component", solution_id),
+                )
+            node = node.children[key]
+            if node.solution_id != solution_id and node.solution_id not in sweep_config.foreign_ids:
+                sweep_config.foreign_ids.append(node.solution_id)
+        node.configs.append(sweep_config)
+        self.configs.append(sweep_config)
+
+    def read(self) -> List[ExperimentDataModel]:
+        """Loads the data models with the reader the configs share"""
+        if self.reader_config is None or self.data_config is None:
+            raise ValueError("The experimentation section needs a reader and a data config")
+        reader = create_component(
+            self.reader_config,
+            "Reader",
+            self.configs[0].solution_id,
+            data_config=DataConfig(**self.data_config),
+            data_model_type=ExperimentDataModel,
+        )
+        return reader.execute_batch()
+
+    def run(self, data_models: Optional[List[ExperimentDataModel]] = None) -> SweepReport:
+        """Runs the data models (read with the reader when not given) through the sweep tree"""
+        if data_models is None:
+            data_models = self.read()
+        self.report = SweepReport(configs=len(self.configs))
+        self.execute(data_models)
+        self.register_experiment_results()
+        logger.info(f"Sweep executed: {self.report}")
+        return self.report
+
+    def execute(self, data_models: List[ExperimentDataModel], configs: Optional[List[_SweepConfig]] = None):
+        """
+        Runs the data models through the configs (all of them when not given), the outputs of each config
+        are in its `output.results`. Can be called again with more records, the writers append to the same
+        outputs until `register_experiment_results`.
+        """
+        start = time.perf_counter()
+        active = self.configs if configs is None else configs
+        for sweep_config in self.configs:
+            sweep_config.active = any(sweep_config is config for config in active)
+            sweep_config.output = _OrderedOutput(sweep_config.writers if sweep_config.active else [], len(data_models))
+            sweep_config.report = ExecutionReport(records=len(data_models))
+        self._count_active(self.root)
+
+        with ThreadPoolExecutor(max_workers=self.config.threads) as thread_pool:
+            futures = {
+                thread_pool.submit(self._run_record, data_model): index for index, data_model in enumerate(data_models)
+            }
+            for future in as_completed(futures):
+                index = futures[future]
+                results, executed = future.result()
+                for node in executed:
+                    name = node.component_config["name"]
+                    self.report.executions[name] += 1
+                    self.report.independent_executions[name] += node.active_configs
+                for sweep_config, data_model, success in results:
+                    if not success:
+                        sweep_config.report.failures.append((index, data_model.error))
+                    sweep_config.output.add(index, data_model)
+
+        for sweep_config in active:
+            sweep_config.report.failures.sort(key=lambda failure: failure[0])
+            sweep_config.report.wall_time = time.perf_counter() - start
+            logger.info(f"{sweep_config.path}: {sweep_config.report}")
+        self.report.records += len(data_models)
+        self.report.wall_time += time.perf_counter() - start
+
+    def register_experiment_results(self):
+        for sweep_config in self.configs:
+            for writer in sweep_config.writers:
+                writer.register_experiment_results()
+
+    def _count_active(self, node: _SweepNode) -> int:
+        node.active_configs = sum(sweep_config.active for sweep_config in node.configs)
+        node.active_configs += sum(self._count_active(child) for child in node.children.values())
+        return node.active_configs
+
+    def _run_record(self, data_model: Any) -> Tuple[List[Tuple[_SweepConfig, Any, bool]], List[_SweepNode]]:
+        results: List[Tuple[_SweepConfig, Any, bool]] = []
+        executed: List[_SweepNode] = []
+        self._run_node(self.root, data_model, True, results, executed)
+        return results, executed
+
+    def _run_node(
+        self,
+        node: _SweepNode,
+        data_model: Any,
+        success: bool,
+        results: List[Tuple[_SweepConfig, Any, bool]],
+        executed: List[_SweepNode],
+    ):
+        if node.component is not None and success:
+            data_model, success = run_chain([node.component], data_model)
+            executed.append(node)
+
+        # Every branch but the last gets its own copy, the components modify the data model in place
+        branches = [(sweep_config, None) for sweep_config in node.configs if sweep_config.active]
+        branches += [(None, child) for child in node.children.values() if child.active_configs]
+        for position, (sweep_config, child) in enumerate(branches):
+            branch_data_model = data_model if position == len(branches) - 1 else copy.deepcopy(data_model)
+            if child is not None:
+                self._run_node(child, branch_data_model, success, results, executed)
+            else:
+                self._rename_ids(sweep_config, branch_data_model)
+                results.append((sweep_config, branch_data_model, success))
+
+    @staticmethod
+    def _rename_ids(sweep_config: _SweepConfig, data_model: Any):
+        """Keys the metrics and error of the shared components with the id of the config"""
+        if not sweep_config.foreign_ids:
+            return
+
+        def rename(component_id: str) -> str:
+            for foreign_id in sweep_config.foreign_ids:
+                if component_id.startswith(f"{foreign_id}."):
+                    return f"{sweep_config.solution_id}{component_id[len(foreign_id):]}"
+            return component_id
+
+        # Rebuilt in place to keep the order of the metrics
+        metrics = [(rename(key), value) for key, value in data_model.experiment_metrics.items()]
+        data_model.experiment_metrics.clear()
+        data_model.experiment_metrics.update(metrics)
+        if data_model.error and "component" in data_model.error:
+            data_model.error["component"] = rename(data_model.error["component"])
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Runs the solution configs of a sweep, sharing the components they have in common"
+    )
+    parser.add_argument("paths", nargs="+", help="Paths to the generated solution configs, or their directories")
+    parser.add_argument("--environment-config", help="Path to the environment config, e.g. .ffmodel")
+    parser.add_argument(
+        "--base-dir", help="Directory the relative paths of the configs are relative to, defaults to their directory"
+    )
+    parser.add_argument("--threads", type=int, help="Overrides the number of records in flight")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    if args.environment_config:
+        from ffmodel.core.environment_config import EnvironmentConfigs
+
+        EnvironmentConfigs.initialize(args.environment_config)
+
+    paths = list_solution_configs(args.paths)
+    solution_configs = [load_solution_config(path, args.base_dir) for path in paths]
+    config = ExecutorConfig.from_solution_config(solution_configs[0]) if solution_configs else None
+    if config is not None and args.threads is not None:
+        config.threads = args.threads
+
+    runner = SweepRunner(solution_configs, paths, config)
+    report = runner.run()
+    print(report)
+    return 1 if any(sweep_config.report.failures for sweep_config in runner.configs) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,101 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+import weakref
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Optional, Tuple
+
+
+class TextCache:
+    """
+    Per data model cache of tokenized and normalized strings.
+
+    Evaluators look up derived forms of the expected outputs and completions here,
+    so each distinct string is only processed once per record per kind of processing
+    (e.g. "nltk.word_tokenize", "rouge.tokenize", "fuzz.full_process"), no matter how
+    many evaluators or (expected, completion) pairs use it.
+    """
+
+    def __init__(self):
+        self._entries: Dict[Tuple[str, str], Any] = {}
+
+    def get(self, kind: str, text: str, process: Callable[[str], Any]) -> Any:
+        """Returns the processed form of `text`, calling `process` only on a cache miss"""
+        key = (kind, text)
+        try:
+            return self._entries[key]
+        except KeyError:
+            value = process(text)
+            self._entries[key] = value
+            return value
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+# Caches are keyed by the id of the data model and dropped once the data model is garbage collected
+_caches: Dict[int, Tuple[weakref.ref, TextCache]] = {}
+
+# The cache for the record currently being evaluated, used by the tokenizer adapters below
+_active_cache: ContextVar[Optional[TextCache]] = ContextVar("active_text_cache", default=None)
+
+
+def _evict(key: int, ref: weakref.ref):
+    entry = _caches.get(key)
+    if entry is not None and entry[0] is ref:
+        del _caches[key]
+
+
+def get_text_cache(data_model: Any) -> TextCache:
+    """
+    Returns the text cache shared by all evaluators for the given data model.
+
+    If the data model can not be weakly referenced, a fresh (unshared) cache is returned.
+    """
+    key = id(data_model)
+    entry = _caches.get(key)
+    if entry is not None and entry[0]() is data_model:
+        return entry[1]
+
+    cache = TextCache()
+    try:
+        ref = weakref.ref(data_model, lambda r, key=key: _evict(key, r))
+    except TypeError:
+        return cache
+
+    _caches[key] = (ref, cache)
+    return cache
+
+
+@contextmanager
+def active_text_cache(data_model: Any):
+    """Makes the data model's text cache visible to `CachedTokenizer` instances while in the context"""
+    cache = get_text_cache(data_model)
+    token = _active_cache.set(cache)
+    try:
+        yield cache
+    finally:
+        _active_cache.reset(token)
+
+
+class CachedTokenizer:
+    """
+    Adapter for tokenizer objects (anything with a `tokenize(text)` method) that serves tokens
+    from the active record's text cache.
+
+    This allows scorer objects that take a tokenizer, such as the `RougeScorer`, to be built
+    once and still share tokens with the other evaluators of the record.
+    Outside of an `active_text_cache` context it simply delegates to the wrapped tokenizer.
+    """
+
+    def __init__(self, tokenizer: Any, kind: str):
+        self.tokenizer = tokenizer
+        self.kind = kind
+
+    def tokenize(self, text: str):
+        cache = _active_cache.get()
+        if cache is None:
+            return self.tokenizer.tokenize(text)
+
+        return cache.get(self.kind, text, self.tokenizer.tokenize)
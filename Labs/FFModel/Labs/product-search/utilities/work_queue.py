@@ -0,0 +1,525 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+"""
+Distributed execution of sweeps with a SQLite work queue.
+
+The solution configs of a sweep are split in work items, one per (config, shard of the records),
+stored in a SQLite queue on a filesystem shared by the machines. Any number of worker processes, on
+any number of machines, claim the items one at a time and run them with the executor of the config
+(see `utilities/executor.py`), so the sweep time scales with the number of workers.
+
+A claimed item is leased to its worker for `lease` seconds, and the worker renews the lease while it
+runs the item. The item of a worker that dies is claimed again by another worker when its lease
+expires, and an item that raises is retried, up to `max_attempts` attempts. Each attempt writes
+through the writers of the config into its own directory next to the queue, and only the attempt
+holding the lease can complete the item, so a worker that lost its lease can not mix its outputs
+with the ones of the attempt that replaced it.
+
+Once every shard of a config is done, `merge` concatenates the outputs of its shards in the order of
+the records into the outputs of the config: the JSONL and Parquet files, and the rows of the SQLite
+results database.
+
+The queue uses SQLite locking, the shared filesystem must support POSIX locks (e.g. NFSv4, Azure
+Files with NFS). Run every command from the project root, with the same relative paths on every node.
+The relative paths of the configs are resolved against their directory, or against the `--base-dir`
+given to `enqueue`, which is stored with the items (see `load_solution_config` in `utilities/executor.py`).
+
+Usage:
+    python -m utilities.work_queue enqueue outputs/sweep-queue.db path/to/generated/configs/ --shards 8 \\
+        --base-dir examples/nl2python
+    python -m utilities.work_queue work outputs/sweep-queue.db --processes 4    # on every node
+    python -m utilities.work_queue status outputs/sweep-queue.db
+    python -m utilities.work_queue merge outputs/sweep-queue.db
+"""
+
+import argparse
+import copy
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import socket
+import sqlite3
+import sys
+import threading
+import time
+import traceback
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+from utilities.executor import create_executor, load_solution_config
+from utilities.sweep import list_solution_configs
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    item_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    config_path TEXT NOT NULL,
+    base_dir TEXT,
+    shard INTEGER NOT NULL,
+    shards INTEGER NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    worker TEXT,
+    lease_expires REAL,
+    output_dir TEXT,
+    records INTEGER,
+    error TEXT,
+    updated_at REAL,
+    UNIQUE (config_path, shard)
+);
+
+CREATE TABLE IF NOT EXISTS merges (
+    config_path TEXT PRIMARY KEY,
+    merged_at REAL NOT NULL,
+    outputs TEXT
+);
+"""
+
+STATUSES = ("pending", "running", "done", "failed")
+
+# Seconds between two claims of a worker waiting for the items leased by other workers
+POLL_INTERVAL = 10.0
+
+# Extensions of the outputs of the JSONL writer, concatenated as bytes (gzip members and zstd frames concatenate)
+_JSONL_EXTENSIONS = (".jsonl", ".jsonl.gz", ".jsonl.zst")
+
+
+def connect(queue_path: str, timeout: float = 60.0, check_same_thread: bool = True) -> sqlite3.Connection:
+    """
+    Opens the queue. The rollback journal is kept (no WAL, which needs memory shared by the processes
+    of a single machine), and the claims run in `BEGIN IMMEDIATE` transactions.
+    """
+    if os.path.dirname(queue_path):
+        os.makedirs(os.path.dirname(queue_path), exist_ok=True)
+    connection = sqlite3.connect(queue_path, timeout=timeout, isolation_level=None, check_same_thread=check_same_thread)
+    connection.execute("PRAGMA journal_mode=DELETE")
+    connection.executescript(SCHEMA)
+    # Queues created before the base directory was stored with the items
+    if "base_dir" not in [row[1] for row in connection.execute("PRAGMA table_info(items)")]:
+        connection.execute("ALTER TABLE items ADD COLUMN base_dir TEXT")
+    return connection
+
+
+def results_dir(queue_path: str) -> str:
+    return f"{os.path.splitext(queue_path)[0]}.results"
+
+
+def shard_bounds(count: int, shard: int, shards: int) -> Tuple[int, int]:
+    """The records [start, end) of a shard, contiguous so the merged outputs keep the dataset order"""
+    return count * shard // shards, count * (shard + 1) // shards
+
+
+def enqueue(
+    queue_path: str, config_paths: List[str], shards: int = 1, max_attempts: int = 3, base_dir: Optional[str] = None
+) -> int:
+    """
+    Adds the shards of the configs to the queue, the items already in the queue are kept. Returns the items added.
+    The relative paths of the configs are resolved against `base_dir`, the directory of each config by default.
+    """
+    if shards < 1:
+        raise ValueError(f"shards must be at least 1, got {shards}")
+    connection = connect(queue_path)
+    try:
+        connection.execute("BEGIN IMMEDIATE")
+        added = 0
+        for config_path in config_paths:
+            for shard in range(shards):
+                cursor = connection.execute(
+                    "INSERT OR IGNORE INTO items (config_path, base_dir, shard, shards, max_attempts, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (config_path, base_dir, shard, shards, max_attempts, time.time()),
+                )
+                added += cursor.rowcount
+        connection.execute("COMMIT")
+        return added
+    finally:
+        connection.close()
+
+
+def status(queue_path: str) -> Dict[str, int]:
+    connection = connect(queue_path)
+    try:
+        counts = dict(connection.execute("SELECT status, COUNT(*) FROM items GROUP BY status").fetchall())
+        return {state: counts.get(state, 0) for state in STATUSES}
+    finally:
+        connection.close()
+
+
+class _Item:
+    def __init__(
+        self, item_id: int, config_path: str, base_dir: Optional[str], shard: int, shards: int, attempts: int
+    ):
+        self.item_id = item_id
+        self.config_path = config_path
+        self.base_dir = base_dir
+        self.shard = shard
+        self.shards = shards
+        self.attempts = attempts
+
+    def __str__(self) -> str:
+        return f"{self.config_path} shard {self.shard + 1}/{self.shards} (attempt {self.attempts})"
+
+
+class Worker:
+    """
+    Claims and runs the items of the queue until none is left.
+
+    Args:
+        - queue_path: The path to the queue database
+        - lease: Seconds an item stays leased to the worker without renewal
+        - worker_id: Name of the worker in the queue, defaults to the host name, process id and a random suffix
+    """
+
+    def __init__(self, queue_path: str, lease: float = 600.0, worker_id: Optional[str] = None):
+        self.queue_path = queue_path
+        self.lease = lease
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        # Shared with the lease renewal thread, every use holds the lock
+        self.connection = connect(queue_path, check_same_thread=False)
+        self.lock = threading.Lock()
+
+    def run(self) -> int:
+        """Runs items until the queue has none pending or leased, returns the number of items completed"""
+        completed = 0
+        while True:
+            item = self.claim()
+            if item is not None:
+                completed += self._run_item(item)
+                continue
+            counts = status(self.queue_path)
+            if not counts["pending"] and not counts["running"]:
+                logger.info(f"Worker {self.worker_id}: queue drained, {completed} items completed")
+                return completed
+            # Items leased by other workers, claimed again if their worker dies
+            time.sleep(min(POLL_INTERVAL, self.lease / 2))
+
+    def claim(self) -> Optional[_Item]:
+        now = time.time()
+        with self.lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                # Items whose last lease expired without attempts left failed with their worker
+                self.connection.execute(
+                    "UPDATE items SET status = 'failed', error = COALESCE(error, 'lease expired'), updated_at = ? "
+                    "WHERE status = 'running' AND lease_expires < ? AND attempts >= max_attempts",
+                    (now, now),
+                )
+                row = self.connection.execute(
+                    "SELECT item_id, config_path, base_dir, shard, shards, attempts FROM items "
+                    "WHERE (status = 'pending' OR (status = 'running' AND lease_expires < ?)) "
+                    "AND attempts < max_attempts ORDER BY item_id LIMIT 1",
+                    (now,),
+                ).fetchone()
+                if row is None:
+                    self.connection.execute("COMMIT")
+                    return None
+                self.connection.execute(
+                    "UPDATE items SET status = 'running', attempts = attempts + 1, worker = ?, lease_expires = ?, "
+                    "updated_at = ? WHERE item_id = ?",
+                    (self.worker_id, now + self.lease, now, row[0]),
+                )
+                self.connection.execute("COMMIT")
+            except BaseException:
+                self.connection.execute("ROLLBACK")
+                raise
+        item_id, config_path, base_dir, shard, shards, attempts = row
+        return _Item(item_id, config_path, base_dir, shard, shards, attempts + 1)
+
+    def _owned_update(self, item: _Item, sql: str, parameters: Tuple) -> bool:
+        """Runs the update of the item when the worker still holds its lease"""
+        with self.lock:
+            cursor = self.connection.execute(
+                f"{sql} WHERE item_id = ? AND worker = ? AND attempts = ? AND status = 'running'",
+                (*parameters, item.item_id, self.worker_id, item.attempts),
+            )
+            return cursor.rowcount == 1
+
+    def _renew(self, item: _Item, stop: threading.Event):
+        while not stop.wait(self.lease / 3):
+            if not self._owned_update(item, "UPDATE items SET lease_expires = ?", (time.time() + self.lease,)):
+                logger.warning(f"Worker {self.worker_id} lost the lease of {item}, its outputs will be discarded")
+                return
+
+    def _run_item(self, item: _Item) -> int:
+        output_dir = os.path.join(results_dir(self.queue_path), str(item.item_id), f"attempt-{item.attempts}")
+        logger.info(f"Worker {self.worker_id}: running {item}")
+        stop = threading.Event()
+        renewal = threading.Thread(target=self._renew, args=(item, stop), daemon=True)
+        renewal.start()
+        try:
+            records = run_item(item.config_path, item.shard, item.shards, output_dir, item.base_dir)
+        except Exception as e:
+            error = "".join(traceback.format_exception(type(e), e, e.__traceback__))
+            logger.error(f"Worker {self.worker_id}: {item} failed: {e}")
+            self._owned_update(
+                item,
+                "UPDATE items SET status = CASE WHEN attempts < max_attempts THEN 'pending' ELSE 'failed' END, "
+                "error = ?, updated_at = ?",
+                (error, time.time()),
+            )
+            return 0
+        finally:
+            stop.set()
+            renewal.join()
+
+        if not self._owned_update(
+            item,
+            "UPDATE items SET status = 'done', output_dir = ?, records = ?, error = NULL, updated_at = ?",
+            (output_dir, records, time.time()),
+        ):
+            logger.warning(f"Worker {self.worker_id}: {item} was leased to another worker, outputs discarded")
+            shutil.rmtree(output_dir, ignore_errors=True)
+            return 0
+        return 1
+
+    def close(self):
+        self.connection.close()
+
+
+def _shard_solution_config(solution_config: Dict[str, Any], output_dir: str) -> Dict[str, Any]:
+    """The config with the writers writing in the directory of the attempt, one sub directory per writer"""
+    solution_config = copy.deepcopy(solution_config)
+    experimentation = solution_config.setdefault("experimentation", {})
+    # Leases and retries replace the checkpoints, a shard is run again from its start
+    for config in [experimentation.get("reader") or {}]:
+        (config.get("args") or {}).pop("checkpoint_path", None)
+    for index, config in enumerate(experimentation.get("writers") or experimentation.get("writer") or []):
+        args = config.setdefault("args", {})
+        args.pop("checkpoint_path", None)
+        for path_arg in ("output_path", "database_path"):
+            if args.get(path_arg):
+                args[path_arg] = os.path.join(output_dir, f"writer-{index}", os.path.basename(args[path_arg]))
+    return solution_config
+
+
+def run_item(config_path: str, shard: int, shards: int, output_dir: str, base_dir: Optional[str] = None) -> int:
+    """Runs the records of the shard through the config, writing in the output directory. Returns the records run"""
+    shutil.rmtree(output_dir, ignore_errors=True)
+    solution_config = load_solution_config(config_path, base_dir)
+    executor = create_executor(_shard_solution_config(solution_config, output_dir))
+    data_models = executor.read()
+    start, end = shard_bounds(len(data_models), shard, shards)
+    executor.run(data_models[start:end])
+    logger.info(f"{config_path} shard {shard + 1}/{shards}: {executor.report}")
+    return end - start
+
+
+def _merge_files(paths: List[str], output_path: str):
+    if output_path.endswith(".parquet"):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        # The metric columns of the shards may differ, missing ones are filled with nulls
+        tables = [pq.read_table(path) for path in paths]
+        try:
+            table = pa.concat_tables(tables, promote_options="default")
+        except TypeError:
+            # pyarrow < 14 names the option `promote`
+            table = pa.concat_tables(tables, promote=True)
+        pq.write_table(table, output_path, compression="zstd")
+        return
+    if not output_path.endswith(_JSONL_EXTENSIONS) or ".strings." in output_path:
+        raise ValueError(f"Can not merge {output_path}, only JSONL (without intern_strings) and Parquet outputs merge")
+    with open(output_path, "wb") as output:
+        for path in paths:
+            with open(path, "rb") as f:
+                shutil.copyfileobj(f, output)
+
+
+def _merge_sqlite(paths: List[str], database_path: str):
+    """
+    Copies the rows of the shard databases to the results database, as one run with contiguous record indices.
+    The run is named after the run of the first shard, the rows it already has in the results database are replaced.
+    """
+    from components.writers.sqlite import connect as connect_results
+
+    target = connect_results(database_path)
+    try:
+        with target:
+            run_id = None
+            for path in paths:
+                shard = sqlite3.connect(path)
+                try:
+                    runs = shard.execute("SELECT run_id, solution_id, created_at, config FROM runs").fetchall()
+                    if run_id is None:
+                        run_id = runs[0][0]
+                        # Merging again (forced, or after a crash) replaces the rows of the previous merge
+                        target.execute("DELETE FROM metrics WHERE run_id = ?", (run_id,))
+                        target.execute("DELETE FROM records WHERE run_id = ?", (run_id,))
+                        target.execute(
+                            "INSERT OR REPLACE INTO runs (run_id, solution_id, created_at, config) VALUES (?, ?, ?, ?)",
+                            runs[0],
+                        )
+                    offset = target.execute(
+                        "SELECT COALESCE(MAX(record_index) + 1, 0) FROM records WHERE run_id = ?", (run_id,)
+                    ).fetchone()[0]
+                    record_ids = {}
+                    for record_id, record_index, *values in shard.execute(
+                        "SELECT record_id, record_index, session_id, user_nl, expected_output, completions, error, "
+                        "data_model FROM records ORDER BY record_index"
+                    ):
+                        cursor = target.execute(
+                            "INSERT INTO records (run_id, record_index, session_id, user_nl, expected_output, "
+                            "completions, error, data_model) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                            (run_id, offset + record_index, *values),
+                        )
+                        record_ids[record_id] = cursor.lastrowid
+                    target.executemany(
+                        'INSERT INTO metrics (record_id, run_id, session_id, metric, value, "values") '
+                        "VALUES (?, ?, ?, ?, ?, ?)",
+                        (
+                            (record_ids[record_id], run_id, *values)
+                            for record_id, *values in shard.execute(
+                                'SELECT record_id, session_id, metric, value, "values" FROM metrics'
+                            )
+                        ),
+                    )
+                finally:
+                    shard.close()
+    finally:
+        target.close()
+
+
+def merge(queue_path: str, force: bool = False) -> Dict[str, List[str]]:
+    """
+    Merges the outputs of the configs with every shard done, into the outputs of their writers.
+    Returns the merged outputs per config. The configs already merged are skipped unless `force`.
+    """
+    connection = connect(queue_path)
+    try:
+        rows = connection.execute(
+            "SELECT config_path, base_dir, status, output_dir FROM items ORDER BY config_path, shard"
+        ).fetchall()
+        merged_configs = {row[0] for row in connection.execute("SELECT config_path FROM merges")}
+
+        shards: Dict[str, List[Tuple[str, Optional[str]]]] = {}
+        base_dirs: Dict[str, Optional[str]] = {}
+        for config_path, base_dir, item_status, output_dir in rows:
+            shards.setdefault(config_path, []).append((item_status, output_dir))
+            base_dirs[config_path] = base_dir
+
+        merged = {}
+        for config_path, items in shards.items():
+            if config_path in merged_configs and not force:
+                continue
+            if any(item_status != "done" for item_status, _ in items):
+                logger.info(f"{config_path}: not every shard is done, not merged")
+                continue
+            merged[config_path] = _merge_config(
+                config_path, [output_dir for _, output_dir in items], base_dirs[config_path]
+            )
+            connection.execute(
+                "INSERT OR REPLACE INTO merges (config_path, merged_at, outputs) VALUES (?, ?, ?)",
+                (config_path, time.time(), json.dumps(merged[config_path])),
+            )
+            logger.info(f"{config_path}: merged {len(items)} shards into {', '.join(merged[config_path])}")
+        return merged
+    finally:
+        connection.close()
+
+
+def _merge_config(config_path: str, output_dirs: List[str], base_dir: Optional[str] = None) -> List[str]:
+    experimentation = load_solution_config(config_path, base_dir).get("experimentation") or {}
+    outputs = []
+    for index, config in enumerate(experimentation.get("writers") or experimentation.get("writer") or []):
+        args = config.get("args") or {}
+        if config["name"].endswith("writers.sqlite"):
+            name = os.path.basename(args["database_path"])
+            paths = [os.path.join(output_dir, f"writer-{index}", name) for output_dir in output_dirs]
+            _merge_sqlite(paths, args["database_path"])
+            outputs.append(args["database_path"])
+            continue
+        if not args.get("output_path"):
+            logger.warning(f"{config_path}: writer {config['name']} has no output_path, not merged")
+            continue
+
+        # The writers name their outputs <output_path base>-<timestamp><extension>, kept from the first shard
+        shard_files = [sorted(os.listdir(os.path.join(output_dir, f"writer-{index}"))) for output_dir in output_dirs]
+        output_directory = os.path.dirname(args["output_path"])
+        if output_directory:
+            os.makedirs(output_directory, exist_ok=True)
+        for position, name in enumerate(shard_files[0]):
+            paths = [
+                os.path.join(output_dir, f"writer-{index}", files[position])
+                for output_dir, files in zip(output_dirs, shard_files)
+            ]
+            output_path = os.path.join(output_directory, name)
+            _merge_files(paths, output_path)
+            outputs.append(output_path)
+    return outputs
+
+
+def _work(queue_path: str, lease: float, environment_config: Optional[str]) -> int:
+    logging.basicConfig(level=logging.INFO)
+    if environment_config:
+        from ffmodel.core.environment_config import EnvironmentConfigs
+
+        EnvironmentConfigs.initialize(environment_config)
+    worker = Worker(queue_path, lease)
+    try:
+        return worker.run()
+    finally:
+        worker.close()
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Runs the configs of a sweep with workers sharing a SQLite queue")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    enqueue_parser = commands.add_parser("enqueue", help="Adds the shards of the configs to the queue")
+    enqueue_parser.add_argument("queue", help="Path to the queue database, on the shared filesystem")
+    enqueue_parser.add_argument("paths", nargs="+", help="Paths to the solution configs, or their directories")
+    enqueue_parser.add_argument("--shards", type=int, default=1, help="Number of shards of the records per config")
+    enqueue_parser.add_argument("--max-attempts", type=int, default=3, help="Attempts of an item before it fails")
+    enqueue_parser.add_argument(
+        "--base-dir", help="Directory the relative paths of the configs are relative to, defaults to their directory"
+    )
+
+    work_parser = commands.add_parser("work", help="Runs items until the queue is drained")
+    work_parser.add_argument("queue", help="Path to the queue database")
+    work_parser.add_argument("--processes", type=int, default=1, help="Number of worker processes on this machine")
+    work_parser.add_argument(
+        "--lease", type=float, default=600.0, help="Seconds before the item of a dead worker is claimed again"
+    )
+    work_parser.add_argument("--environment-config", help="Path to the environment config, e.g. .ffmodel")
+
+    status_parser = commands.add_parser("status", help="Prints the number of items per status")
+    status_parser.add_argument("queue", help="Path to the queue database")
+
+    merge_parser = commands.add_parser("merge", help="Merges the shard outputs of the completed configs")
+    merge_parser.add_argument("queue", help="Path to the queue database")
+    merge_parser.add_argument("--force", action="store_true", help="Merges the configs already merged again")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    if args.command == "enqueue":
+        added = enqueue(args.queue, list_solution_configs(args.paths), args.shards, args.max_attempts, args.base_dir)
+        print(f"{added} items added to {args.queue}")
+    elif args.command == "work":
+        if args.processes == 1:
+            _work(args.queue, args.lease, args.environment_config)
+        else:
+            context = multiprocessing.get_context("spawn")
+            processes = [
+                context.Process(target=_work, args=(args.queue, args.lease, args.environment_config))
+                for _ in range(args.processes)
+            ]
+            for process in processes:
+                process.start()
+            for process in processes:
+                process.join()
+    elif args.command == "merge":
+        merge(args.queue, args.force)
+
+    counts = status(args.queue)
+    print(", ".join(f"{count} {state}" for state, count in counts.items()))
+    return 1 if counts["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())